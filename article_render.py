@@ -0,0 +1,162 @@
+# article_render.py - Print Merck topics from their __NEXT_DATA__ article JSON
+#
+#   python article_render.py https://www.merckvetmanual.com/... out.pdf
+#   python full.py --template            # use it for every page, live printing as fallback
+#
+# A Merck topic page ships its article in the __NEXT_DATA__ payload, which
+# the site's JavaScript turns into the page. Here the payload is fetched with
+# a plain HTTP request, the article markup is put into a local template with
+# a print stylesheet, and the result is printed from a local file: no site
+# JavaScript, ads or consent banners run, and the PDF holds only the article.
+# When a page has no article payload the caller prints the live page.
+
+import argparse
+import os
+import re
+import tempfile
+import time
+from html import escape
+from pathlib import Path
+
+import requests
+
+from browser import USER_AGENT, chrome_options
+from extractors import extract_next_data_article
+from render_service import get_renderer
+
+# Markup the template never runs or embeds: elements up to their own closing
+# tag (or self-closed), and <embed>, which has no closing tag
+UNSAFE_TAG_PATTERN = re.compile(
+    r"<(script|iframe|noscript|object)\b[^>]*?(/>|>.*?</\1\s*>)", re.IGNORECASE | re.DOTALL
+)
+UNSAFE_VOID_TAG_PATTERN = re.compile(r"<embed\b[^>]*>", re.IGNORECASE)
+EVENT_ATTRIBUTE_PATTERN = re.compile(
+    r"\s+on\w+\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s>]+)", re.IGNORECASE
+)
+
+PRINT_STYLESHEET = """
+@page { size: Letter; margin: 0.6in 0.6in 0.7in; }
+body { font: 10.5pt/1.45 Georgia, "Times New Roman", serif; color: #111; margin: 0; }
+header { border-bottom: 1px solid #999; margin-bottom: 1em; padding-bottom: 0.4em; }
+header h1 { font: bold 18pt/1.2 Helvetica, Arial, sans-serif; margin: 0 0 0.2em; }
+header .source { font: 8pt Helvetica, Arial, sans-serif; color: #555; }
+h2, h3, h4 { font-family: Helvetica, Arial, sans-serif; break-after: avoid; }
+h2 { font-size: 13pt; margin: 1.2em 0 0.4em; }
+h3 { font-size: 11.5pt; margin: 1em 0 0.3em; }
+p, li { orphans: 3; widows: 3; }
+img { max-width: 100%; height: auto; }
+figure, table { break-inside: avoid; }
+table { border-collapse: collapse; width: 100%; font-size: 9pt; margin: 0.6em 0; }
+th, td { border: 1px solid #bbb; padding: 3px 5px; vertical-align: top; }
+a { color: inherit; text-decoration: none; }
+button, form, [role="button"] { display: none; }
+"""
+
+# Page.printToPDF parameters for template pages; margins come from @page
+TEMPLATE_PRINT_OPTIONS = {
+    "printBackground": False,
+    "preferCSSPageSize": True,
+}
+
+
+def clean_fragment(fragment):
+    """Article markup without scripts, frames or event handlers"""
+    fragment = UNSAFE_VOID_TAG_PATTERN.sub("", UNSAFE_TAG_PATTERN.sub("", fragment))
+    return EVENT_ATTRIBUTE_PATTERN.sub("", fragment)
+
+
+def build_article_html(article, url):
+    """A standalone HTML document for an article; relative links resolve against url"""
+    body = "\n".join(clean_fragment(fragment) for fragment in article["fragments"])
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<base href="{escape(url)}">
+<title>{escape(article["title"])}</title>
+<style>{PRINT_STYLESHEET}</style>
+</head>
+<body>
+<header><h1>{escape(article["title"])}</h1><div class="source">{escape(url)}</div></header>
+<article>
+{body}
+</article>
+</body>
+</html>
+"""
+
+
+def fetch_article(url, throttle=None, timeout=30):
+    """The article in a page's __NEXT_DATA__ payload, or None"""
+    if throttle:
+        throttle.wait()
+    started = time.monotonic()
+    try:
+        response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+    except requests.RequestException as e:
+        if throttle:
+            throttle.record(0.0, error=True)
+        print(f"Could not fetch {url}: {e}")
+        return None
+    if throttle:
+        throttle.record(time.monotonic() - started, status=response.status_code)
+    if response.status_code != 200:
+        return None
+    return extract_next_data_article(response.text)
+
+
+def render_article_pdf(renderer, url, pdf_path, throttle=None, print_options=None, profile=None):
+    """
+    Print a page from its article payload with the local template. Returns
+    the render result (with "backend": "template" and the "article"), or
+    None when the page has no article payload and must be printed live. A
+    PrintProfile's printToPDF options apply over the template's, and
+    print_options over both; its element removals and stylesheet are for
+    live pages and would strip the template's own header.
+    """
+    article = fetch_article(url, throttle)
+    if not article:
+        return None
+
+    fd, html_path = tempfile.mkstemp(suffix=".html", prefix="article_")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(build_article_html(article, url))
+        options = dict(TEMPLATE_PRINT_OPTIONS)
+        if profile:
+            options = profile.render_options(options)["print_options"]
+        result = renderer.render(
+            Path(html_path).as_uri(),
+            pdf_path=pdf_path,
+            print_options={**options, **(print_options or {})},
+            wait_timeout=5,
+        )
+    finally:
+        os.remove(html_path)
+    result["backend"] = "template"
+    result["article"] = article
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a Merck topic from its article JSON")
+    parser.add_argument("url")
+    parser.add_argument("pdf_path")
+    args = parser.parse_args()
+
+    renderer = get_renderer(chrome_options())
+    try:
+        result = render_article_pdf(renderer, args.url, args.pdf_path)
+    finally:
+        renderer.close()
+    if result is None:
+        print("No article payload on this page; print it live instead")
+        return
+    print(
+        f"Saved {args.pdf_path} ({result['pdf_bytes']} bytes) "
+        f"in {result['timings']['total']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+import requests
+
+from extractors import (
+    available_backends,
+    extract_canine_categories,
+    extract_feline_categories,
+    extract_in_depth_links,
+    extract_sections,
+    extract_subsections,
+)
+
+FIXTURES_DIR = "html_fixtures"
+
+EXTRACTOR_KINDS = ["sections", "subsections", "in_depth", "canine", "feline"]
+
+
+def run_extractor(kind, html, fixture, backend):
+    """Run the extractor for a fixture kind with the given parser backend"""
+    if kind == "sections":
+        return extract_sections(html, backend)
+    if kind == "subsections":
+        return extract_subsections(html, fixture["url"], backend)
+    if kind == "in_depth":
+        return extract_in_depth_links(html, fixture["section_url"], fixture["url"], backend)
+    if kind == "canine":
+        return extract_canine_categories(html, fixture["url"], backend)
+    if kind == "feline":
+        return extract_feline_categories(html, fixture["url"], backend)
+    raise ValueError(f"Unknown fixture kind: {kind}")
+
+
+def load_manifest(fixtures_dir):
+    manifest_path = os.path.join(fixtures_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_fixture(fixtures_dir, kind, url, section_url=None):
+    """Fetch a page and store it as a fixture for the benchmark"""
+    Path(fixtures_dir).mkdir(exist_ok=True)
+    response = requests.get(url)
+    response.raise_for_status()
+
+    slug = re.sub(r"[^\w-]+", "_", url.split("://", 1)[-1]).strip("_")[:120]
+    filename = f"{kind}-{slug}.html"
+    with open(os.path.join(fixtures_dir, filename), "w", encoding="utf-8") as f:
+        f.write(response.text)
+
+    manifest = [entry for entry in load_manifest(fixtures_dir) if entry["file"] != filename]
+    entry = {"file": filename, "kind": kind, "url": url}
+    if section_url:
+        entry["section_url"] = section_url
+    manifest.append(entry)
+    with open(os.path.join(fixtures_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    print(f"Saved {kind} fixture {filename} ({len(response.text)} bytes)")
+
+
+def benchmark(fixtures_dir, backends, repeat):
+    """Time each backend on every fixture and check that their outputs agree"""
+    fixtures = load_manifest(fixtures_dir)
+    if not fixtures:
+        print(f"No fixtures in {fixtures_dir}; record some with the 'record' command")
+        return
+
+    pages = []
+    for fixture in fixtures:
+        with open(os.path.join(fixtures_dir, fixture["file"]), "r", encoding="utf-8") as f:
+            pages.append((fixture, f.read()))
+
+    # timings[kind][backend] = list of per-page seconds
+    timings = {}
+    mismatches = 0
+    for fixture, html in pages:
+        kind = fixture["kind"]
+        reference = None
+        for backend in backends:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                result = run_extractor(kind, html, fixture, backend)
+            elapsed = (time.perf_counter() - started) / repeat
+            timings.setdefault(kind, {}).setdefault(backend, []).append(elapsed)
+
+            if reference is None:
+                reference = result
+            elif result != reference:
+                mismatches += 1
+                print(f"Output mismatch: {backend} vs {backends[0]} on {fixture['file']}")
+
+    print(f"\n=== Parse cost per page ({repeat} runs each) ===")
+    print(f"{'kind':<12} {'pages':>5}  " + "  ".join(f"{b:>12}" for b in backends))
+    for kind in EXTRACTOR_KINDS:
+        if kind not in timings:
+            continue
+        per_backend = timings[kind]
+        page_count = len(next(iter(per_backend.values())))
+        means = [
+            f"{1000 * sum(per_backend[b]) / len(per_backend[b]):>10.2f}ms" for b in backends
+        ]
+        print(f"{kind:<12} {page_count:>5}  " + "  ".join(means))
+
+    if mismatches:
+        print(f"\n{mismatches} fixture(s) gave different output across backends")
+    else:
+        print("\nAll backends produced identical output")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the HTML parser backends of extractors.py on stored pages"
+    )
+    parser.add_argument("--fixtures-dir", default=FIXTURES_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="Fetch a page and store it as a fixture")
+    record.add_argument("kind", choices=EXTRACTOR_KINDS)
+    record.add_argument("url")
+    record.add_argument(
+        "--section-url", help="Parent section URL, needed for in_depth fixtures"
+    )
+
+    run = commands.add_parser("run", help="Time every backend on the stored fixtures")
+    run.add_argument(
+        "--backends",
+        nargs="+",
+        default=None,
+        help="Backends to compare (default: all installed)",
+    )
+    run.add_argument("--repeat", type=int, default=5)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        if args.kind == "in_depth" and not args.section_url:
+            parser.error("in_depth fixtures need --section-url")
+        record_fixture(args.fixtures_dir, args.kind, args.url, args.section_url)
+    else:
+        backends = args.backends or list(available_backends())
+        print(f"Backends: {', '.join(backends)}")
+        benchmark(args.fixtures_dir, backends, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# browser.py - Chrome setup, cookie consent handling and PDF printing shared by
+# the Selenium scripts and the render service
+
+import base64
+import time
+
+from selenium import webdriver
+from selenium.common.exceptions import SessionNotCreatedException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+import driver_cache
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Page.printToPDF parameters used for Merck pages
+DEFAULT_PRINT_OPTIONS = {
+    "printBackground": True,
+    "preferCSSPageSize": True,
+    "marginTop": 0.4,
+    "marginBottom": 0.4,
+    "marginLeft": 0.4,
+    "marginRight": 0.4,
+    "scale": 0.9,
+}
+
+
+def chrome_options(window_size="1920,1080", user_agent=USER_AGENT, headless="--headless=new"):
+    """Headless Chrome options used by all scripts"""
+    options = Options()
+    options.add_argument(headless)
+    options.add_argument("--disable-gpu")
+    options.add_argument(f"--window-size={window_size}")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    if user_agent:
+        options.add_argument(f"user-agent={user_agent}")
+    return options
+
+
+def create_driver(options=None):
+    """
+    Start a Chrome WebDriver with the pinned chromedriver (see driver_cache.py)
+    and report how long resolving the driver and launching Chrome took.
+    """
+    options = options or chrome_options()
+    driver_path, browser_path, source, resolve_seconds = driver_cache.timed_resolve()
+    if browser_path and not options.binary_location:
+        options.binary_location = browser_path
+
+    started = time.monotonic()
+    try:
+        driver = webdriver.Chrome(service=Service(driver_path), options=options)
+    except SessionNotCreatedException:
+        # Usually Chrome updated past the pinned driver; re-pin once if we may
+        if source != "cache" or driver_cache.is_offline():
+            raise
+        print("Pinned chromedriver does not match Chrome, refreshing the pin...")
+        driver_path = driver_cache.refresh()["driver_path"]
+        driver = webdriver.Chrome(service=Service(driver_path), options=options)
+    launch_seconds = time.monotonic() - started
+
+    print(
+        f"Chrome started in {resolve_seconds + launch_seconds:.2f}s "
+        f"(driver from {source} in {resolve_seconds * 1000:.0f}ms, "
+        f"launch {launch_seconds:.2f}s)"
+    )
+    return driver
+
+
+def print_to_pdf(driver, pdf_path, print_options=None):
+    """Print the current page to pdf_path and return the PDF size in bytes"""
+    result = driver.execute_cdp_cmd(
+        "Page.printToPDF", print_options or DEFAULT_PRINT_OPTIONS
+    )
+    pdf_data = base64.b64decode(result["data"])
+    with open(pdf_path, "wb") as f:
+        f.write(pdf_data)
+    return len(pdf_data)
+
+
+# Removes the elements matching any selector and appends a stylesheet;
+# returns the number of elements removed
+PRINT_PROFILE_SCRIPT = """
+const [selectors, css] = arguments;
+let removed = 0;
+for (const selector of selectors) {
+    try {
+        for (const element of document.querySelectorAll(selector)) {
+            element.remove();
+            removed++;
+        }
+    } catch (e) {}
+}
+if (css) {
+    const style = document.createElement('style');
+    style.textContent = css;
+    document.head.appendChild(style);
+}
+return removed;
+"""
+
+
+def apply_print_profile(driver, remove_selectors=(), print_css=None):
+    """Strip page furniture and add print CSS before printing (see print_profiles.py)"""
+    return driver.execute_script(PRINT_PROFILE_SCRIPT, list(remove_selectors or ()), print_css)
+
+
+def capture_snapshot(driver, snapshot_path):
+    """
+    Save the current page as a self-contained MHTML snapshot (page, styles,
+    images and fonts in one file) and return its size in bytes
+    """
+    result = driver.execute_cdp_cmd("Page.captureSnapshot", {"format": "mhtml"})
+    data = result["data"].encode("utf-8")
+    with open(snapshot_path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def handle_cookie_consent(driver):
+    """Handle cookie consent modals if they appear"""
+    try:
+        selectors = [
+            "button.Accept.All.Cookies",
+            ".Accept.All.Cookies",
+            "button[aria-label*='Accept All Cookies']",
+            "button:contains('Accept All')",
+            "#onetrust-accept-btn-handler",
+            ".accept-all-cookies",
+            ".accept-cookies-button",
+            "button.accept-cookies",
+        ]
+
+        for selector in selectors:
+            try:
+                cookie_button = WebDriverWait(driver, 2).until(
+                    EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
+                )
+                print(f"Found cookie button with selector: {selector}")
+                cookie_button.click()
+                time.sleep(1)
+                return True
+            except:
+                continue
+
+        # Try looking for buttons with text
+        cookie_button_texts = [
+            "Accept All Cookies",
+            "Accept All",
+            "Accept",
+            "I Agree",
+            "OK",
+            "Got it",
+        ]
+
+        try:
+            buttons = driver.find_elements(By.TAG_NAME, "button")
+            for button in buttons:
+                button_text = button.text.strip()
+                if button_text and any(
+                    accept_text.lower() in button_text.lower()
+                    for accept_text in cookie_button_texts
+                ):
+                    print(f"Found cookie button with text: {button_text}")
+                    button.click()
+                    time.sleep(1)
+                    return True
+        except:
+            pass
+
+        # JavaScript approach
+        try:
+            # Remove consent dialogs
+            for consent_id in [
+                "#cookie-consent",
+                "#cookie-banner",
+                ".cookie-banner",
+                "#cookie-notice",
+            ]:
+                driver.execute_script(
+                    f"var element = document.querySelector('{consent_id}'); if(element) element.remove();"
+                )
+
+            # Click accept button
+            driver.execute_script(
+                """
+                var buttons = document.querySelectorAll('button');
+                for(var i=0; i<buttons.length; i++) {
+                    if(buttons[i].textContent.indexOf('Accept') !== -1 || 
+                       buttons[i].textContent.indexOf('accept') !== -1 ||
+                       buttons[i].textContent.indexOf('Allow') !== -1) {
+                        buttons[i].click();
+                        return;
+                    }
+                }
+            """
+            )
+
+            # Set cookies directly
+            driver.execute_script(
+                """
+                document.cookie = "cookieConsent=true; path=/;";
+                document.cookie = "cookies_accepted=true; path=/;";
+            """
+            )
+
+            return True
+        except:
+            print("JavaScript attempts to handle cookie consent failed")
+            return False
+
+    except Exception as e:
+        print(f"Error handling cookie consent: {e}")
+        return False
@@ -0,0 +1,173 @@
+# browser_watchdog.py - Memory and hang watchdog for the Chrome browsers
+#
+# Chrome grows across thousands of pages and now and then hangs inside a
+# WebDriver command, which blocks a script for good. The watchdog measures
+# the resident memory of a browser's whole process tree (chromedriver, Chrome
+# and its renderers) and the latency of a trivial command before each page,
+# and asks for the browser to be replaced when either is over its limit.
+# While a page renders, a timer kills the browser's processes once the page
+# passes its deadline; the blocked WebDriver call then fails and the renderer
+# retries the page on a fresh browser.
+#
+# Memory is read with psutil when it is installed, otherwise from /proc.
+
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Replace a browser whose process tree uses more than this
+DEFAULT_MAX_RSS_MB = int(os.environ.get("BROWSER_MAX_RSS_MB", 2048))
+# Seconds a trivial command may take before the browser counts as sluggish
+DEFAULT_MAX_COMMAND_SECONDS = 5.0
+# Seconds a page may take before its browser is killed as hung
+DEFAULT_PAGE_DEADLINE = float(os.environ.get("BROWSER_PAGE_DEADLINE", 180))
+
+
+def child_pids(pid):
+    """pid and all of its descendants"""
+    if psutil:
+        try:
+            process = psutil.Process(pid)
+            return [pid] + [child.pid for child in process.children(recursive=True)]
+        except psutil.Error:
+            return []
+
+    children = {}
+    for name in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                # The command name may contain spaces; fields resume after ")"
+                ppid = int(f.read().rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        pending.extend(children.get(current, []))
+    return pids
+
+
+def rss_bytes(pid):
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def driver_pid(driver):
+    """Process id of the chromedriver behind a WebDriver, or None"""
+    process = getattr(getattr(driver, "service", None), "process", None)
+    return getattr(process, "pid", None)
+
+
+def browser_rss_mb(driver):
+    """Resident memory of the driver's process tree in MB, or None if unknown"""
+    pid = driver_pid(driver)
+    if pid is None:
+        return None
+    return sum(rss_bytes(p) for p in child_pids(pid)) / 2**20
+
+
+def kill_browser(driver):
+    """Kill Chrome under a driver; chromedriver stays up and fails the blocked command"""
+    pid = driver_pid(driver)
+    if pid is None:
+        return
+    for child in child_pids(pid)[1:]:
+        try:
+            os.kill(child, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class BrowserWatchdog:
+    """
+    Health checks and a page deadline for WebDriver instances. check()
+    returns why a browser should be replaced (None if it is fine); guard()
+    wraps a page and kills the browser if the page outlives the deadline.
+    """
+
+    def __init__(
+        self,
+        max_rss_mb=DEFAULT_MAX_RSS_MB,
+        max_command_seconds=DEFAULT_MAX_COMMAND_SECONDS,
+        page_deadline=DEFAULT_PAGE_DEADLINE,
+    ):
+        self.max_rss_mb = max_rss_mb
+        self.max_command_seconds = max_command_seconds
+        self.page_deadline = page_deadline
+        self.lock = threading.Lock()
+        self.stats = {"checks": 0, "replaced_rss": 0, "replaced_slow": 0, "killed_hung": 0}
+        self.peak_rss_mb = 0.0
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def check(self, driver):
+        """Reason to replace the browser, or None when it is healthy"""
+        self.count("checks")
+        rss_mb = browser_rss_mb(driver)
+        if rss_mb is not None:
+            with self.lock:
+                self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+            if self.max_rss_mb and rss_mb > self.max_rss_mb:
+                self.count("replaced_rss")
+                return f"using {rss_mb:.0f} MB (limit {self.max_rss_mb} MB)"
+
+        started = time.monotonic()
+        with self.guard(driver, self.max_command_seconds * 4) as state:
+            try:
+                driver.execute_script("return 1")
+            except Exception as e:
+                self.count("replaced_slow")
+                return "killed while unresponsive" if state["killed"] else f"not responding: {e}"
+        latency = time.monotonic() - started
+        if latency > self.max_command_seconds:
+            self.count("replaced_slow")
+            return f"slow to respond ({latency:.1f}s)"
+        return None
+
+    @contextmanager
+    def guard(self, driver, deadline=None):
+        """
+        Kill the browser if the block runs past the deadline; the yielded
+        dict's "killed" tells whether that happened
+        """
+        state = {"killed": False}
+
+        def expire():
+            state["killed"] = True
+            self.count("killed_hung")
+            print(f"Browser hung for {deadline or self.page_deadline:.0f}s, killing it")
+            kill_browser(driver)
+
+        timer = threading.Timer(deadline or self.page_deadline, expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield state
+        finally:
+            timer.cancel()
+
+    def summary(self):
+        with self.lock:
+            return {**self.stats, "peak_rss_mb": round(self.peak_rss_mb)}
@@ -1,235 +1,102 @@
-import base64
+import argparse
 import json
-import os
-import time
-from urllib.parse import urljoin, urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
 
+from cornell_export import add_export_arguments, save_pages_as_pdf, should_export
+from extractors import extract_canine_categories, has_next_listing_page, last_listing_page
 
-def fetch_canine_health_data():
-    BASE_URL = "https://www.vet.cornell.edu/departments-centers-and-institutes/riney-canine-health-center/canine-health-information"
-    
-    all_categories = []
-    current_page = 0
-    
-    while True:
-        # Construct URL with page parameter
-        if current_page == 0:
-            page_url = BASE_URL
-        else:
-            page_url = f"{BASE_URL}?page={current_page}"
-        
-        print(f"Fetching page {current_page + 1}...")
-        
-        try:
-            response = requests.get(page_url)
-            response.raise_for_status()
-        except requests.RequestException as e:
-            print(f"Error fetching page {current_page}: {e}")
+# Links to other sites are not exported
+SKIP_HOSTS = [
+    "youtube.com",
+    "goo.gl",
+    "veritasdvm.com",
+    "bigredbarkchat.vet.cornell.edu",
+]
+
+
+BASE_URL = "https://www.vet.cornell.edu/departments-centers-and-institutes/riney-canine-health-center/canine-health-information"
+
+
+def fetch_listing_page(page):
+    """Fetch one page of the listing; returns its HTML or None on error"""
+    page_url = BASE_URL if page == 0 else f"{BASE_URL}?page={page}"
+    print(f"Fetching page {page + 1}...")
+    try:
+        response = requests.get(page_url)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        print(f"Error fetching page {page}: {e}")
+        return None
+    return response.text
+
+
+def fetch_listing_pages(max_workers=4):
+    """
+    HTML of every listing page in order. The first page tells us the last
+    page number, so the others are fetched concurrently. Without a "last
+    page" link the pager is followed one page at a time. The list stops
+    before the first page that failed, like the sequential walk did.
+    """
+    first_page = fetch_listing_page(0)
+    if first_page is None:
+        return []
+
+    last_page = last_listing_page(first_page)
+    if last_page is None:
+        pages = [first_page]
+        while has_next_listing_page(pages[-1]):
+            html = fetch_listing_page(len(pages))
+            if html is None:
+                break
+            pages.append(html)
+        return pages
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rest = list(executor.map(fetch_listing_page, range(1, last_page + 1)))
+
+    pages = [first_page]
+    for html in rest:
+        if html is None:
             break
+        pages.append(html)
+    return pages
+
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        
-        # Find the view content container
-        view_content = soup.find("div", class_="view-content cards")
-        if not view_content:
-            print(f"Could not find view-content on page {current_page}")
-            # Let's see what div classes are available
-            all_divs = soup.find_all("div", class_=True)
-            print(f"Available div classes: {[' '.join(div.get('class', [])) for div in all_divs[:10]]}")
+def fetch_canine_health_data():
+    # Categories keyed by title, in order of first appearance; a category that
+    # continues on the next page gets its items appended
+    categories = {}
+
+    for page, html in enumerate(fetch_listing_pages()):
+        page_categories = extract_canine_categories(html, BASE_URL)
+        if page_categories is None:
+            print(f"Could not find view-content on page {page}")
             break
 
-        # Find all h3 category headers and their associated content
-        current_category = None
-        category_items = []
-        
-        # Get all direct children and iterate through them
-        elements = list(view_content.children)
-        
-        for element in elements:
-            if element.name == "h3":
-                # Save previous category if exists
-                if current_category and category_items:
-                    # Check if this category already exists in our list
-                    existing_category = next((cat for cat in all_categories if cat["title"] == current_category), None)
-                    if existing_category:
-                        existing_category["subcategories"].extend(category_items)
-                    else:
-                        all_categories.append({"title": current_category, "subcategories": category_items})
-                
-                # Start new category
-                current_category = element.get_text(strip=True)
-                category_items = []
-                print(f"  Found category: {current_category}")
-                
-            elif element.name == "div" and element.get("class"):
-                element_classes = " ".join(element.get("class", []))
-                if "expander views-row card" in element_classes:
-                    # Find the link in this card
-                    link_element = element.find("a")
-                    if link_element and current_category:
-                        title = link_element.get_text(strip=True)
-                        href = link_element.get("href")
-                        if href:
-                            full_url = urljoin(BASE_URL, href)
-                            category_items.append({"title": title, "url": full_url})
-                            print(f"    Found item: {title}")
-
-        # Save the last category
-        if current_category and category_items:
-            existing_category = next((cat for cat in all_categories if cat["title"] == current_category), None)
-            if existing_category:
-                existing_category["subcategories"].extend(category_items)
-            else:
-                all_categories.append({"title": current_category, "subcategories": category_items})
-        
-        # Check if there's a next page
-        pagination = soup.find("nav", class_="pager")
-        if pagination:
-            next_link = pagination.find("a", title=lambda x: x and "Go to next page" in x)
-            if next_link:
-                current_page += 1
-                continue
-        
-        # No more pages
-        break
-    
-    return all_categories
-
-
-def save_url_as_pdf(driver, url, pdf_path, timeout=30):
-    """Save a URL as PDF using Chrome's built-in PDF printing capability"""
-    
-    try:
-        driver.get(url)
-        time.sleep(5)
-        result = driver.execute_cdp_cmd(
-            "Page.printToPDF",
-            {
-                "printBackground": True,
-                "preferCSSPageSize": True,
-                "marginTop": 0,
-                "marginBottom": 0,
-                "marginLeft": 0,
-                "marginRight": 0,
-            },
-        )
-        pdf_data = base64.b64decode(result["data"])
-        with open(pdf_path, "wb") as f:
-            f.write(pdf_data)
-
-        return True
-    except Exception as e:
-        print(f"Error saving PDF: {e}")
-        return False
-
-
-def save_pages_as_pdf(categories):
-    pdf_dir = "canine_health_pdfs"
-    os.makedirs(pdf_dir, exist_ok=True)
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--window-size=1200,1200")
-    service = Service(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service, options=chrome_options)
-    processed_log = []
+        for category in page_categories:
+            print(f"  Found category: {category['title']}")
+            for item in category["subcategories"]:
+                print(f"    Found item: {item['title']}")
 
-    try:
-        for category in categories:
-            category_title = category["title"]
-            print(f"\nProcessing category: {category_title}")
-            category_dir = os.path.join(
-                pdf_dir, category_title.replace(" ", "_").replace("/", "_")
-            )
-            os.makedirs(category_dir, exist_ok=True)
-
-            for subcategory in category["subcategories"]:
-                subcategory_title = subcategory["title"]
-                subcategory_url = subcategory["url"]
-                if (
-                    "youtube.com" in subcategory_url
-                    or "goo.gl" in subcategory_url
-                    or "veritasdvm.com" in subcategory_url
-                    or "bigredbarkchat.vet.cornell.edu" in subcategory_url
-                ):
-                    print(f"  • Skipping external URL: {subcategory_title}")
-                    processed_log.append(
-                        {
-                            "category": category_title,
-                            "title": subcategory_title,
-                            "url": subcategory_url,
-                            "status": "skipped",
-                            "reason": "External URL",
-                        }
-                    )
-                    continue
-                safe_title = (
-                    subcategory_title.replace(" ", "_")
-                    .replace("/", "_")
-                    .replace(":", "")
-                    .replace("?", "")
-                    .replace('"', "")
-                )
-                pdf_path = os.path.join(category_dir, f"{safe_title}.pdf")
-                print(f"  • Saving: {subcategory_title}")
-                try:
-                    if save_url_as_pdf(driver, subcategory_url, pdf_path):
-                        processed_log.append(
-                            {
-                                "category": category_title,
-                                "title": subcategory_title,
-                                "url": subcategory_url,
-                                "pdf_path": pdf_path,
-                                "status": "success",
-                            }
-                        )
-                    else:
-                        processed_log.append(
-                            {
-                                "category": category_title,
-                                "title": subcategory_title,
-                                "url": subcategory_url,
-                                "status": "error",
-                                "error": "Failed to save PDF",
-                            }
-                        )
-                except Exception as e:
-                    print(f"    Error processing {subcategory_title}: {e}")
-                    processed_log.append(
-                        {
-                            "category": category_title,
-                            "title": subcategory_title,
-                            "url": subcategory_url,
-                            "status": "error",
-                            "error": str(e),
-                        }
-                    )
-                time.sleep(1)
-
-    finally:
-        driver.quit()
-        with open(
-            os.path.join(pdf_dir, "processing_log.json"), "w", encoding="utf-8"
-        ) as f:
-            json.dump(processed_log, f, indent=4, ensure_ascii=False)
+            if category["title"] in categories:
+                categories[category["title"]]["subcategories"].extend(category["subcategories"])
+            else:
+                categories[category["title"]] = category
 
-        print(
-            f"\nProcessing complete. See log at {os.path.join(pdf_dir, 'processing_log.json')}"
-        )
+    return list(categories.values())
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fetch Cornell canine health topics and export PDFs"
+    )
+    add_export_arguments(parser)
+    args = parser.parse_args()
+
     data = fetch_canine_health_data()
-    
+
     if data:
         with open("canine_health_topics.json", "w", encoding="utf-8") as f:
             json.dump(data, f, indent=4, ensure_ascii=False)
@@ -237,10 +104,15 @@ if __name__ == "__main__":
         print(
             f"Found {len(data)} categories with a total of {sum(len(cat['subcategories']) for cat in data)} subcategories"
         )
-        proceed = input("Do you want to download PDFs for all subcategories? (y/n): ")
-        if proceed.lower() == "y":
-            save_pages_as_pdf(data)
-        else:
-            print("PDF download skipped.")
+        if should_export(args):
+            save_pages_as_pdf(
+                data,
+                "canine_health_pdfs",
+                skip_hosts=SKIP_HOSTS,
+                workers=args.workers,
+                settle=args.settle,
+                force=args.force,
+                print_profile=args.print_profile,
+            )
     else:
-        print("Failed to retrieve data")
\ No newline at end of file
+        print("Failed to retrieve data")
@@ -0,0 +1,304 @@
+# cornell_export.py - Concurrent, resumable PDF export of Cornell health topics
+#
+# Used by canine.py and feline.py. Pages are printed on a pool of browsers
+# (or the render service), PDFs that are already on disk and match the log are
+# kept, and processing_log.json is rewritten after every page so an
+# interrupted export can simply be started again.
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from browser import chrome_options
+from print_profiles import PRINT_PROFILES, PrintProfile
+from render_service import get_renderer
+from retry import render_with_retry
+from throttle import host_throttle
+
+CORNELL_BASE_URL = "https://www.vet.cornell.edu"
+
+# Page.printToPDF parameters for Cornell pages: full width, no margins
+CORNELL_PRINT_OPTIONS = {
+    "printBackground": True,
+    "preferCSSPageSize": True,
+    "marginTop": 0,
+    "marginBottom": 0,
+    "marginLeft": 0,
+    "marginRight": 0,
+    "scale": 1,
+}
+
+# Anything smaller is an error page or a truncated write, not a topic
+MIN_PDF_BYTES = 1024
+
+
+def safe_name(title):
+    return (
+        title.replace(" ", "_")
+        .replace("/", "_")
+        .replace(":", "")
+        .replace("?", "")
+        .replace('"', "")
+    )
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_valid_pdf(pdf_path, entry=None):
+    """
+    True when pdf_path holds a plausible PDF. If the log entry from an earlier
+    run recorded its size and hash, the file must still match them.
+    """
+    if not os.path.isfile(pdf_path):
+        return False
+    size = os.path.getsize(pdf_path)
+    if size < MIN_PDF_BYTES:
+        return False
+    with open(pdf_path, "rb") as f:
+        if f.read(5) != b"%PDF-":
+            return False
+    if entry and entry.get("bytes") is not None and entry["bytes"] != size:
+        return False
+    if entry and entry.get("sha256") and entry["sha256"] != file_sha256(pdf_path):
+        return False
+    return True
+
+
+def save_url_as_pdf(renderer, url, pdf_path, settle=1, profile=None, throttle=None):
+    """
+    Save a URL as PDF using Chrome's built-in PDF printing capability,
+    stripped by the PrintProfile if one is given and paced by the throttle
+    """
+    options = {"print_options": CORNELL_PRINT_OPTIONS}
+    if profile:
+        options = profile.render_options(CORNELL_PRINT_OPTIONS)
+    result = render_with_retry(
+        renderer,
+        url,
+        throttle,
+        pdf_path=pdf_path,
+        settle=settle,
+        window_size=[1200, 1200],
+        **options,
+    )
+    if profile:
+        profile.record(result)
+    return result
+
+
+def plan_jobs(categories, pdf_dir, skip_hosts):
+    """One job per subcategory, in listing order"""
+    jobs = []
+    for category in categories:
+        category_dir = os.path.join(
+            pdf_dir, category["title"].replace(" ", "_").replace("/", "_")
+        )
+        for subcategory in category["subcategories"]:
+            pdf_name = f"{safe_name(subcategory['title'])}.pdf"
+            jobs.append(
+                {
+                    "category": category["title"],
+                    "title": subcategory["title"],
+                    "url": subcategory["url"],
+                    "pdf_path": os.path.join(category_dir, pdf_name),
+                    "external": any(host in subcategory["url"] for host in skip_hosts),
+                }
+            )
+    return jobs
+
+
+class ProcessingLog:
+    """processing_log.json, rewritten atomically after every finished page"""
+
+    def __init__(self, path, job_count):
+        self.path = path
+        self.entries = [None] * job_count
+        self.lock = threading.Lock()
+        self.previous = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    for entry in json.load(f):
+                        if entry.get("pdf_path"):
+                            self.previous[entry["pdf_path"]] = entry
+            except (OSError, json.JSONDecodeError):
+                print(f"Ignoring unreadable log {path}")
+
+    def set(self, index, entry):
+        with self.lock:
+            self.entries[index] = entry
+            self.write()
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                [entry for entry in self.entries if entry is not None],
+                f,
+                indent=4,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def export_job(renderer, job, throttle, settle, profile=None):
+    """Print one page and return its log entry"""
+    entry = {"category": job["category"], "title": job["title"], "url": job["url"]}
+    os.makedirs(os.path.dirname(job["pdf_path"]), exist_ok=True)
+    try:
+        save_url_as_pdf(renderer, job["url"], job["pdf_path"], settle, profile, throttle)
+    except Exception as e:
+        print(f"    Error processing {job['title']}: {e}")
+        entry.update(status="error", error=str(e))
+        return entry
+
+    if not is_valid_pdf(job["pdf_path"]):
+        entry.update(status="error", error="Failed to save PDF")
+        return entry
+    entry.update(
+        pdf_path=job["pdf_path"],
+        status="success",
+        bytes=os.path.getsize(job["pdf_path"]),
+        sha256=file_sha256(job["pdf_path"]),
+    )
+    return entry
+
+
+def save_pages_as_pdf(
+    categories,
+    pdf_dir,
+    skip_hosts=(),
+    workers=3,
+    settle=1,
+    force=False,
+    print_profile="cornell",
+):
+    """
+    Export every subcategory page to pdf_dir/<category>/<title>.pdf with
+    `workers` pages printing at once, stripped with the named print profile.
+    PDFs that exist and match the previous log, or that are valid PDFs with
+    no log entry (the log was lost), are skipped unless force is set.
+    """
+    os.makedirs(pdf_dir, exist_ok=True)
+    log_path = os.path.join(pdf_dir, "processing_log.json")
+    jobs = plan_jobs(categories, pdf_dir, skip_hosts)
+    log = ProcessingLog(log_path, len(jobs))
+
+    pending = []
+    kept = 0
+    for index, job in enumerate(jobs):
+        if job["external"]:
+            print(f"  • Skipping external URL: {job['title']}")
+            log.entries[index] = {
+                "category": job["category"],
+                "title": job["title"],
+                "url": job["url"],
+                "status": "skipped",
+                "reason": "External URL",
+            }
+            continue
+        previous = log.previous.get(job["pdf_path"])
+        if not force and previous and previous.get("status") == "success":
+            if is_valid_pdf(job["pdf_path"], previous):
+                log.entries[index] = previous
+                kept += 1
+                continue
+        elif not force and previous is None and is_valid_pdf(job["pdf_path"]):
+            log.entries[index] = {
+                "category": job["category"],
+                "title": job["title"],
+                "url": job["url"],
+                "pdf_path": job["pdf_path"],
+                "status": "success",
+                "bytes": os.path.getsize(job["pdf_path"]),
+                "sha256": file_sha256(job["pdf_path"]),
+            }
+            kept += 1
+            continue
+        pending.append((index, job))
+    log.write()
+
+    print(f"\n{len(pending)} pages to export, {kept} already exported")
+    if not pending:
+        print(f"\nProcessing complete. See log at {log_path}")
+        return
+
+    throttle = host_throttle(
+        CORNELL_BASE_URL, max_concurrency=workers, start_delay=1.0, min_delay=0.5
+    )
+
+    workers = max(1, min(workers, len(pending)))
+    profile = PrintProfile(print_profile, os.path.join(pdf_dir, "print_stats.jsonl"))
+    renderer = get_renderer(
+        chrome_options(window_size="1200,1200", user_agent=None, headless="--headless"),
+        browsers=workers,
+    )
+    done = 0
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(export_job, renderer, job, throttle, settle, profile): (index, job)
+                for index, job in pending
+            }
+            for future in as_completed(futures):
+                index, job = futures[future]
+                entry = future.result()
+                log.set(index, entry)
+                done += 1
+                if entry["status"] != "success":
+                    failed += 1
+                print(
+                    f"  [{done}/{len(pending)}] {entry['status']}: "
+                    f"{job['category']} / {job['title']}"
+                )
+    finally:
+        renderer.close()
+        log.write()
+        print(f"\nExported {done - failed}, failed {failed}, kept {kept}")
+        print(f"Print profile {profile.summary()}")
+        if getattr(renderer, "watchdog", None):
+            print(f"Browser watchdog: {renderer.watchdog.summary()}")
+        print(f"\nProcessing complete. See log at {log_path}")
+
+
+def add_export_arguments(parser):
+    """Command-line options shared by canine.py and feline.py"""
+    choice = parser.add_mutually_exclusive_group()
+    choice.add_argument("--pdfs", action="store_true", help="Export PDFs without asking")
+    choice.add_argument("--no-pdfs", action="store_true", help="Only save the topic list")
+    parser.add_argument("--workers", type=int, default=3, help="Pages printed concurrently")
+    parser.add_argument(
+        "--settle", type=float, default=1, help="Seconds to let each page finish rendering"
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-export PDFs that already exist"
+    )
+    parser.add_argument(
+        "--print-profile",
+        choices=list(PRINT_PROFILES),
+        default="cornell",
+        help="Page furniture to strip before printing ('none' prints the page as served)",
+    )
+
+
+def should_export(args):
+    """Decide from the flags; only ask when a terminal is attached"""
+    if args.pdfs or args.no_pdfs:
+        return args.pdfs
+    if not os.isatty(0):
+        print("PDF download skipped (pass --pdfs to export without a prompt).")
+        return False
+    proceed = input("Do you want to download PDFs for all subcategories? (y/n): ")
+    if proceed.lower() != "y":
+        print("PDF download skipped.")
+        return False
+    return True
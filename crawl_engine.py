@@ -0,0 +1,324 @@
+# crawl_engine.py - Crawl several sites at once through their site adapters
+#
+#   python crawl_engine.py                       # Merck, canine and feline
+#   python crawl_engine.py --sites canine feline --browsers 4
+#
+# Every site gets its own frontier and worker threads, and every host its own
+# concurrency limit and throttle, while all of them share one browser pool (or
+# the render service when RENDER_SERVICE_URL is set). A full refresh takes
+# about as long as the slowest host.
+#
+# Discovered links are kept in a per-site link graph (link_graph.py) and the
+# frontier is ordered by it, so with --max-pages the best-linked pages are
+# rendered first.
+
+import argparse
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from browser import chrome_options
+from link_graph import LinkGraph, PriorityFrontier
+from print_profiles import PRINT_PROFILES, PrintProfile
+from render_service import RenderError, get_renderer
+from retry import render_with_retry
+from site_adapters import ADAPTERS
+from throttle import host_throttle
+from url_canon import SeenSet, canonicalize_url
+from work_queue import append_to_index
+
+
+class SiteIndex:
+    """
+    A site's index file, keyed by the adapter. Every entry is written to the
+    file as it is put, under the lock queue workers use (append_to_index), so
+    entries other processes added meanwhile are kept.
+    """
+
+    def __init__(self, adapter):
+        self.adapter = adapter
+        self.path = adapter.index_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for entry in json.load(f):
+                    self.entries[adapter.index_key(entry)] = entry
+            print(f"[{adapter.name}] Loaded {len(self.entries)} index entries from {self.path}")
+
+    def get(self, task):
+        with self.lock:
+            return self.entries.get(self.adapter.index_key(task))
+
+    def put(self, task, entry):
+        with self.lock:
+            self.entries[self.adapter.index_key(task)] = entry
+            append_to_index(self.path, entry, replace=True, key=self.adapter.index_key)
+
+
+class HostPolicy:
+    """
+    Politeness for one host, shared by every site on it (canine and feline
+    are both on www.vet.cornell.edu): at most `concurrency` pages at once,
+    spaced by an AIMD throttle that honors the robots.txt crawl-delay and
+    the machine-wide token bucket for the host.
+    """
+
+    def __init__(self, host, base_url, concurrency):
+        self.host = host
+        self.concurrency = concurrency
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.throttle = host_throttle(
+            base_url, max_concurrency=concurrency, start_delay=1.0, min_delay=0.5
+        )
+
+
+class SiteRun:
+    """Frontier, index and counters of one site during a crawl"""
+
+    def __init__(self, adapter, renderer, policy, max_pages=None):
+        self.adapter = adapter
+        self.renderer = renderer
+        self.policy = policy
+        self.max_pages = max_pages
+        self.throttle = policy.throttle
+        self.index = SiteIndex(adapter)
+        self.graph = LinkGraph(os.path.join(adapter.output_dir, "link_graph.db"))
+        self.frontier = PriorityFrontier(self.graph, key=lambda task: canonicalize_url(task["url"]))
+        # Index keys are already canonical (URLs) or file paths
+        self.seen = SeenSet(key=None)
+        self.profile = PrintProfile(
+            adapter.print_profile, os.path.join(adapter.output_dir, "print_stats.jsonl")
+        )
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.stats = {
+            "rendered": 0,
+            "pdfs": 0,
+            "kept": 0,
+            "failed": 0,
+            "external": 0,
+        }
+        self.started = None
+        self.elapsed = None
+
+    def log(self, message):
+        print(f"[{self.adapter.name}] {message}")
+
+    def count(self, name):
+        with self.condition:
+            self.stats[name] += 1
+
+    def add(self, tasks):
+        with self.condition:
+            for task in tasks:
+                key = self.adapter.index_key(task)
+                if key in self.seen:
+                    continue
+                self.seen.add(key)
+                self.frontier.append(task)
+            self.condition.notify_all()
+
+    def within_budget(self):
+        return not self.max_pages or self.stats["rendered"] + self.in_flight < self.max_pages
+
+    def next_task(self):
+        """
+        The next task, or None once the frontier is empty (or the page budget
+        is spent) and nothing is in flight
+        """
+        with self.condition:
+            while not (self.frontier and self.within_budget()):
+                if not self.in_flight:
+                    return None
+                self.condition.wait()
+            self.in_flight += 1
+            return self.frontier.popleft()
+
+    def record_links(self, source_url, tasks, strategy):
+        links = [{"url": canonicalize_url(task["url"]), "title": task["title"]} for task in tasks]
+        self.graph.add_links(canonicalize_url(source_url), links, strategy)
+
+    def task_done(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def process(self, task):
+        adapter = self.adapter
+        if adapter.is_external(task):
+            self.log(f"Skipping external URL: {task['title']}")
+            self.count("external")
+            entry = adapter.skipped_entry(task)
+            if entry:
+                self.index.put(task, entry)
+            return
+
+        need_pdf = bool(task.get("pdf_path")) and not adapter.is_done(task, self.index.get(task))
+        need_html = adapter.expands(task)
+        if not need_pdf:
+            self.count("kept")
+        if not need_pdf and not need_html:
+            return
+
+        options = adapter.render_options(task)
+        if need_pdf:
+            os.makedirs(os.path.dirname(task["pdf_path"]), exist_ok=True)
+            options["pdf_path"] = task["pdf_path"]
+            options.update(self.profile.render_options(options.get("print_options") or {}))
+        else:
+            options.pop("print_options", None)
+        if need_html:
+            options["return_html"] = True
+
+        try:
+            with self.policy.slots:
+                result = render_with_retry(self.renderer, task["url"], self.throttle, **options)
+        except RenderError as e:
+            self.log(f"Error rendering {task['title']}: {e}")
+            self.count("failed")
+            entry = adapter.failure_entry(task, e)
+            if entry:
+                self.index.put(task, entry)
+            return
+        self.count("rendered")
+
+        if need_pdf:
+            self.profile.record(result)
+            self.index.put(task, adapter.index_entry(task, result))
+            self.count("pdfs")
+            self.log(f"PDF saved to: {task['pdf_path']}")
+        if need_html:
+            children = adapter.children(task, result["html"])
+            self.record_links(task["url"], children, task.get("kind", "page"))
+            self.add(children)
+
+    def worker(self):
+        while True:
+            task = self.next_task()
+            if task is None:
+                return
+            try:
+                self.process(task)
+            except Exception as e:
+                self.log(f"Error processing {task['url']}: {e}")
+                self.count("failed")
+            finally:
+                self.task_done()
+
+    def run(self):
+        """Discover the seeds, then crawl with the adapter's concurrency"""
+        self.started = time.monotonic()
+        try:
+            seeds = self.adapter.seeds()
+        except Exception as e:
+            self.log(f"Discovery failed: {e}")
+            seeds = []
+        self.log(f"Starting with {len(seeds)} pages")
+        self.record_links(self.adapter.base_url, seeds, "seed")
+        self.add(seeds)
+
+        workers = [
+            threading.Thread(target=self.worker, name=f"{self.adapter.name}-{i}")
+            for i in range(self.adapter.concurrency)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.elapsed = time.monotonic() - self.started
+        self.log(f"Finished in {self.elapsed:.0f}s: {self.stats}")
+        if self.frontier:
+            self.log(f"Page budget spent with {len(self.frontier)} pages left in the frontier")
+        self.log(f"Seen: {self.seen.stats()}, link graph: {self.graph.stats()}")
+        self.log(f"Print profile {self.profile.summary()}")
+        self.graph.close()
+
+
+def crawl(adapters, browsers=None, max_pages=None):
+    """
+    Crawl all sites concurrently and return their SiteRuns. max_pages limits
+    the pages rendered per site.
+    """
+    policies = {}
+    for adapter in adapters:
+        host = urlparse(adapter.base_url).netloc
+        concurrency = max(
+            a.concurrency for a in adapters if urlparse(a.base_url).netloc == host
+        )
+        if host not in policies:
+            policies[host] = HostPolicy(host, adapter.base_url, concurrency)
+
+    browsers = browsers or sum(policy.concurrency for policy in policies.values())
+    renderer = get_renderer(chrome_options(), browsers=browsers)
+    runs = [
+        SiteRun(adapter, renderer, policies[urlparse(adapter.base_url).netloc], max_pages)
+        for adapter in adapters
+    ]
+    started = time.monotonic()
+    try:
+        threads = [threading.Thread(target=run.run, name=run.adapter.name) for run in runs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        renderer.close()
+
+    print("\n=== Summary ===")
+    for run in runs:
+        stats = run.stats
+        print(
+            f"{run.adapter.name:<8} {run.elapsed or 0:>7.0f}s  rendered {stats['rendered']}, "
+            f"PDFs {stats['pdfs']}, kept {stats['kept']}, failed {stats['failed']}, "
+            f"external {stats['external']}  -> {run.adapter.index_path}"
+        )
+    print(f"Total time: {time.monotonic() - started:.0f}s")
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl several sites concurrently")
+    parser.add_argument(
+        "--sites", nargs="+", choices=list(ADAPTERS), default=list(ADAPTERS)
+    )
+    parser.add_argument(
+        "--browsers",
+        type=int,
+        help="Browsers shared by all sites (default: the sum of site concurrency)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        nargs="+",
+        default=[],
+        metavar="SITE=N",
+        help="Pages rendered at once per site, e.g. merck=3",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        help="Pages rendered per site; the best-linked pages go first",
+    )
+    parser.add_argument(
+        "--print-profile",
+        choices=list(PRINT_PROFILES),
+        help="Print profile for every site (default: each site's own)",
+    )
+    args = parser.parse_args()
+
+    adapters = [ADAPTERS[name]() for name in args.sites]
+    if args.print_profile:
+        for adapter in adapters:
+            adapter.print_profile = args.print_profile
+    for setting in args.concurrency:
+        name, _, value = setting.partition("=")
+        for adapter in adapters:
+            if adapter.name == name:
+                adapter.concurrency = int(value)
+    crawl(adapters, args.browsers, args.max_pages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# driver_cache.py - Pinned, offline-capable chromedriver and Chrome resolution
+#
+# The first run (or `python driver_cache.py --refresh`) downloads chromedriver
+# into a local cache and pins it in driver.json. Later runs read the pin and
+# start Chrome without touching the network. Configure with:
+#
+#   CHROMEDRIVER_PATH    use this chromedriver, skipping the cache
+#   CHROME_BINARY        use this Chrome/Chromium binary
+#   WEBDRIVER_CACHE_DIR  cache location (default ~/.cache/merck-scraper/webdriver)
+#   WEBDRIVER_OFFLINE=1  never download; fail if nothing is pinned
+#   CHROMEDRIVER_VERSION driver version to download on refresh
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "merck-scraper", "webdriver")
+PIN_FILE = "driver.json"
+
+BROWSER_NAMES = [
+    "google-chrome",
+    "google-chrome-stable",
+    "chromium",
+    "chromium-browser",
+    "chrome",
+]
+
+VERSION_PATTERN = re.compile(r"\d+(?:\.\d+)+")
+
+_resolved = None
+_resolve_lock = threading.Lock()
+
+
+class DriverResolutionError(Exception):
+    pass
+
+
+def cache_dir():
+    return Path(os.path.expanduser(os.environ.get("WEBDRIVER_CACHE_DIR", DEFAULT_CACHE_DIR)))
+
+
+def is_offline():
+    return os.environ.get("WEBDRIVER_OFFLINE", "").lower() in ("1", "true", "yes")
+
+
+def is_executable(path):
+    return bool(path) and os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def find_browser():
+    """Path of the Chrome binary: CHROME_BINARY, else the first one on PATH"""
+    binary = os.environ.get("CHROME_BINARY")
+    if binary:
+        return binary
+    for name in BROWSER_NAMES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def binary_version(path):
+    """Version reported by `<path> --version` (Chrome or chromedriver), or None"""
+    try:
+        output = subprocess.run(
+            [path, "--version"], capture_output=True, text=True, timeout=10
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_PATTERN.search(output)
+    return match.group(0) if match else None
+
+
+def load_pin(directory=None):
+    """The pinned driver from driver.json, with driver_path made absolute"""
+    directory = directory or cache_dir()
+    pin_path = directory / PIN_FILE
+    if not pin_path.exists():
+        return None
+    try:
+        with open(pin_path, "r", encoding="utf-8") as f:
+            pin = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    pin["driver_path"] = str(directory / pin["driver_path"])
+    return pin
+
+
+def save_pin(pin, directory=None):
+    directory = directory or cache_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp_path = directory / (PIN_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pin, f, indent=2)
+    os.replace(tmp_path, directory / PIN_FILE)
+
+
+def refresh(version=None):
+    """
+    Download chromedriver into the cache (matching the installed Chrome unless
+    a version is given) and pin it. This is the only step that needs network.
+    """
+    global _resolved
+    from webdriver_manager.chrome import ChromeDriverManager
+    from webdriver_manager.core.driver_cache import DriverCacheManager
+
+    directory = cache_dir()
+    version = version or os.environ.get("CHROMEDRIVER_VERSION") or None
+    browser_path = find_browser()
+    manager = ChromeDriverManager(
+        driver_version=version, cache_manager=DriverCacheManager(root_dir=str(directory))
+    )
+    driver_path = manager.install()
+
+    # Stored relative to the cache so the directory can be copied to other hosts
+    if Path(driver_path).is_relative_to(directory):
+        driver_path = str(Path(driver_path).relative_to(directory))
+    pin = {
+        "driver_path": driver_path,
+        "driver_version": binary_version(str(directory / driver_path)),
+        "browser_path": browser_path,
+        "browser_version": binary_version(browser_path) if browser_path else None,
+        "pinned_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    save_pin(pin, directory)
+    with _resolve_lock:
+        _resolved = None
+    return load_pin(directory)
+
+
+def resolve(refresh_if_missing=True):
+    """
+    Return (driver_path, browser_path, source) without network access when a
+    driver is configured or pinned. source is "env", "cache" or "download".
+    The result is remembered for the rest of the process.
+    """
+    global _resolved
+    with _resolve_lock:
+        if _resolved:
+            return _resolved
+
+        driver_path = os.environ.get("CHROMEDRIVER_PATH")
+        if driver_path:
+            if not is_executable(driver_path):
+                raise DriverResolutionError(f"CHROMEDRIVER_PATH {driver_path} is not executable")
+            _resolved = (driver_path, find_browser(), "env")
+            return _resolved
+
+        pin = load_pin()
+        if pin and is_executable(pin.get("driver_path")):
+            browser_path = os.environ.get("CHROME_BINARY") or pin.get("browser_path")
+            _resolved = (pin["driver_path"], browser_path, "cache")
+            return _resolved
+
+    if is_offline() or not refresh_if_missing:
+        raise DriverResolutionError(
+            f"No pinned chromedriver in {cache_dir()}. Set CHROMEDRIVER_PATH, or run "
+            "'python driver_cache.py --refresh' on a machine with network access "
+            "and copy the cache directory over."
+        )
+
+    print(f"No pinned chromedriver in {cache_dir()}, downloading...")
+    pin = refresh()
+    with _resolve_lock:
+        _resolved = (pin["driver_path"], pin["browser_path"], "download")
+        return _resolved
+
+
+def timed_resolve():
+    """resolve() plus the seconds it took"""
+    started = time.monotonic()
+    driver_path, browser_path, source = resolve()
+    return driver_path, browser_path, source, time.monotonic() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or refresh the pinned chromedriver")
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Download chromedriver for the installed Chrome and pin it",
+    )
+    parser.add_argument("--version", help="Driver version to pin instead")
+    args = parser.parse_args()
+
+    print(f"Cache directory: {cache_dir()}")
+    if args.refresh:
+        if is_offline():
+            parser.error("WEBDRIVER_OFFLINE is set, refusing to download")
+        started = time.monotonic()
+        pin = refresh(args.version)
+        print(f"Pinned chromedriver {pin['driver_version']} in {time.monotonic() - started:.1f}s")
+    else:
+        pin = load_pin()
+        if not pin:
+            print("Nothing pinned yet; run with --refresh")
+            return
+
+    for key, value in pin.items():
+        print(f"  {key}: {value}")
+    if not is_executable(pin["driver_path"]):
+        print("Warning: the pinned driver is missing; run with --refresh")
+
+    try:
+        driver_path, browser_path, source, seconds = timed_resolve()
+        print(f"Resolved {driver_path} from {source} in {seconds * 1000:.1f}ms")
+    except DriverResolutionError as e:
+        print(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,490 @@
+# extractors.py - Section, subsection, in-depth and Cornell category extraction
+#
+# Shared by the spider, full.py and the Cornell scripts. Parsing goes through a
+# small node interface so the parser can be swapped: selectolax (lexbor) and
+# lxml are fast C parsers, BeautifulSoup's html.parser is the pure-Python
+# fallback.
+
+import json
+import re
+from functools import lru_cache
+from urllib.parse import parse_qs, urljoin, urlparse
+
+MERCK_BASE_URL = "https://www.merckvetmanual.com"
+
+# Key of the section list component in the topics page __NEXT_DATA__ payload
+SECTION_COMPONENT_KEY = "eb190e7b-5914-4f3d-91a8-3fa8542b6178"
+
+NEXT_DATA_PATTERN = re.compile(
+    r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', re.DOTALL
+)
+
+# A string value in __NEXT_DATA__ that holds rendered article markup
+ARTICLE_FRAGMENT_PATTERN = re.compile(r"<(p|h[2-6]|ul|ol|table|figure)[\s>]", re.IGNORECASE)
+
+# Payload keys that hold site chrome rather than article content
+CHROME_KEY_PATTERN = re.compile(r"nav|menu|header|footer|banner|breadcrumb|advert|promo", re.I)
+
+TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+# Link texts that belong to site navigation rather than content
+NAV_PATTERNS = [
+    "veterinary professionals",
+    "pet owners",
+    "resources",
+    "quizzes",
+    "about",
+    "login",
+    "register",
+    "search",
+    "home",
+    "contact",
+    "legal",
+    "privacy",
+    "advertise",
+    "careers",
+    "help",
+    "terms",
+    "support",
+    "faq",
+    "feedback",
+    "menu",
+    "share",
+    "print",
+    "cookie preferences",
+    "cookie",
+]
+
+# Substrings that mark a link as non-content on rendered Merck pages
+NON_CONTENT_TERMS = [
+    "veterinary",
+    "pet owners",
+    "resources",
+    "quizzes",
+    "about",
+    "contact",
+    "disclaimer",
+    "privacy",
+    "terms",
+    "cookie",
+    "licensing",
+    "copyright",
+]
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def join_text(strings):
+    """
+    Text fragments joined by single spaces, so inline markup keeps the spaces
+    around it as in a browser's rendered text
+    """
+    return WHITESPACE_PATTERN.sub(" ", " ".join(s for s in strings if s)).strip()
+
+
+class SelectolaxNode:
+    def __init__(self, node):
+        self.node = node
+
+    @property
+    def tag(self):
+        return self.node.tag
+
+    def attr(self, name):
+        return self.node.attributes.get(name)
+
+    def text(self):
+        return join_text(
+            node.text_content
+            for node in self.node.traverse(include_text=True)
+            if node.tag == "-text"
+        )
+
+    def select(self, selector):
+        return [SelectolaxNode(node) for node in self.node.css(selector)]
+
+    def children(self):
+        return [SelectolaxNode(node) for node in self.node.iter()]
+
+    def next_sibling(self, tag):
+        node = self.node.next
+        while node is not None:
+            if node.tag == tag:
+                return SelectolaxNode(node)
+            node = node.next
+        return None
+
+
+class LxmlNode:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self):
+        return self.element.tag
+
+    def attr(self, name):
+        return self.element.get(name)
+
+    def text(self):
+        return join_text(self.element.itertext())
+
+    def select(self, selector):
+        return [LxmlNode(element) for element in self.element.cssselect(selector)]
+
+    def children(self):
+        return [LxmlNode(child) for child in self.element if isinstance(child.tag, str)]
+
+    def next_sibling(self, tag):
+        for sibling in self.element.itersiblings():
+            if sibling.tag == tag:
+                return LxmlNode(sibling)
+        return None
+
+
+class SoupNode:
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def tag(self):
+        return self.element.name
+
+    def attr(self, name):
+        value = self.element.get(name)
+        if isinstance(value, list):
+            return " ".join(value)
+        return value
+
+    def text(self):
+        return join_text(self.element.strings)
+
+    def select(self, selector):
+        return [SoupNode(element) for element in self.element.select(selector)]
+
+    def children(self):
+        return [SoupNode(child) for child in self.element.children if child.name]
+
+    def next_sibling(self, tag):
+        sibling = self.element.find_next_sibling(tag)
+        return SoupNode(sibling) if sibling else None
+
+
+def parse_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    return SelectolaxNode(LexborHTMLParser(html).root)
+
+
+def parse_lxml(html):
+    import lxml.html
+
+    return LxmlNode(lxml.html.document_fromstring(html))
+
+
+def parse_soup(html):
+    from bs4 import BeautifulSoup
+
+    return SoupNode(BeautifulSoup(html, "html.parser"))
+
+
+# Fastest first; get_backend() falls through to the next one when a parser
+# package is not installed
+BACKENDS = {
+    "selectolax": (parse_selectolax, "selectolax.lexbor"),
+    "lxml": (parse_lxml, "lxml.cssselect"),
+    "bs4": (parse_soup, "bs4"),
+}
+
+
+@lru_cache(maxsize=None)
+def available_backends():
+    """Names of the backends whose parser packages are installed"""
+    names = []
+    for name, (_, module_name) in BACKENDS.items():
+        try:
+            __import__(module_name)
+        except ImportError:
+            continue
+        names.append(name)
+    return tuple(names)
+
+
+def get_backend(name=None):
+    """Return the parse function for a backend, or the fastest installed one"""
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown parser backend {name!r}, choose from {list(BACKENDS)}")
+        return BACKENDS[name][0]
+
+    installed = available_backends()
+    if not installed:
+        raise ImportError("No HTML parser installed: need selectolax, lxml or beautifulsoup4")
+    return BACKENDS[installed[0]][0]
+
+
+def parse_html(html, backend=None):
+    return get_backend(backend)(html)
+
+
+def load_next_data(html):
+    """Return the decoded __NEXT_DATA__ payload of a Merck page, or None"""
+    match = NEXT_DATA_PATTERN.search(html)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return None
+
+
+def get_path_from_url(url):
+    """Path of a Merck URL without surrounding slashes, empty for other sites"""
+    if "merckvetmanual.com" not in url:
+        return ""
+    return urlparse(url).path.strip("/")
+
+
+def is_nested_path(section_path, url_path):
+    return bool(section_path) and section_path in url_path and section_path != url_path
+
+
+def iter_links(doc, selector, page_url):
+    """Yield (text, absolute url) for each link with text and an href"""
+    for link in doc.select(selector):
+        text = link.text()
+        href = link.attr("href")
+        if text and href:
+            yield text, urljoin(page_url, href)
+
+
+def extract_sections(html, backend=None):
+    """Main sections from the Merck veterinary topics page"""
+    data = load_next_data(html)
+    if data:
+        section_data = (
+            data.get("props", {})
+            .get("pageProps", {})
+            .get("componentProps", {})
+            .get(SECTION_COMPONENT_KEY, {})
+            .get("data", [])
+        )
+        sections = []
+        for item in section_data:
+            title = item.get("titlecomputed_t", "")
+            path = item.get("relativeurlcomputed_s", "")
+            if title and path:
+                sections.append({"title": title, "url": f"{MERCK_BASE_URL}{path}"})
+        if sections:
+            return sections
+
+    doc = parse_html(html, backend)
+    page_url = f"{MERCK_BASE_URL}/veterinary-topics"
+    selector = "div.SectionList_sectionListItem__NNP4c a, a.SectionList_sectionListItem__NNP4c"
+    if not doc.select(selector):
+        selector = "div[class*='section'] > a, a[href^='/'][class*='section']"
+    return [{"title": text, "url": url} for text, url in iter_links(doc, selector, page_url)]
+
+
+def extract_subsections(html, section_url, backend=None):
+    """Subsections linked from a Merck section page, deduplicated by URL"""
+    doc = parse_html(html, backend)
+    section_path = get_path_from_url(section_url)
+    subsections = {}
+
+    def add(title, url):
+        if (
+            url != section_url
+            and url not in subsections
+            and title.lower() not in NAV_PATTERNS
+            and is_nested_path(section_path, get_path_from_url(url))
+        ):
+            subsections[url] = {"title": title, "url": url, "in_depth_links": []}
+
+    header_selector = (
+        "div.SectionLayout_subsectionExpanded__SJT_i h2 a, "
+        "h2.SectionLayout_subsectionTitle__Lrw_e a, "
+        "div[class*='subsection'] h2 a, "
+        "h2[class*='subsection'] a"
+    )
+    for text, url in iter_links(doc, header_selector, section_url):
+        add(text, url)
+    for text, url in iter_links(doc, "ul li a, ol li a", section_url):
+        add(text, url)
+
+    data = load_next_data(html) or {}
+    component_props = data.get("props", {}).get("pageProps", {}).get("componentProps", {})
+    for value in component_props.values():
+        if isinstance(value, dict) and isinstance(value.get("data"), list):
+            for item in value["data"]:
+                if not isinstance(item, dict):
+                    continue
+                title = item.get("titlecomputed_t", "")
+                path = item.get("relativeurlcomputed_s", "")
+                if title and path:
+                    add(title, f"{MERCK_BASE_URL}{path}")
+
+    if not subsections:
+        for text, url in iter_links(doc, "a[href^='/']", section_url):
+            if len(text) > 3:
+                add(text, url)
+
+    return list(subsections.values())
+
+
+def extract_in_depth_links(html, section_url, subsection_url, backend=None):
+    """In-depth article links on a Merck subsection page, deduplicated by URL"""
+    doc = parse_html(html, backend)
+    section_path = get_path_from_url(section_url)
+    selector = (
+        "ul li a, ol li a, div[class*='content'] a, "
+        "div[class*='topic'] a, div[class*='subsection'] a"
+    )
+    links = {}
+    for text, url in iter_links(doc, selector, subsection_url):
+        if (
+            url not in (section_url, subsection_url)
+            and url not in links
+            and text.lower() not in NAV_PATTERNS
+            and len(text) > 3
+            and is_nested_path(section_path, get_path_from_url(url))
+        ):
+            links[url] = {"title": text, "url": url}
+    return list(links.values())
+
+
+def extract_content_links(html, page_url, base_section_path, backend=None):
+    """
+    Content links on a rendered Merck page whose URL contains
+    base_section_path, in document order. Navigation links are skipped.
+    """
+    doc = parse_html(html, backend)
+    links = []
+    for text, url in iter_links(doc, "a", page_url):
+        if (
+            len(text) > 3
+            and url.startswith(MERCK_BASE_URL)
+            and url != page_url
+            and not any(term in text.lower() for term in NON_CONTENT_TERMS)
+            and base_section_path in url
+        ):
+            links.append({"title": text, "url": url})
+    return links
+
+
+def extract_canine_categories(html, base_url, backend=None):
+    """
+    Categories on one page of the Cornell canine health listing, in page order.
+    Returns None when the listing container is missing.
+    """
+    doc = parse_html(html, backend)
+    containers = doc.select("div.view-content.cards")
+    if not containers:
+        return None
+
+    categories = []
+    current_category = None
+    category_items = []
+    for element in containers[0].children():
+        if element.tag == "h3":
+            if current_category and category_items:
+                categories.append({"title": current_category, "subcategories": category_items})
+            current_category = element.text()
+            category_items = []
+        elif element.tag == "div" and element.attr("class"):
+            element_classes = " ".join(element.attr("class").split())
+            if "expander views-row card" in element_classes:
+                link_elements = element.select("a")
+                if link_elements and current_category:
+                    href = link_elements[0].attr("href")
+                    if href:
+                        category_items.append(
+                            {"title": link_elements[0].text(), "url": urljoin(base_url, href)}
+                        )
+
+    if current_category and category_items:
+        categories.append({"title": current_category, "subcategories": category_items})
+    return categories
+
+
+def has_next_listing_page(html, backend=None):
+    """True when the Cornell listing pager links to a next page"""
+    doc = parse_html(html, backend)
+    return bool(doc.select("nav.pager a[title*='Go to next page']"))
+
+
+def last_listing_page(html, backend=None):
+    """
+    The ?page= number of the last Cornell listing page, from the pager's
+    "Go to last page" link. Returns None when the pager has no such link.
+    """
+    doc = parse_html(html, backend)
+    for link in doc.select("nav.pager a[title*='Go to last page']"):
+        pages = parse_qs(urlparse(link.attr("href") or "").query).get("page")
+        if pages and pages[0].isdigit():
+            return int(pages[0])
+    return None
+
+
+def extract_feline_categories(html, base_url, backend=None):
+    """
+    Categories of the Cornell feline health topics page. Returns None when
+    the expander container is missing.
+    """
+    doc = parse_html(html, backend)
+    expanders = doc.select("div.expander")
+    if not expanders:
+        return None
+
+    categories = []
+    for h3 in expanders[0].select("h3"):
+        subcategory_div = h3.next_sibling("div")
+        if not subcategory_div:
+            continue
+
+        subcategories = []
+        for link in subcategory_div.select("a"):
+            href = link.attr("href")
+            if href:
+                subcategories.append({"title": link.text(), "url": urljoin(base_url, href)})
+        categories.append({"title": h3.text(), "subcategories": subcategories})
+    return categories
+
+
+def iter_article_fragments(value, key=""):
+    """Article markup strings in a payload, in document order"""
+    if CHROME_KEY_PATTERN.search(key):
+        return
+    if isinstance(value, dict):
+        for child_key, child in value.items():
+            yield from iter_article_fragments(child, str(child_key))
+    elif isinstance(value, list):
+        for child in value:
+            yield from iter_article_fragments(child, key)
+    elif isinstance(value, str) and ARTICLE_FRAGMENT_PATTERN.search(value):
+        yield value
+
+
+def extract_next_data_article(html, min_chars=500):
+    """
+    Article title and markup fragments carried in a Merck topic page's
+    __NEXT_DATA__ payload, or None when the payload holds no article (less
+    than min_chars of markup)
+    """
+    data = load_next_data(html)
+    if not data:
+        return None
+    page_props = data.get("props", {}).get("pageProps", {})
+    fragments = []
+    for fragment in iter_article_fragments(page_props):
+        if fragment not in fragments:
+            fragments.append(fragment)
+    if sum(len(fragment) for fragment in fragments) < min_chars:
+        return None
+
+    match = TITLE_PATTERN.search(html)
+    title = match.group(1).strip() if match else ""
+    if " - " in title:
+        title = title.rsplit(" - ", 1)[0]
+    return {"title": title, "fragments": fragments}
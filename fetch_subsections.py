@@ -1,13 +1,253 @@
+import argparse
+import json
 import os
+import queue
+import re
+import shutil
+import signal
 import subprocess
-from pathlib import Path
+import threading
+import time
+from collections import deque
+
+from merge_shards import find_shard_files, merge_section_trees
+
+PROGRESS_PATTERN = re.compile(r"PROGRESS (\{.*\})\s*$")
+
+
+class ShardRun:
+    """One spider process (one shard) and the progress parsed from its output"""
+
+    def __init__(self, index, count, jobdir_root):
+        self.index = index
+        self.count = count
+        self.jobdir = os.path.join(jobdir_root, self.name)
+        self.process = None
+        self.restarts = 0
+        self.stopping = False
+        # Pages known and parsed by the job, as last reported by the spider;
+        # parsed only counts pages parsed while this supervisor runs
+        self.discovered = 0
+        self.done = 0
+        self.parsed = 0
+        # Only the tail of the log is kept, to show when the shard crashes
+        self.recent_lines = deque(maxlen=40)
+
+    @property
+    def name(self):
+        return f"shard-{self.index}-of-{self.count}"
+
+    def command(self):
+        command = [
+            "scrapy",
+            "crawl",
+            "merckvetmanual",
+            "-s",
+            f"JOBDIR={self.jobdir}",
+            "-s",
+            "LOG_LEVEL=INFO",
+        ]
+        if self.count > 1:
+            command += ["-a", f"shard={self.index}/{self.count}"]
+        return command
+
+    def clear_job(self):
+        """Forget the saved scheduler queue, seen requests and section tree"""
+        path = os.path.join("merck", self.jobdir)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+            print(f"Cleared job state of {self.name} ({path})")
+
+    def start(self, events):
+        self.process = subprocess.Popen(
+            self.command(),
+            cwd="merck",
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+        )
+        reader = threading.Thread(
+            target=read_output, args=(self, self.process, events), daemon=True
+        )
+        reader.start()
+
+    def stop(self):
+        """Ask Scrapy to shut down gracefully so the job can be resumed later"""
+        if self.process and self.process.poll() is None:
+            self.stopping = True
+            self.process.send_signal(signal.SIGINT)
+
+
+def read_output(shard, process, events):
+    """Forward each line of a spider's output to the supervisor as it arrives"""
+    for line in process.stdout:
+        events.put((shard, line))
+    process.stdout.close()
+
+
+class ProgressMeter:
+    """Pages/sec over a sliding window and an ETA for the remaining pages"""
+
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        self.timestamps = deque()
+        self.started = time.monotonic()
+
+    def record(self):
+        now = time.monotonic()
+        self.timestamps.append(now)
+        while self.timestamps and now - self.timestamps[0] > self.window_seconds:
+            self.timestamps.popleft()
+
+    def rate(self):
+        if not self.timestamps:
+            return 0.0
+        elapsed = min(self.window_seconds, time.monotonic() - self.started)
+        return len(self.timestamps) / max(elapsed, 1.0)
+
+    def eta(self, remaining):
+        rate = self.rate()
+        if not rate:
+            return None
+        return remaining / rate
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s"
+
+
+def handle_line(shard, line, meter):
+    """Update shard progress from one line of spider output"""
+    shard.recent_lines.append(line.rstrip())
+    match = PROGRESS_PATTERN.search(line)
+    if not match:
+        return
+
+    try:
+        event = json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return
+
+    # Totals replace the earlier ones: a restarted shard reports the pages
+    # of its job again, which must not be counted twice
+    if "total" in event:
+        shard.discovered = event["total"]
+        shard.done = event.get("done", shard.done)
+    if event.get("event") == "parsed":
+        shard.parsed += 1
+        meter.record()
+
+
+def supervise(shards, max_seconds=None, max_pages=None, max_restarts=2):
+    """
+    Run all shards, stream their output and print live progress. Shards that
+    crash are restarted from their JOBDIR; when the time or page budget runs
+    out every shard is stopped gracefully. Returns the shards that failed
+    and whether the budget stopped the crawl.
+    """
+    events = queue.Queue()
+    meter = ProgressMeter()
+    started = time.monotonic()
+    budget_exceeded = False
+    last_report = 0
+    failed = []
+
+    for shard in shards:
+        print(f"Starting {shard.name} (job dir {shard.jobdir})")
+        shard.start(events)
+
+    running = list(shards)
+    while running:
+        try:
+            shard, line = events.get(timeout=1)
+            handle_line(shard, line, meter)
+        except queue.Empty:
+            pass
+
+        parsed = sum(shard.parsed for shard in shards)
+        done = sum(shard.done for shard in shards)
+        discovered = sum(shard.discovered for shard in shards)
+        elapsed = time.monotonic() - started
+
+        if not budget_exceeded and (
+            (max_seconds and elapsed >= max_seconds)
+            or (max_pages and parsed >= max_pages)
+        ):
+            budget_exceeded = True
+            print("\nBudget reached, stopping all shards (resume with the same command)")
+            for shard in running:
+                shard.stop()
+
+        if time.monotonic() - last_report >= 5:
+            last_report = time.monotonic()
+            remaining = max(discovered - done, 0)
+            print(
+                f"[{format_duration(elapsed)}] pages {done}/{discovered}, "
+                f"{meter.rate():.2f} pages/s, ETA {format_duration(meter.eta(remaining))}"
+            )
+
+        for shard in list(running):
+            returncode = shard.process.poll()
+            if returncode is None:
+                continue
+
+            running.remove(shard)
+            if returncode == 0 or shard.stopping:
+                print(f"{shard.name} finished ({shard.parsed} pages parsed)")
+                continue
+
+            print(f"{shard.name} exited with code {returncode}. Last output:")
+            for recent_line in list(shard.recent_lines)[-10:]:
+                print(f"    {recent_line}")
+
+            if shard.restarts < max_restarts and not budget_exceeded:
+                shard.restarts += 1
+                print(f"Restarting {shard.name} ({shard.restarts}/{max_restarts})")
+                shard.start(events)
+                running.append(shard)
+            else:
+                failed.append(shard)
+
+    return failed, budget_exceeded
+
+
+def summarize_output(output_path):
+    if not os.path.exists(output_path):
+        print(f"\nIssue detected: {output_path} was not created.")
+        return
+
+    with open(output_path, "r", encoding="utf-8") as f:
+        sections = json.load(f)
+    total_subsections = sum(len(section["subsections"]) for section in sections)
+    print(f"\nSections: {len(sections)}, subsections: {total_subsections}")
+    print(f"Final data saved to: {os.path.abspath(output_path)}")
+
+
+def merge_shard_outputs(shard_count, output_path):
+    trees = []
+    for index, count, path in find_shard_files("merck"):
+        if count == shard_count:
+            with open(path, "r", encoding="utf-8") as f:
+                trees.append(json.load(f))
+
+    merged = merge_section_trees(trees)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+    print(f"Merged {len(trees)} shard outputs into {output_path}")
 
 
 def main():
     """
     Run the Merck Veterinary Manual spider to fetch subsections for each main section.
     This script first checks if the initial sections have been crawled,
-    then runs the spider in subsection mode.
+    then supervises one spider process per shard with live progress.
     """
     sections_path = os.path.join("merck", "merck_sections.json")
     if not os.path.exists(sections_path):
@@ -16,59 +256,68 @@ def main():
         )
         return
     print("sections_path: ", sections_path)
-    
-    # Create section_data directory if it doesn't exist
-    output_dir = os.path.join("merck", "section_data")
-    Path(output_dir).mkdir(exist_ok=True)
+
+    parser = argparse.ArgumentParser(description="Run the Merck subsection crawler")
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the crawl into this many concurrent spider processes",
+    )
+    parser.add_argument(
+        "--max-seconds", type=int, help="Stop all shards after this many seconds"
+    )
+    parser.add_argument(
+        "--max-pages", type=int, help="Stop all shards after this many parsed pages"
+    )
+    parser.add_argument(
+        "--max-restarts",
+        type=int,
+        default=2,
+        help="How often a crashed shard is restarted from its job directory",
+    )
+    parser.add_argument(
+        "--jobdir-root",
+        default="crawls",
+        help="Job directories, relative to merck/, one per shard",
+    )
+    parser.add_argument(
+        "--fresh",
+        action="store_true",
+        help="Start a new crawl instead of resuming the shards' job directories",
+    )
+    args = parser.parse_args()
 
     print("Starting subsection crawler...")
-    
-    # Change directory to merck folder and run scrapy command in debug mode
-    current_dir = os.getcwd()
-    os.chdir("merck")
-    
+    shards = [ShardRun(index, args.shards, args.jobdir_root) for index in range(args.shards)]
+    if args.fresh:
+        for shard in shards:
+            shard.clear_job()
+
     try:
-        # Run with LOG_LEVEL=DEBUG to see detailed output
-        result = subprocess.run(
-            ["scrapy", "crawl", "merckvetmanual", "-a", "scrape_subsections=true", "--set", "LOG_LEVEL=DEBUG"],
-            text=True,
-            capture_output=True
+        failed, budget_exceeded = supervise(
+            shards, args.max_seconds, args.max_pages, args.max_restarts
         )
-        
-        print("Crawler output (summary):")
-        # Extract key parts from the output
-        output_lines = result.stdout.split('\n')
-        for line in output_lines:
-            if "Found main subsection:" in line or "Found subsection:" in line or "Method" in line:
-                print(line)
-        
-        # Change back to original directory
-        os.chdir(current_dir)
-        
-        if result.returncode == 0:
-            print("\nSuccessfully completed subsection crawling!")
-            
-            # Count the number of JSON files created
-            json_files = list(Path(output_dir).glob("*.json"))
-            print(f"Created {len(json_files)} subsection JSON files in {output_dir}")
-            
-            # Check contents of a sample file
-            if json_files:
-                sample_file = json_files[0]
-                print(f"\nSample content from {sample_file}:")
-                with open(sample_file, 'r') as f:
-                    print(f.read()[:500] + "..." if os.path.getsize(sample_file) > 500 else f.read())
-            
-            if len(json_files) == 0:
-                print("\nIssue detected: No JSON files were created.")
-                print("Error output:")
-                print(result.stderr)
-        else:
-            print("Error running the crawler:")
-            print(result.stderr)
-    except Exception as e:
-        print(f"Exception occurred: {e}")
-        os.chdir(current_dir)
+    except KeyboardInterrupt:
+        # Ctrl+C already reached the spiders, which shut down gracefully
+        print("\nInterrupted, waiting for all shards to stop...")
+        for shard in shards:
+            shard.process.wait()
+        return
+
+    output_path = os.path.join("merck", "merck_manual_final.json")
+    if failed:
+        print(f"\nError: {', '.join(shard.name for shard in failed)} failed")
+        return
+
+    if args.shards > 1:
+        merge_shard_outputs(args.shards, output_path)
+    if budget_exceeded:
+        print("\nThe budget stopped the crawl before it finished; the tree below is partial.")
+        print("Run the same command again to resume it.")
+    else:
+        print("\nSuccessfully completed subsection crawling!")
+    summarize_output(output_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+# fingerprint.py - Content fingerprints to skip pages that did not change
+#
+#   python full.py --refresh            # re-check indexed pages, re-print changed ones
+#   python fingerprint.py URL [URL]     # fingerprint pages, compare two
+#
+# A page's article text (its __NEXT_DATA__ article on Merck topic pages,
+# otherwise the text of its main content) is normalized and fingerprinted
+# twice: a SHA-256 that matches only identical text, and a 64-bit SimHash of
+# its word shingles that differs in few bits when the text changed a little.
+# Fingerprints are stored with the index entries; on a refresh a page whose
+# hash still matches is not printed again, and every page is counted as
+# unchanged, minor change (SimHash within MINOR_CHANGE_BITS) or major change.
+
+import argparse
+import hashlib
+import html
+import re
+from collections import Counter
+
+import requests
+
+from browser import USER_AGENT
+from extractors import extract_next_data_article
+from url_canon import canonicalize_url
+
+# SimHashes differing in at most this many bits are near-duplicates
+MINOR_CHANGE_BITS = 3
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+INVISIBLE_PATTERN = re.compile(
+    r"<(script|style|noscript|template|svg|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL
+)
+MAIN_PATTERN = re.compile(r"<main\b[^>]*>(.*)</main\s*>", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def html_to_text(markup):
+    markup = INVISIBLE_PATTERN.sub(" ", markup)
+    return html.unescape(TAG_PATTERN.sub(" ", markup))
+
+
+def article_text(article):
+    """The text of a __NEXT_DATA__ article (extractors.extract_next_data_article)"""
+    return html_to_text(" ".join(article["fragments"]))
+
+
+def page_text(page_html):
+    """The article text of a page: its __NEXT_DATA__ article, its <main>, or its body"""
+    article = extract_next_data_article(page_html)
+    if article:
+        return article_text(article)
+    match = MAIN_PATTERN.search(page_html)
+    return html_to_text(match.group(1) if match else page_html)
+
+
+def article_fingerprint(page_html):
+    """
+    Fingerprint of a page's __NEXT_DATA__ article, or None when it has none.
+    The payload is the same in the served and the rendered page, so this
+    matches fetch_fingerprint() on either.
+    """
+    article = extract_next_data_article(page_html)
+    return fingerprint_text(article_text(article)) if article else None
+
+
+def normalize_text(text):
+    """Lower-cased words separated by single spaces"""
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def simhash(words, bits=SIMHASH_BITS, shingle=SHINGLE_WORDS):
+    """SimHash of the word shingles of a list of words"""
+    weights = [0] * bits
+    for i in range(max(len(words) - shingle + 1, 1)):
+        feature = " ".join(words[i : i + shingle]).encode("utf-8")
+        value = int.from_bytes(hashlib.blake2b(feature, digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+def fingerprint_text(text):
+    """{"sha256", "simhash"} of a page's text, or None when it has no words"""
+    normalized = normalize_text(text)
+    if not normalized:
+        return None
+    return {
+        "sha256": hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+        "simhash": f"{simhash(normalized.split()):016x}",
+    }
+
+
+def fetch_fingerprint(url, throttle=None, timeout=30):
+    """Fingerprint of a page fetched over plain HTTP, or None if that fails"""
+    if throttle:
+        throttle.wait()
+    try:
+        response = requests.get(url, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+    except requests.RequestException as e:
+        if throttle:
+            throttle.record(0.0, error=True)
+        print(f"Could not fetch {url} for its fingerprint: {e}")
+        return None
+    if throttle:
+        throttle.record(response.elapsed.total_seconds(), status=response.status_code)
+    if response.status_code != 200:
+        return None
+    return fingerprint_text(page_text(response.text))
+
+
+def hamming_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def classify_change(old, new, minor_bits=MINOR_CHANGE_BITS):
+    """
+    "unchanged", "minor" or "major" between two fingerprints, or "unknown"
+    when either is missing
+    """
+    if not old or not new:
+        return "unknown"
+    if old["sha256"] == new["sha256"]:
+        return "unchanged"
+    if hamming_distance(old["simhash"], new["simhash"]) <= minor_bits:
+        return "minor"
+    return "major"
+
+
+class ChangeTracker:
+    """
+    Fingerprints from the previous run's index and how each page checked
+    since then changed; a page checked twice (a retry) counts once
+    """
+
+    def __init__(self, entries=()):
+        self.previous = {canonicalize_url(entry["url"]): entry for entry in entries}
+        self.changes = {}
+
+    def previous_entry(self, url):
+        return self.previous.get(canonicalize_url(url))
+
+    def check(self, url, fingerprint):
+        """How a page changed: "new" if it was not indexed before, else classify_change()"""
+        entry = self.previous_entry(url)
+        change = "new" if entry is None else classify_change(entry.get("fingerprint"), fingerprint)
+        self.changes[canonicalize_url(url)] = change
+        return change
+
+    def summary(self):
+        counts = Counter(self.changes.values())
+        return ", ".join(
+            f"{change} {counts[change]}"
+            for change in ("unchanged", "minor", "major", "unknown", "new")
+            if counts[change] or change in ("unchanged", "minor", "major")
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint the article text of pages")
+    parser.add_argument("urls", nargs="+")
+    args = parser.parse_args()
+
+    fingerprints = [fetch_fingerprint(url) for url in args.urls]
+    for url, fingerprint in zip(args.urls, fingerprints):
+        if fingerprint:
+            print(f"{fingerprint['sha256'][:16]} {fingerprint['simhash']} {url}")
+        else:
+            print(f"(no text) {url}")
+    if len(fingerprints) == 2:
+        print(f"Change between them: {classify_change(*fingerprints)}")
+
+
+if __name__ == "__main__":
+    main()
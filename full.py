@@ -1,23 +1,33 @@
 # full.py - Combined crawler and downloader
 
-import base64
+import argparse
 import json
 import os
 import re
-import time
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse
 
 import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
+
+from article_render import render_article_pdf
+from browser import DEFAULT_PRINT_OPTIONS, chrome_options
+from extractors import extract_content_links, extract_sections
+from fingerprint import (
+    ChangeTracker,
+    article_fingerprint,
+    article_text,
+    fetch_fingerprint,
+    fingerprint_text,
+)
+from link_graph import LinkGraph
+from pipeline import Pipeline, Stage
+from print_profiles import PRINT_PROFILES, PrintProfile
+from render_service import RenderError, get_renderer
+from retry import DeferredRetries, render_with_retry
+from snapshot_print import snapshot_path_for
+from throttle import host_throttle
+from url_canon import SeenSet, canonicalize_url
+from work_queue import append_to_index
 
 # List of sections to ignore
 IGNORED_SECTIONS = ["Behavior", "Poultry", "Special Subjects", "Public Health"]
@@ -112,47 +122,14 @@ def scrape_merck_vet_manual_sections():
             print(f"Failed to retrieve the page: Status code {response.status_code}")
             return []
 
-        # Look for the data in the __NEXT_DATA__ script tag
-        match = re.search(
-            r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>',
-            response.text,
-            re.DOTALL,
-        )
-
-        if not match:
-            print("Could not find __NEXT_DATA__ script")
+        # Sections come from the __NEXT_DATA__ payload, with a CSS fallback
+        sections = extract_sections(response.text)
+        if not sections:
+            print("Could not find any sections on the page")
             return []
 
-        try:
-            data = json.loads(match.group(1))
-            # Navigate to the section data in the JSON structure
-            section_data = (
-                data.get("props", {})
-                .get("pageProps", {})
-                .get("componentProps", {})
-                .get("eb190e7b-5914-4f3d-91a8-3fa8542b6178", {})
-                .get("data", [])
-            )
-
-            # Extract the sections
-            sections = []
-            for item in section_data:
-                title = item.get("titlecomputed_t", "")
-                path = item.get("relativeurlcomputed_s", "")
-
-                if title and path:
-                    url = f"https://www.merckvetmanual.com{path}"
-                    sections.append({"title": title, "url": url})
-
-            print(f"Found {len(sections)} sections from the Merck Veterinary Manual")
-            return sections
-
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON data: {e}")
-            return []
-        except Exception as e:
-            print(f"An error occurred during scraping: {e}")
-            return []
+        print(f"Found {len(sections)} sections from the Merck Veterinary Manual")
+        return sections
 
     except Exception as e:
         print(f"Error during request: {e}")
@@ -206,158 +183,88 @@ def strip_url_fragment(url):
     return clean_url
 
 
-def handle_cookie_consent(driver):
-    """Handle cookie consent modals if they appear"""
-    try:
-        selectors = [
-            "button.Accept.All.Cookies",
-            ".Accept.All.Cookies",
-            "button[aria-label*='Accept All Cookies']",
-            "button:contains('Accept All')",
-            "#onetrust-accept-btn-handler",
-            ".accept-all-cookies",
-            ".accept-cookies-button",
-            "button.accept-cookies",
-        ]
-
-        for selector in selectors:
-            try:
-                cookie_button = WebDriverWait(driver, 2).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, selector))
-                )
-                print(f"Found cookie button with selector: {selector}")
-                cookie_button.click()
-                time.sleep(1)
-                return True
-            except:
-                continue
-
-        # Try looking for buttons with text
-        cookie_button_texts = [
-            "Accept All Cookies",
-            "Accept All",
-            "Accept",
-            "I Agree",
-            "OK",
-            "Got it",
-        ]
-
-        try:
-            buttons = driver.find_elements(By.TAG_NAME, "button")
-            for button in buttons:
-                button_text = button.text.strip()
-                if button_text and any(
-                    accept_text.lower() in button_text.lower()
-                    for accept_text in cookie_button_texts
-                ):
-                    print(f"Found cookie button with text: {button_text}")
-                    button.click()
-                    time.sleep(1)
-                    return True
-        except:
-            pass
-
-        # JavaScript approach
-        try:
-            # Remove consent dialogs
-            for consent_id in [
-                "#cookie-consent",
-                "#cookie-banner",
-                ".cookie-banner",
-                "#cookie-notice",
-            ]:
-                driver.execute_script(
-                    f"var element = document.querySelector('{consent_id}'); if(element) element.remove();"
-                )
-
-            # Click accept button
-            driver.execute_script(
-                """
-                var buttons = document.querySelectorAll('button');
-                for(var i=0; i<buttons.length; i++) {
-                    if(buttons[i].textContent.indexOf('Accept') !== -1 || 
-                       buttons[i].textContent.indexOf('accept') !== -1 ||
-                       buttons[i].textContent.indexOf('Allow') !== -1) {
-                        buttons[i].click();
-                        return;
-                    }
-                }
-            """
-            )
-
-            # Set cookies directly
-            driver.execute_script(
-                """
-                document.cookie = "cookieConsent=true; path=/;";
-                document.cookie = "cookies_accepted=true; path=/;";
-            """
-            )
-
-            return True
-        except:
-            print("JavaScript attempts to handle cookie consent failed")
-            return False
-
-    except Exception as e:
-        print(f"Error handling cookie consent: {e}")
-        return False
-
-
-def save_page_as_pdf(driver, title, url, output_dir="pdfs"):
-    """Save the current page as a PDF using Chrome's built-in print functionality"""
-    try:
-        Path(output_dir).mkdir(exist_ok=True)
-        safe_title = clean_filename(title)
-        filepath = os.path.join(output_dir, f"{safe_title}.pdf")
-
-        print(f"Saving PDF for: {title}")
-
-        # Navigate to the URL
-        driver.get(url)
+def load_page(renderer, url, throttle=None, settle=0):
+    """
+    Render a page at the pace set by the throttle, handling the cookie
+    consent, and return its HTML. The page load time (or failure) is fed
+    back to the throttle so it can speed up or back off, and a timeout or
+    crash is retried once.
+    """
+    result = render_with_retry(
+        renderer, url, throttle, return_html=True, cookie_consent=True, settle=settle
+    )
+    return result["html"]
+
+
+def print_page(
+    renderer,
+    title,
+    url,
+    output_dir="pdfs",
+    throttle=None,
+    snapshot=False,
+    template=False,
+    profile=None,
+):
+    """
+    Save a page as a PDF using Chrome's built-in print functionality and
+    return its path and the fingerprint of its __NEXT_DATA__ article (None
+    when it has none). With snapshot=True only an MHTML snapshot is
+    saved, for snapshot_print.py to print to the returned PDF path later. With
+    template=True the page is printed from its article data
+    (article_render.py) when it has any. A PrintProfile strips the page
+    before printing and records the PDF's size and print time. Timeouts,
+    crashes and 5xx responses are retried once; after that the RenderError
+    is raised.
+    """
+    Path(output_dir).mkdir(exist_ok=True)
+    safe_title = clean_filename(title)
+    filepath = os.path.join(output_dir, f"{safe_title}.pdf")
 
-        # Handle cookie consent
-        handle_cookie_consent(driver)
+    print(f"Saving PDF for: {title}")
 
-        # Wait for page to load
+    if template and not snapshot:
         try:
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            result = render_article_pdf(renderer, url, filepath, throttle, profile=profile)
+        except RenderError as e:
+            print(f"Template print failed ({e}), printing the live page")
+            result = None
+        if result:
+            if profile:
+                profile.record(result)
+            print(
+                f"PDF saved to: {filepath} (article template, {result['pdf_bytes']} bytes "
+                f"in {result['timings']['total']:.1f}s)"
             )
-        except TimeoutException:
-            print("Timeout waiting for page to load. Continuing anyway...")
-
-        # Additional time for JavaScript rendering
-        time.sleep(2)
-
-        # Generate PDF
-        pdf_data = driver.execute_cdp_cmd(
-            "Page.printToPDF",
-            {
-                "printBackground": True,
-                "preferCSSPageSize": True,
-                "marginTop": 0.4,
-                "marginBottom": 0.4,
-                "marginLeft": 0.4,
-                "marginRight": 0.4,
-                "scale": 0.9,
-            },
-        )
-
-        # Save the PDF
-        with open(filepath, "wb") as file:
-            file.write(base64.b64decode(pdf_data["data"]))
+            return filepath, fingerprint_text(article_text(result["article"]))
+
+    if snapshot:
+        target = {"snapshot_path": snapshot_path_for(filepath)}
+    else:
+        target = {"pdf_path": filepath}
+
+    if profile:
+        target.update(profile.render_options(DEFAULT_PRINT_OPTIONS))
+
+    # Handle cookie consent, then give JavaScript extra time to render
+    result = render_with_retry(
+        renderer,
+        url,
+        throttle,
+        cookie_consent=True,
+        settle=2,
+        error_screenshot=f"error_screenshot_{safe_title}.png",
+        return_html=True,
+        **target,
+    )
+    if profile:
+        profile.record(result)
 
+    if snapshot:
+        print(f"Snapshot saved to: {target['snapshot_path']}")
+    else:
         print(f"PDF saved to: {filepath}")
-        return filepath
-    except Exception as e:
-        print(f"Error saving PDF: {e}")
-        try:
-            screenshot_path = f"error_screenshot_{clean_filename(title)}.png"
-            driver.save_screenshot(screenshot_path)
-            print(f"Error screenshot saved to: {screenshot_path}")
-        except:
-            pass
-        return None
+    return filepath, article_fingerprint(result["html"])
 
 
 def clean_filename(text):
@@ -369,71 +276,136 @@ def clean_filename(text):
     return clean
 
 
-def extract_content_from_page(driver, url, base_section_path):
+def extract_content_from_page(html, url, base_section_path):
     """Extract links from a page that match criteria for being content"""
-    links = driver.find_elements(By.TAG_NAME, "a")
     content_links = []
-    base_url = "https://www.merckvetmanual.com"
 
-    # Keep track of URLs we've already seen (without fragments)
+    # Keep track of URLs we've already seen (canonical form, so fragments,
+    # trailing slashes and tracking parameters don't make a page look new)
     seen_urls = set()
 
-    for link in links:
-        try:
-            href = link.get_attribute("href")
-            text = link.text.strip()
-
-            # Skip if already processed this link (without the fragment)
-            if href:
-                clean_href = strip_url_fragment(href)
-                if clean_href in seen_urls:
-                    continue
-                seen_urls.add(clean_href)
-
-            # Filter links: internal, non-empty text, related to the section, not navigation
-            if (
-                href
-                and text
-                and len(text) > 3
-                and href.startswith(base_url)
-                and href != url
-                and not any(
-                    x in text.lower()
-                    for x in [
-                        "veterinary",
-                        "pet owners",
-                        "resources",
-                        "quizzes",
-                        "about",
-                        "contact",
-                        "disclaimer",
-                        "privacy",
-                        "terms",
-                        "cookie",
-                        "licensing",
-                        "copyright",
-                    ]
-                )
-            ):
-                # Check if the title is relevant (includes cats/dogs or is general)
-                if is_relevant_title(text) and base_section_path in href:
-                    # Store only the base URL without fragments
-                    content_links.append(
-                        {
-                            "title": text,
-                            "url": clean_href,
-                            "original_url": href,  # Keep original for reference
-                        }
-                    )
-        except Exception as e:
-            print(f"Error processing link: {e}")
+    # Parse the rendered page in one go instead of querying every link element
+    for link in extract_content_links(html, url, base_section_path):
+        clean_href = strip_url_fragment(link["url"])
+        canonical_href = canonicalize_url(clean_href)
+        if canonical_href in seen_urls:
             continue
+        seen_urls.add(canonical_href)
+
+        # Check if the title is relevant (includes cats/dogs or is general)
+        if is_relevant_title(link["title"]):
+            # Store only the base URL without fragments
+            content_links.append(
+                {
+                    "title": link["title"],
+                    "url": clean_href,
+                    "original_url": link["url"],  # Keep original for reference
+                }
+            )
 
     return content_links
 
 
-def download_pdfs_and_build_index():
-    """Main function to download PDFs and build an index"""
+def record_links(graph, source_url, links, strategy):
+    """Keep the links found on a page in the link graph, in canonical form"""
+    graph.add_links(
+        canonicalize_url(source_url),
+        [{"url": canonicalize_url(link["url"]), "title": link["title"]} for link in links],
+        strategy,
+    )
+
+
+def by_rank(graph, items):
+    """
+    Items with a url, best-linked pages first (PageRank, then in-degree);
+    items with equal scores keep their order
+    """
+    return sorted(items, key=lambda item: graph.score(canonicalize_url(item["url"])), reverse=True)
+
+
+def check_for_changes(changes, candidate, page_url, throttle=None, snapshot=False):
+    """
+    Fingerprint a page's text and compare it with the last run's index.
+    Returns the fingerprint and whether printing can be skipped: the text is
+    unchanged and the PDF (or snapshot) is still on disk. Pages the index
+    does not have are not fetched here; see page_fingerprint().
+    """
+    previous = changes.previous_entry(candidate["url"])
+    if previous is None:
+        changes.check(candidate["url"], None)
+        return None, False
+    fingerprint = fetch_fingerprint(page_url, throttle)
+    change = changes.check(candidate["url"], fingerprint)
+    output_path = snapshot_path_for(previous["pdf_path"]) if snapshot else previous["pdf_path"]
+    if change == "unchanged" and os.path.exists(output_path):
+        print(f"Unchanged since the last run: {candidate['title']}")
+        return fingerprint, True
+    print(f"Change since the last run ({change}): {candidate['title']}")
+    return fingerprint, False
+
+
+def page_fingerprint(page_url, printed_fingerprint, throttle=None):
+    """
+    Fingerprint for a newly printed page, from the same source a refresh
+    uses: the article print_page() found, else the page over plain HTTP
+    """
+    return printed_fingerprint or fetch_fingerprint(page_url, throttle)
+
+
+def store_index_entry(index_path, pdf_index, entry, previous=None):
+    """
+    Add an entry to the index file, or put it in place of the previous run's
+    entry, and mirror that in pdf_index. The file is updated under the lock
+    queue workers use (work_queue.append_to_index), so their entries are
+    never overwritten. Returns False when another process indexed the URL.
+    """
+    if not append_to_index(
+        index_path,
+        entry,
+        replace=previous is not None,
+        key=lambda item: canonicalize_url(item["url"]),
+    ):
+        print(f"Already indexed by another process: {entry['url']}")
+        return False
+    if previous is not None and previous in pdf_index:
+        pdf_index[pdf_index.index(previous)] = entry
+    else:
+        pdf_index.append(entry)
+    return True
+
+
+def build_index_entry(candidate, pdf_path, fingerprint=None):
+    """
+    Index entry for a printed page: the candidate's fields plus pdf_path and
+    the content fingerprint, in index order
+    """
+    entry = {"title": candidate["title"]}
+    if "full_title" in candidate:
+        entry["full_title"] = candidate["full_title"]
+    entry["url"] = candidate["url"]
+    if "original_url" in candidate:
+        entry["original_url"] = candidate["original_url"]
+    entry["pdf_path"] = pdf_path
+    for key in ("parent_section", "parent_subsection"):
+        if key in candidate:
+            entry[key] = candidate[key]
+    entry["type"] = candidate["type"]
+    if fingerprint:
+        entry["fingerprint"] = fingerprint
+    return entry
+
+
+def download_pdfs_and_build_index(
+    snapshot=False, template=False, print_profile="merck", refresh=False
+):
+    """
+    Main function to download PDFs and build an index. In snapshot mode pages
+    are saved as snapshots and listed in snapshot_index.json instead, and
+    snapshot_print.py prints them. In template mode topic pages are printed
+    from their article data, other pages live. Live pages are printed with
+    the named print profile (print_profiles.py). With refresh, pages already
+    in the index are checked again and printed only if their text changed.
+    """
     # Create output directories
     output_dir = "merck_data"
     pdf_dir = os.path.join(output_dir, "pdfs")
@@ -449,28 +421,30 @@ def download_pdfs_and_build_index():
         json.dump(sections, f, indent=2, ensure_ascii=False)
     print(f"Saved {len(sections)} sections to {sections_path}")
 
-    # Initialize Chrome WebDriver
-    chrome_options = Options()
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument(
-        "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    )
+    # Render in-process, or through render_service.py when RENDER_SERVICE_URL is set
+    renderer = get_renderer(chrome_options())
 
-    print("Initializing Chrome WebDriver...")
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()), options=chrome_options
+    # Adaptive pacing between page loads, never faster than robots.txt or the
+    # machine-wide rate limit for the host allows
+    throttle = host_throttle(
+        "https://www.merckvetmanual.com", max_concurrency=1, start_delay=1.0, min_delay=0.5
     )
 
+    # Links between pages, for crawl priorities (see link_graph.py)
+    graph = LinkGraph(os.path.join(output_dir, "link_graph.db"))
+
+    # Page furniture to strip before printing; PDF sizes are logged per page
+    profile = PrintProfile(print_profile, os.path.join(output_dir, "print_stats.jsonl"))
+
     # PDF tracking data
     pdf_index = []
 
     try:
         # Check for existing index file
-        index_path = os.path.join(output_dir, "pdf_index.json")
+        pdf_index_path = os.path.join(output_dir, "pdf_index.json")
+        index_path = pdf_index_path
+        if snapshot:
+            index_path = os.path.join(output_dir, "snapshot_index.json")
         if os.path.exists(index_path):
             print(f"Loading existing PDF index from {index_path}")
             with open(index_path, "r") as f:
@@ -482,6 +456,7 @@ def download_pdfs_and_build_index():
             s for s in sections if s.get("title") not in IGNORED_SECTIONS
         ]
         ignored_count = len(sections) - len(filtered_sections)
+        filtered_sections = by_rank(graph, filtered_sections)
 
         print(
             f"Starting the process with {len(filtered_sections)} sections (ignored {ignored_count} sections)"
@@ -491,9 +466,21 @@ def download_pdfs_and_build_index():
             f"Filtering content to focus on cats and dogs, excluding: {', '.join(EXCLUDED_ANIMALS[:10])}..."
         )
 
-        # Create sets of processed URLs to avoid duplicates
-        # Remove fragments from existing URLs for comparison
-        processed_urls = {strip_url_fragment(entry["url"]) for entry in pdf_index}
+        # Content fingerprints of the last run (see fingerprint.py)
+        changes = ChangeTracker(pdf_index)
+
+        # Processed URLs, compared in canonical form; the set switches to a
+        # Bloom filter when it grows large so memory stays bounded. A refresh
+        # starts empty so indexed pages are checked for changes.
+        processed_urls = SeenSet()
+        if not refresh:
+            for entry in pdf_index:
+                processed_urls.add(entry["url"])
+        if snapshot and os.path.exists(pdf_index_path):
+            # Pages already printed need no snapshot
+            with open(pdf_index_path, "r", encoding="utf-8") as f:
+                for entry in json.load(f):
+                    processed_urls.add(entry["url"])
 
         # Statistics tracking
         stats = {
@@ -506,6 +493,55 @@ def download_pdfs_and_build_index():
             "skipped_irrelevant": 0,
         }
 
+        # Pages that still fail after a quick retry get one more try at the end
+        deferred = DeferredRetries()
+
+        def save_and_index(candidate, page_url, stat_key, final=False):
+            """
+            Print a page and add it to the index, or defer it if it failed.
+            A page from the last run whose text is unchanged is not printed.
+            """
+            fingerprint, unchanged = check_for_changes(
+                changes, candidate, page_url, throttle, snapshot
+            )
+            if unchanged:
+                processed_urls.add(candidate["url"])
+                return
+
+            try:
+                pdf_path, printed_fingerprint = print_page(
+                    renderer,
+                    candidate.get("full_title", candidate["title"]),
+                    page_url,
+                    pdf_dir,
+                    throttle,
+                    snapshot,
+                    template,
+                    profile,
+                )
+            except Exception as e:
+                print(f"Error saving PDF: {e}")
+                if final:
+                    deferred.fail(e)
+                elif deferred.add((candidate, page_url, stat_key), e):
+                    print("Will retry at the end of the run")
+                return
+
+            # Written to the index file right away to prevent data loss
+            stored = store_index_entry(
+                index_path,
+                pdf_index,
+                build_index_entry(
+                    candidate,
+                    pdf_path,
+                    fingerprint or page_fingerprint(page_url, printed_fingerprint, throttle),
+                ),
+                changes.previous_entry(candidate["url"]),
+            )
+            processed_urls.add(candidate["url"])
+            if stored:
+                stats[stat_key] += 1
+
         # Process each section
         total_sections = len(filtered_sections)
         for section_idx, section in enumerate(filtered_sections, 1):
@@ -526,49 +562,32 @@ def download_pdfs_and_build_index():
             # Add section to index if not already processed
             clean_section_url = strip_url_fragment(section_url)
             if clean_section_url not in processed_urls:
-                # Download section PDF
-                section_pdf_path = save_page_as_pdf(
-                    driver, section_title, section_url, pdf_dir
+                # Download section PDF and add it to the index
+                save_and_index(
+                    {"type": "section", "title": section_title, "url": clean_section_url},
+                    section_url,
+                    "sections_downloaded",
                 )
-
-                # Add to index
-                if section_pdf_path:
-                    section_entry = {
-                        "title": section_title,
-                        "url": clean_section_url,
-                        "pdf_path": section_pdf_path,
-                        "type": "section",
-                    }
-                    pdf_index.append(section_entry)
-                    processed_urls.add(clean_section_url)
-                    stats["sections_downloaded"] += 1
-
-                    # Save index after each PDF to prevent data loss
-                    with open(index_path, "w", encoding="utf-8") as f:
-                        json.dump(pdf_index, f, indent=2, ensure_ascii=False)
             else:
                 print(f"Section already processed: {section_title}")
 
             # Extract subsections
             section_path = section_url.split("merckvetmanual.com")[1]
 
-            # Navigate to the section page
-            driver.get(section_url)
-            handle_cookie_consent(driver)
-
-            # Wait for page to load
+            # Render the section page; one missing section does not stop the run
             try:
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-            except TimeoutException:
-                print("Timeout waiting for section page to load. Continuing anyway...")
-
-            time.sleep(3)
+                section_html = load_page(renderer, section_url, throttle, settle=3)
+            except RenderError as e:
+                print(f"Error loading section {section_title}: {e}")
+                deferred.fail(e)
+                continue
 
             # Extract links
             print("Extracting subsections...")
-            subsections = extract_content_from_page(driver, section_url, section_path)
+            subsections = extract_content_from_page(
+                section_html, section_url, section_path
+            )
+            record_links(graph, section_url, subsections, "section")
 
             # Filter to valid subsections
             base_url = "https://www.merckvetmanual.com"
@@ -583,6 +602,7 @@ def download_pdfs_and_build_index():
             print(
                 f"Found {len(filtered_subsections)} relevant subsections for {section_title}"
             )
+            filtered_subsections = by_rank(graph, filtered_subsections)
 
             # Process each subsection
             for sub_idx, subsection in enumerate(filtered_subsections, 1):
@@ -603,49 +623,29 @@ def download_pdfs_and_build_index():
                 # Add subsection to index if not already processed
                 clean_subsection_url = strip_url_fragment(subsection_url)
                 if clean_subsection_url not in processed_urls:
-                    # Download subsection PDF
-                    subsection_pdf_path = save_page_as_pdf(
-                        driver,
-                        f"{section_title} - {subsection_title}",
-                        subsection_url,
-                        pdf_dir,
-                    )
-
-                    # Add to index
-                    if subsection_pdf_path:
-                        subsection_entry = {
+                    # Download subsection PDF and add it to the index
+                    save_and_index(
+                        {
+                            "type": "subsection",
                             "title": subsection_title,
                             "full_title": f"{section_title} - {subsection_title}",
                             "url": clean_subsection_url,
-                            "pdf_path": subsection_pdf_path,
                             "parent_section": section_title,
-                            "type": "subsection",
-                        }
-                        pdf_index.append(subsection_entry)
-                        processed_urls.add(clean_subsection_url)
-                        stats["subsections_downloaded"] += 1
-
-                        # Save index after each PDF
-                        with open(index_path, "w", encoding="utf-8") as f:
-                            json.dump(pdf_index, f, indent=2, ensure_ascii=False)
+                        },
+                        subsection_url,
+                        "subsections_downloaded",
+                    )
                 else:
                     print(f"Subsection already processed: {subsection_title}")
 
                 # Find in-depth links in the subsection
-                # Navigate to the subsection page
-                driver.get(subsection_url)
-                handle_cookie_consent(driver)
-
+                # Render the subsection page
                 try:
-                    WebDriverWait(driver, 10).until(
-                        EC.presence_of_element_located((By.TAG_NAME, "body"))
-                    )
-                except TimeoutException:
-                    print(
-                        "Timeout waiting for subsection page to load. Continuing anyway..."
-                    )
-
-                time.sleep(2)
+                    subsection_html = load_page(renderer, subsection_url, throttle, settle=2)
+                except RenderError as e:
+                    print(f"Error loading subsection {subsection_title}: {e}")
+                    deferred.fail(e)
+                    continue
 
                 # Look for in-depth links
                 print("Looking for in-depth content...")
@@ -654,8 +654,9 @@ def download_pdfs_and_build_index():
                     section_base_path
                 )  # Remove any fragments
                 in_depth_links = extract_content_from_page(
-                    driver, subsection_url, section_base_path
+                    subsection_html, subsection_url, section_base_path
                 )
+                record_links(graph, subsection_url, in_depth_links, "subsection")
 
                 # Filter to valid in-depth links
                 filtered_links = []
@@ -670,19 +671,21 @@ def download_pdfs_and_build_index():
                     clean_link_url = strip_url_fragment(link["url"])
 
                     # Skip if we've already seen this base URL in the current subsection
-                    if clean_link_url in seen_clean_urls:
+                    canonical_link_url = canonicalize_url(clean_link_url)
+                    if canonical_link_url in seen_clean_urls:
                         continue
 
                     if (
                         section_base_path in clean_link_url
-                        and clean_link_url != strip_url_fragment(subsection_url)
+                        and canonical_link_url != canonicalize_url(subsection_url)
                     ):
                         filtered_links.append(link)
-                        seen_clean_urls.add(clean_link_url)
+                        seen_clean_urls.add(canonical_link_url)
 
                 print(
                     f"Found {len(filtered_links)} relevant in-depth links for {subsection_title}"
                 )
+                filtered_links = by_rank(graph, filtered_links)
 
                 # Process each in-depth link
                 for link_idx, link in enumerate(filtered_links, 1):
@@ -697,50 +700,31 @@ def download_pdfs_and_build_index():
                     # Add link to index if not already processed
                     clean_link_url = strip_url_fragment(link_url)
                     if clean_link_url not in processed_urls:
-                        # Download in-depth link PDF
-                        full_title = (
-                            f"{section_title} - {subsection_title} - {link_title}"
-                        )
-                        link_pdf_path = save_page_as_pdf(
-                            driver, full_title, link_url, pdf_dir
-                        )
-
-                        # Add to index
-                        if link_pdf_path:
-                            link_entry = {
+                        # Download in-depth link PDF and add it to the index
+                        save_and_index(
+                            {
+                                "type": "in_depth",
                                 "title": link_title,
-                                "full_title": full_title,
+                                "full_title": f"{section_title} - {subsection_title} - {link_title}",
                                 "url": clean_link_url,
-                                "original_url": link.get(
-                                    "original_url", link_url
-                                ),  # Keep original URL with fragment
-                                "pdf_path": link_pdf_path,
+                                # Keep original URL with fragment
+                                "original_url": link.get("original_url", link_url),
                                 "parent_section": section_title,
                                 "parent_subsection": subsection_title,
-                                "type": "in_depth",
-                            }
-                            pdf_index.append(link_entry)
-                            processed_urls.add(clean_link_url)
-                            stats["in_depth_downloaded"] += 1
-
-                            # Save index after each PDF
-                            with open(index_path, "w", encoding="utf-8") as f:
-                                json.dump(pdf_index, f, indent=2, ensure_ascii=False)
+                            },
+                            link_url,
+                            "in_depth_downloaded",
+                        )
                     else:
                         print(f"Link already processed: {link_title}")
 
-                    # Rate limiting
-                    time.sleep(1)
-
-                # Rate limiting between subsections
-                time.sleep(1)
-
-            # Rate limiting between sections
-            time.sleep(2)
-
-        # Final save of the index
-        with open(index_path, "w", encoding="utf-8") as f:
-            json.dump(pdf_index, f, indent=2, ensure_ascii=False)
+        # Second tier: pages that failed during the run, now that any passing
+        # outage is likely over
+        pending = deferred.drain()
+        if pending:
+            print(f"\nRetrying {len(pending)} deferred pages...")
+            for candidate, page_url, stat_key in pending:
+                save_and_index(candidate, page_url, stat_key, final=True)
 
         print(f"\n=== Summary ===")
         print(f"Total PDFs downloaded: {len(pdf_index)}")
@@ -754,27 +738,287 @@ def download_pdfs_and_build_index():
             f"In-depth links processed: {stats['in_depth_processed']}, downloaded: {stats['in_depth_downloaded']}"
         )
         print(f"Content skipped (irrelevant animals): {stats['skipped_irrelevant']}")
+        print(f"Pages since the last run: {changes.summary()}")
+        print(f"Render failures: {deferred.summary()}")
+        stats["throttle"] = throttle.state()
+        print(
+            f"Throttle: delay {stats['throttle']['delay']}s, "
+            f"{stats['throttle']['backoffs']} backoffs, "
+            f"{stats['throttle']['increases']} speed-ups, "
+            f"circuit opened {stats['throttle'].get('circuit_opens', 0)} times "
+            f"({stats['throttle'].get('circuit_paused', 0)}s paused)"
+        )
+        print(f"Seen URLs: {processed_urls.stats()}")
+        print(f"Print profile {profile.summary()}")
+        if getattr(renderer, "watchdog", None):
+            print(f"Browser watchdog: {renderer.watchdog.summary()}")
         print(f"PDF index saved to: {os.path.abspath(index_path)}")
         print(f"All PDFs saved to: {os.path.abspath(pdf_dir)}")
 
     except Exception as e:
         print(f"Error during processing: {e}")
+        # Every finished page is already in the index file
+        print(f"Partial index with {len(pdf_index)} entries in {index_path}")
+
+    finally:
+        # Clean up
+        renderer.close()
+        print("Renderer closed")
+        graph.close()
+
+
+def download_with_pipeline(
+    discovery_workers=2,
+    render_workers=2,
+    queue_size=50,
+    snapshot=False,
+    template=False,
+    print_profile="merck",
+    refresh=False,
+):
+    """
+    The same crawl and index as download_pdfs_and_build_index(), as a staged
+    pipeline: discovery (render section and subsection pages, extract links)
+    -> relevance filter and deduplication -> rendering -> index writer. Each
+    stage has its own workers and a bounded queue, so discovery keeps going
+    while PDFs print, and the report shows which stage limited the run.
+    """
+    output_dir = "merck_data"
+    pdf_dir = os.path.join(output_dir, "pdfs")
+    Path(pdf_dir).mkdir(parents=True, exist_ok=True)
+
+    sections = scrape_merck_vet_manual_sections()
+    with open(os.path.join(output_dir, "merck_sections.json"), "w", encoding="utf-8") as f:
+        json.dump(sections, f, indent=2, ensure_ascii=False)
+    sections = [
+        s for s in sections if s.get("url") and s.get("title") not in IGNORED_SECTIONS
+    ]
+
+    pdf_index_path = os.path.join(output_dir, "pdf_index.json")
+    index_path = os.path.join(output_dir, "snapshot_index.json") if snapshot else pdf_index_path
+    pdf_index = []
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            pdf_index = json.load(f)
+        print(f"Loaded {len(pdf_index)} existing entries from {index_path}")
+    changes = ChangeTracker(pdf_index)
+    processed_urls = SeenSet()
+    if not refresh:
+        for entry in pdf_index:
+            processed_urls.add(entry["url"])
+    if snapshot and os.path.exists(pdf_index_path):
+        with open(pdf_index_path, "r", encoding="utf-8") as f:
+            for entry in json.load(f):
+                processed_urls.add(entry["url"])
+
+    workers = discovery_workers + render_workers
+    renderer = get_renderer(chrome_options(), browsers=workers)
+    throttle = host_throttle(
+        "https://www.merckvetmanual.com", max_concurrency=workers, start_delay=1.0, min_delay=0.5
+    )
+    graph = LinkGraph(os.path.join(output_dir, "link_graph.db"))
+    profile = PrintProfile(print_profile, os.path.join(output_dir, "print_stats.jsonl"))
+    base_url = "https://www.merckvetmanual.com"
+    stats = {"skipped_irrelevant": 0, "already_processed": 0}
+    deferred = DeferredRetries()
+
+    def discover(section, emit):
+        section_title = section["title"]
+        section_url = section["url"]
+        print(f"Discovering: {section_title}")
+        emit({"type": "section", "title": section_title, "url": strip_url_fragment(section_url)})
+
+        section_path = section_url.split("merckvetmanual.com")[1]
+        try:
+            section_html = load_page(renderer, section_url, throttle, settle=3)
+        except RenderError as e:
+            print(f"Error loading section {section_title}: {e}")
+            deferred.fail(e)
+            return
+        subsections = extract_content_from_page(section_html, section_url, section_path)
+        record_links(graph, section_url, subsections, "section")
+
+        for item in by_rank(graph, subsections):
+            parts = item["url"].replace(base_url, "").strip("/").split("/")
+            if not (len(parts) > 1 and section_path.strip("/") == parts[0]):
+                continue
+            subsection_title = item["title"]
+            subsection_url = item["url"]
+            emit(
+                {
+                    "type": "subsection",
+                    "title": subsection_title,
+                    "full_title": f"{section_title} - {subsection_title}",
+                    "url": subsection_url,
+                    "parent_section": section_title,
+                }
+            )
+            if not is_relevant_title(subsection_title):
+                continue
 
-        # Save whatever we have in case of error
-        if pdf_index:
             try:
-                with open(index_path, "w", encoding="utf-8") as f:
-                    json.dump(pdf_index, f, indent=2, ensure_ascii=False)
-                print(f"Saved partial index with {len(pdf_index)} entries")
-            except Exception as save_error:
-                print(f"Error saving index: {save_error}")
+                subsection_html = load_page(renderer, subsection_url, throttle, settle=2)
+            except RenderError as e:
+                print(f"Error loading subsection {subsection_title}: {e}")
+                deferred.fail(e)
+                continue
+            section_base_path = strip_url_fragment(subsection_url.replace(base_url, ""))
+            in_depth_links = extract_content_from_page(
+                subsection_html, subsection_url, section_base_path
+            )
+            record_links(graph, subsection_url, in_depth_links, "subsection")
+
+            seen_clean_urls = set()
+            for link in by_rank(graph, in_depth_links):
+                canonical_link_url = canonicalize_url(link["url"])
+                if (
+                    canonical_link_url in seen_clean_urls
+                    or section_base_path not in link["url"]
+                    or canonical_link_url == canonicalize_url(subsection_url)
+                ):
+                    continue
+                seen_clean_urls.add(canonical_link_url)
+                emit(
+                    {
+                        "type": "in_depth",
+                        "title": link["title"],
+                        "full_title": f"{section_title} - {subsection_title} - {link['title']}",
+                        "url": link["url"],
+                        "original_url": link.get("original_url", link["url"]),
+                        "parent_section": section_title,
+                        "parent_subsection": subsection_title,
+                    }
+                )
 
+    def filter_relevant(candidate, emit):
+        # One worker, so the seen set needs no lock
+        if candidate["type"] != "section" and not is_relevant_title(candidate["title"]):
+            stats["skipped_irrelevant"] += 1
+            return
+        if candidate["url"] in processed_urls:
+            stats["already_processed"] += 1
+            return
+        processed_urls.add(candidate["url"])
+        emit(candidate)
+
+    def render(candidate, emit, final=False):
+        fingerprint, unchanged = check_for_changes(
+            changes, candidate, candidate["url"], throttle, snapshot
+        )
+        if unchanged:
+            return
+        try:
+            pdf_path, printed_fingerprint = print_page(
+                renderer,
+                candidate.get("full_title", candidate["title"]),
+                candidate["url"],
+                pdf_dir,
+                throttle,
+                snapshot,
+                template,
+                profile,
+            )
+        except Exception as e:
+            print(f"Error saving PDF: {e}")
+            if final:
+                deferred.fail(e)
+            else:
+                deferred.add(candidate, e)
+            return
+        if not fingerprint:
+            fingerprint = page_fingerprint(candidate["url"], printed_fingerprint, throttle)
+        emit(build_index_entry(candidate, pdf_path, fingerprint))
+
+    def write(entry, emit):
+        store_index_entry(index_path, pdf_index, entry, changes.previous_entry(entry["url"]))
+
+    pipeline = Pipeline(
+        [
+            Stage("discovery", discover, discovery_workers, queue_size),
+            Stage("relevance", filter_relevant, 1, queue_size),
+            Stage("render", render, render_workers, queue_size),
+            Stage("writer", write, 1, queue_size),
+        ]
+    )
+    try:
+        pipeline.run(by_rank(graph, sections))
+        # Second tier: pages that failed during the run
+        pending = deferred.drain()
+        if pending:
+            print(f"\nRetrying {len(pending)} deferred pages...")
+            for candidate in pending:
+                render(candidate, lambda entry: write(entry, None), final=True)
     finally:
-        # Clean up
-        if "driver" in locals():
-            driver.quit()
-            print("WebDriver closed")
+        renderer.close()
+        graph.close()
+
+    pipeline.print_report()
+    print(
+        f"Skipped {stats['skipped_irrelevant']} irrelevant and "
+        f"{stats['already_processed']} already processed pages"
+    )
+    print(f"Render failures: {deferred.summary()}")
+    print(f"Pages since the last run: {changes.summary()}")
+    print(f"Throttle: {throttle.state()}")
+    print(f"Seen URLs: {processed_urls.stats()}")
+    print(f"Print profile {profile.summary()}")
+    if getattr(renderer, "watchdog", None):
+        print(f"Browser watchdog: {renderer.watchdog.summary()}")
+    print(f"Index saved to: {os.path.abspath(index_path)} ({len(pdf_index)} entries)")
 
 
 if __name__ == "__main__":
-    download_pdfs_and_build_index()
+    parser = argparse.ArgumentParser(description="Download Merck PDFs and build an index")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="Save MHTML snapshots only; print them later with snapshot_print.py",
+    )
+    parser.add_argument(
+        "--template",
+        action="store_true",
+        help="Print topic pages from their __NEXT_DATA__ article with a local stylesheet",
+    )
+    parser.add_argument(
+        "--print-profile",
+        choices=list(PRINT_PROFILES),
+        default="merck",
+        help="Page furniture to strip before printing ('none' prints the page as served)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Check indexed pages for changes and print again only the changed ones",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Discover and render concurrently in a staged pipeline",
+    )
+    parser.add_argument(
+        "--discovery-workers", type=int, default=2, help="Pipeline: pages discovered at once"
+    )
+    parser.add_argument(
+        "--render-workers", type=int, default=2, help="Pipeline: PDFs rendered at once"
+    )
+    parser.add_argument(
+        "--queue-size", type=int, default=50, help="Pipeline: items each stage may queue"
+    )
+    args = parser.parse_args()
+    if args.pipeline:
+        download_with_pipeline(
+            args.discovery_workers,
+            args.render_workers,
+            args.queue_size,
+            snapshot=args.snapshot,
+            template=args.template,
+            print_profile=args.print_profile,
+            refresh=args.refresh,
+        )
+    else:
+        download_pdfs_and_build_index(
+            snapshot=args.snapshot,
+            template=args.template,
+            print_profile=args.print_profile,
+            refresh=args.refresh,
+        )
@@ -0,0 +1,216 @@
+# link_graph.py - Persistent page link graph and hub-first crawl priorities
+#
+#   python link_graph.py merck_data/link_graph.db --top 20
+#
+# Every link a crawl discovers is kept as an edge (source, target, anchor
+# text, discovery strategy) in SQLite, with pages stored once and edges by
+# page id. In-degree is updated as edges arrive; PageRank is refreshed every
+# few hundred new edges with a handful of power-iteration sweeps started from
+# the previous ranks, which converge quickly because the graph changes little
+# between refreshes. PriorityFrontier uses the scores so well-linked pages are
+# crawled and rendered first when a run is budget-limited. Several processes
+# (the sharded spiders) may share one database: ranks are recomputed from
+# every stored edge when a graph is opened and on each refresh, so no process
+# writes ranks computed over only its own part of the graph.
+
+import argparse
+import heapq
+import itertools
+import os
+import sqlite3
+import threading
+from collections import defaultdict
+
+DAMPING = 0.85
+
+# Seconds to wait for another process's write to the database to finish
+BUSY_TIMEOUT = 60
+
+
+class LinkGraph:
+    """Edge store plus in-memory in-degree and PageRank for crawl priorities"""
+
+    def __init__(self, db_path, refresh_every=500, sweeps=5):
+        self.db_path = db_path
+        self.refresh_every = refresh_every
+        self.sweeps = sweeps
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE NOT NULL,
+                rank REAL NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS edges (
+                source INTEGER NOT NULL,
+                target INTEGER NOT NULL,
+                anchor TEXT,
+                strategy TEXT,
+                PRIMARY KEY (source, target)
+            ) WITHOUT ROWID;
+            """
+        )
+
+        with self.lock:
+            self.refresh()
+
+    def load(self):
+        """Read every page and edge, including other processes', from the database"""
+        self.ids = {}
+        self.ranks = {}
+        self.out_links = defaultdict(set)
+        self.in_degree = defaultdict(int)
+        for page_id, url, rank in self.db.execute("SELECT id, url, rank FROM pages"):
+            self.ids[url] = page_id
+            self.ranks[page_id] = rank
+        for source, target in self.db.execute("SELECT source, target FROM edges"):
+            self.out_links[source].add(target)
+            self.in_degree[target] += 1
+        self.new_edges = 0
+
+    def page_id(self, url):
+        page_id = self.ids.get(url)
+        if page_id is None:
+            # Another process may have stored the page since it was loaded
+            self.db.execute("INSERT OR IGNORE INTO pages (url) VALUES (?)", (url,))
+            page_id = self.db.execute("SELECT id FROM pages WHERE url = ?", (url,)).fetchone()[0]
+            self.ids[url] = page_id
+            self.ranks[page_id] = 0.0
+        return page_id
+
+    def add_links(self, source_url, links, strategy):
+        """
+        Record the links found on a page: dicts with url and title (the
+        anchor text). Returns how many edges were new.
+        """
+        with self.lock:
+            source = self.page_id(source_url)
+            added = 0
+            for link in links:
+                target = self.page_id(link["url"])
+                if target == source or target in self.out_links[source]:
+                    continue
+                inserted = self.db.execute(
+                    "INSERT OR IGNORE INTO edges (source, target, anchor, strategy) "
+                    "VALUES (?, ?, ?, ?)",
+                    (source, target, link.get("title"), strategy),
+                ).rowcount
+                self.out_links[source].add(target)
+                if inserted:
+                    # Otherwise another process stored the edge, counted on reload
+                    self.in_degree[target] += 1
+                    added += 1
+            self.db.commit()
+            self.new_edges += added
+            if self.new_edges >= self.refresh_every:
+                self.refresh()
+            return added
+
+    def refresh(self):
+        """
+        Reload the stored graph and run a few PageRank sweeps from its ranks;
+        call with the lock held
+        """
+        self.load()
+        count = len(self.ids)
+        if not count:
+            return
+        ranks = {page_id: rank or 1.0 / count for page_id, rank in self.ranks.items()}
+        for _ in range(self.sweeps):
+            # Rank of pages without out-links is spread over all pages
+            dangling = sum(rank for page_id, rank in ranks.items() if not self.out_links.get(page_id))
+            base = (1 - DAMPING) / count + DAMPING * dangling / count
+            next_ranks = dict.fromkeys(ranks, base)
+            for source, targets in self.out_links.items():
+                if targets:
+                    share = DAMPING * ranks[source] / len(targets)
+                    for target in targets:
+                        next_ranks[target] += share
+            ranks = next_ranks
+        self.ranks = ranks
+        self.db.executemany(
+            "UPDATE pages SET rank = ? WHERE id = ?", [(rank, pid) for pid, rank in ranks.items()]
+        )
+        self.db.commit()
+        self.new_edges = 0
+
+    def score(self, url):
+        """(PageRank, in-degree) of a page; higher is crawled first"""
+        with self.lock:
+            page_id = self.ids.get(url)
+            if page_id is None:
+                return (0.0, 0)
+            return (self.ranks.get(page_id, 0.0), self.in_degree.get(page_id, 0))
+
+    def top(self, limit=20):
+        with self.lock:
+            self.refresh()
+            urls = {page_id: url for url, page_id in self.ids.items()}
+            best = heapq.nlargest(limit, self.ranks.items(), key=lambda item: item[1])
+            return [(urls[pid], rank, self.in_degree.get(pid, 0)) for pid, rank in best]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pages": len(self.ids),
+                "edges": sum(self.in_degree.values()),
+            }
+
+    def close(self):
+        with self.lock:
+            self.refresh()
+            self.db.close()
+
+
+class PriorityFrontier:
+    """
+    Frontier ordered by link-graph score, highest first; tasks with equal
+    scores keep discovery order. Scores change as links are found, so the
+    head is re-scored when it is taken and pushed back if it has fallen
+    behind the next task.
+    """
+
+    def __init__(self, graph, key=lambda task: task["url"]):
+        self.graph = graph
+        self.key = key
+        self.heap = []
+        self.order = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def priority(self, task):
+        rank, in_degree = self.graph.score(self.key(task))
+        return (-rank, -in_degree)
+
+    def append(self, task):
+        heapq.heappush(self.heap, (self.priority(task), next(self.order), task))
+
+    def popleft(self):
+        while True:
+            stored, order, task = heapq.heappop(self.heap)
+            current = self.priority(task)
+            if current <= stored or not self.heap or current <= self.heap[0][0]:
+                return task
+            heapq.heappush(self.heap, (current, order, task))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the best-linked pages in a link graph")
+    parser.add_argument("db", help="Link graph database, e.g. merck_data/link_graph.db")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    graph = LinkGraph(args.db)
+    print(f"Graph: {graph.stats()}")
+    for url, rank, in_degree in graph.top(args.top):
+        print(f"{rank:.5f}  {in_degree:>5}  {url}")
+    graph.close()
+
+
+if __name__ == "__main__":
+    main()
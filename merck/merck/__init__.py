@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# Scrapy runs from the merck/ project directory; make the shared modules at
+# the repository root (throttle.py, ...) importable from the project.
+REPO_ROOT = str(Path(__file__).resolve().parents[2])
+if REPO_ROOT not in sys.path:
+    sys.path.append(REPO_ROOT)
@@ -3,7 +3,25 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy_selenium import SeleniumRequest
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+from twisted.internet import threads
+from twisted.python.threadpool import ThreadPool
+
+import driver_cache
+from throttle import AimdController, fetch_crawl_delay, host_bucket
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
@@ -56,48 +74,245 @@ class MerckSpiderMiddleware:
         spider.logger.info("Spider opened: %s" % spider.name)
 
 
+class PooledDriver:
+    """A Chrome driver checked out of the pool, with its page count"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
 class MerckDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    # Renders SeleniumRequests on a pool of headless Chrome drivers that run
+    # on worker threads. process_request returns a Deferred, so the reactor
+    # keeps scheduling while up to CONCURRENT_REQUESTS pages render in
+    # parallel. Drivers are recycled after SELENIUM_POOL_MAX_PAGES pages or
+    # as soon as one crashes.
+
+    def __init__(
+        self, driver_path, driver_arguments, pool_size, max_pages, shared_rate_limit=False
+    ):
+        self.driver_path = driver_path
+        self.driver_arguments = driver_arguments
+        self.pool_size = max(1, pool_size)
+        self.max_pages = max_pages
+        # Machine-wide token buckets per host (throttle.TokenBucket), drawn
+        # from on the render thread so the reactor never blocks
+        self.shared_rate_limit = shared_rate_limit
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+        self.idle_drivers = queue.LifoQueue()
+        self.threadpool = ThreadPool(
+            minthreads=1, maxthreads=self.pool_size, name="selenium-pool"
+        )
+        self.stats = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        settings = crawler.settings
+        s = cls(
+            driver_path=settings.get("SELENIUM_DRIVER_EXECUTABLE_PATH"),
+            driver_arguments=settings.getlist("SELENIUM_DRIVER_ARGUMENTS"),
+            pool_size=settings.getint("SELENIUM_POOL_SIZE")
+            or settings.getint("CONCURRENT_REQUESTS"),
+            max_pages=settings.getint("SELENIUM_POOL_MAX_PAGES"),
+            shared_rate_limit=settings.getbool("SHARED_RATE_LIMIT_ENABLED"),
+        )
+        s.stats = crawler.stats
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
+    def create_driver(self):
+        options = Options()
+        for argument in self.driver_arguments:
+            options.add_argument(argument)
+
+        # Without SELENIUM_DRIVER_EXECUTABLE_PATH use the pinned driver, so
+        # starting a browser never waits on a network version check
+        driver_path = self.driver_path
+        if not driver_path:
+            driver_path, browser_path, _, resolve_seconds = driver_cache.timed_resolve()
+            if browser_path:
+                options.binary_location = browser_path
+            self.stats.max_value("selenium_pool/driver_resolve_seconds", resolve_seconds)
+
+        started = time.monotonic()
+        driver = webdriver.Chrome(service=Service(driver_path), options=options)
+        self.stats.max_value("selenium_pool/driver_start_seconds_max", time.monotonic() - started)
+        self.stats.inc_value("selenium_pool/drivers_started")
+        return PooledDriver(driver)
+
+    def acquire(self):
+        try:
+            return self.idle_drivers.get_nowait()
+        except queue.Empty:
+            return self.create_driver()
+
+    def release(self, pooled):
+        if self.max_pages and pooled.pages >= self.max_pages:
+            self.stats.inc_value("selenium_pool/drivers_recycled")
+            pooled.quit()
+            return
+        self.idle_drivers.put(pooled)
+
+    def get_bucket(self, url):
+        parsed = urlparse(url)
+        with self.buckets_lock:
+            bucket = self.buckets.get(parsed.netloc)
+            if bucket is None:
+                base_url = f"{parsed.scheme}://{parsed.netloc}"
+                bucket = host_bucket(base_url, fetch_crawl_delay(base_url))
+                self.buckets[parsed.netloc] = bucket
+            return bucket
+
+    def render(self, request):
+        # Runs on a pool thread: the driver is owned by this thread until it
+        # is released back to the pool.
+        if self.shared_rate_limit:
+            waited = self.get_bucket(request.url).acquire()
+            self.stats.inc_value("rate_limit/wait_seconds", round(waited, 3))
+        pooled = self.acquire()
+        driver = pooled.driver
+        started = time.monotonic()
+        crashed = False
+        try:
+            driver.get(request.url)
+            for cookie_name, cookie_value in request.cookies.items():
+                driver.add_cookie({"name": cookie_name, "value": cookie_value})
+            if request.wait_until:
+                WebDriverWait(driver, request.wait_time).until(request.wait_until)
+            if request.screenshot:
+                request.meta["screenshot"] = driver.get_screenshot_as_png()
+            if request.script:
+                driver.execute_script(request.script)
+            url = driver.current_url
+            body = str.encode(driver.page_source)
+        except WebDriverException as e:
+            # A timeout leaves the browser usable; any other driver error
+            # means it crashed
+            if not isinstance(e, TimeoutException):
+                crashed = True
+                self.stats.inc_value("selenium_pool/drivers_crashed")
+            raise
+        finally:
+            # Every driver goes back to the pool or is quit, whatever failed
+            request.meta["render_latency"] = time.monotonic() - started
+            if crashed:
+                pooled.quit()
+            else:
+                pooled.pages += 1
+                self.release(pooled)
+
+        return HtmlResponse(url, body=body, encoding="utf-8", request=request)
+
+    def process_request(self, request, spider):
+        if not isinstance(request, SeleniumRequest):
+            return None
+
+        from twisted.internet import reactor
+
+        return threads.deferToThreadPool(reactor, self.threadpool, self.render, request)
+
+    def spider_opened(self, spider):
+        self.threadpool.start()
+        spider.logger.info(
+            f"Selenium pool started: {self.pool_size} drivers, "
+            f"recycled every {self.max_pages or 'unlimited'} pages"
+        )
+
+    def spider_closed(self, spider):
+        self.threadpool.stop()
+        while not self.idle_drivers.empty():
+            self.idle_drivers.get_nowait().quit()
+
+
+class SkipParsedPagesMiddleware:
+    # Drops requests for pages that a resumed job (JOBDIR) has already
+    # parsed, so requests replayed from the persisted scheduler queue after
+    # a hard kill do not cost another browser render.
+
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        if request.url in getattr(spider, "parsed_urls", ()):
+            raise IgnoreRequest(f"Already parsed in a previous run: {request.url}")
         return None
 
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
-        return response
+class AdaptiveThrottleMiddleware:
+    # Feeds render latency, 429/5xx responses and download errors into an
+    # AIMD controller (throttle.py) per download slot, and applies the
+    # controller's concurrency and delay to the slot. The robots.txt
+    # Crawl-delay is the lower bound for the delay. Current controller state
+    # is kept in the crawl stats under adaptive_throttle/<slot>/.
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+        self.crawler = crawler
+        self.controller_settings = {
+            "start_concurrency": settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"),
+            "min_concurrency": settings.getint("ADAPTIVE_THROTTLE_MIN_CONCURRENCY"),
+            "max_concurrency": settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY"),
+            "start_delay": settings.getfloat("DOWNLOAD_DELAY"),
+            "max_delay": settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY"),
+            "target_latency": settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY"),
+            "max_error_rate": settings.getfloat("ADAPTIVE_THROTTLE_MAX_ERROR_RATE"),
+        }
+        self.controllers = {}
+        self.crawl_delay = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        base_url = getattr(spider, "base_url", None)
+        if base_url and self.crawler.settings.getbool("ROBOTSTXT_OBEY"):
+            self.crawl_delay = fetch_crawl_delay(
+                base_url, self.crawler.settings.get("USER_AGENT")
+            )
+            if self.crawl_delay:
+                spider.logger.info(f"robots.txt Crawl-delay: {self.crawl_delay}s")
+
+    def get_controller(self, slot_key):
+        controller = self.controllers.get(slot_key)
+        if controller is None:
+            controller = AimdController(**self.controller_settings)
+            if self.crawl_delay:
+                controller.set_crawl_delay(self.crawl_delay)
+            self.controllers[slot_key] = controller
+        return controller
+
+    def update(self, request, status=None, error=False):
+        latency = request.meta.get("download_latency") or request.meta.get(
+            "render_latency", 0.0
+        )
+        slot_key = request.meta.get("download_slot")
+        controller = self.get_controller(slot_key)
+        controller.record(latency, status=status, error=error)
+
+        slot = self.crawler.engine.downloader.slots.get(slot_key)
+        if slot is not None:
+            slot.concurrency = controller.concurrency
+            slot.delay = controller.delay
+
+        for name, value in controller.state().items():
+            self.crawler.stats.set_value(f"adaptive_throttle/{slot_key}/{name}", value)
+
+    def process_response(self, request, response, spider):
+        self.update(request, status=response.status)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not isinstance(exception, IgnoreRequest):
+            self.update(request, error=True)
+        return None
@@ -7,8 +7,18 @@ SELENIUM_DRIVER_NAME = "chrome"
 SELENIUM_DRIVER_EXECUTABLE_PATH = which("chromedriver")
 SELENIUM_DRIVER_ARGUMENTS = ["--headless"]
 
-# Add the Selenium middleware
-DOWNLOADER_MIDDLEWARES = {"scrapy_selenium.SeleniumMiddleware": 800}
+# Render SeleniumRequests on a pool of drivers, and skip pages a resumed job
+# already parsed
+DOWNLOADER_MIDDLEWARES = {
+    "merck.middlewares.SkipParsedPagesMiddleware": 700,
+    "merck.middlewares.MerckDownloaderMiddleware": 800,
+    "merck.middlewares.AdaptiveThrottleMiddleware": 810,
+}
+
+# Driver pool size (defaults to CONCURRENT_REQUESTS) and how many pages a
+# driver renders before it is replaced with a fresh one (0 = never)
+SELENIUM_POOL_SIZE = 0
+SELENIUM_POOL_MAX_PAGES = 200
 
 SPIDER_MODULES = ["merck.spiders"]
 NEWSPIDER_MODULE = "merck.spiders"
@@ -19,7 +29,7 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 # Obey robots.txt rules (optional - set False to ignore scraping restrictions)
 ROBOTSTXT_OBEY = True
 
-# Set a download delay to avoid hitting the server too hard
+# Starting download delay; the adaptive throttle adjusts it from here
 DOWNLOAD_DELAY = 2
 
 # Disable cookies (some sites track sessions)
@@ -32,18 +42,40 @@ DEFAULT_REQUEST_HEADERS = {
     "Connection": "keep-alive",
 }
 
-# Enable AutoThrottle to dynamically manage request rates
-AUTOTHROTTLE_ENABLED = True
-AUTOTHROTTLE_START_DELAY = 2
-AUTOTHROTTLE_MAX_DELAY = 10
-AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
-AUTOTHROTTLE_DEBUG = False
+# AutoThrottle only tunes the delay and would fight the adaptive throttle
+# below over the same download slot, so it stays off
+AUTOTHROTTLE_ENABLED = False
+
+# Adaptive (AIMD) throttle: per-domain concurrency starts at
+# CONCURRENT_REQUESTS_PER_DOMAIN and grows while render latency and error
+# rate stay healthy, and is halved (with the delay doubled) on 429/5xx or
+# timeouts. CONCURRENT_REQUESTS is the hard ceiling.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_MIN_CONCURRENCY = 1
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 6
+ADAPTIVE_THROTTLE_MAX_DELAY = 30
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 10.0
+ADAPTIVE_THROTTLE_MAX_ERROR_RATE = 0.1
+
+# Draw every render from the machine-wide per-host token bucket in throttle.py,
+# shared with full.py, the Cornell scripts and other spider processes. Rate
+# and burst per host come from HOST_RATE_LIMITS; robots.txt Crawl-delay caps them.
+SHARED_RATE_LIMIT_ENABLED = True
 
 # Retry on failures (e.g., 503 errors)
 RETRY_ENABLED = True
 RETRY_TIMES = 3  # Number of retries
 RETRY_HTTP_CODES = [500, 502, 503, 504, 522, 524, 408]
 
+# Record every discovered link (topics page -> sections -> subsections ->
+# in-depth pages) in the link graph full.py and crawl_engine.py rank pages by
+# (link_graph.py). Relative to merck/; empty to turn it off.
+LINK_GRAPH_DB = "../merck_data/link_graph.db"
+
+# Persist the scheduler queue, seen fingerprints and section tree between runs
+# by passing a job directory: scrapy crawl merckvetmanual -s JOBDIR=crawls/merck-1
+JOBDIR = None
+
 # Optional: use rotating proxies or user-agents via middleware later
 
 # Set future-proof default values
@@ -1,16 +1,36 @@
+import hashlib
 import json
 import os
-import re
+import sqlite3
 import time
 from pathlib import Path
-from urllib.parse import urlparse
 
 import scrapy
 from scrapy_selenium import SeleniumRequest
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+
+from extractors import extract_in_depth_links, extract_sections, extract_subsections
+from link_graph import LinkGraph
+from url_canon import canonicalize_url
+
+# Seconds between checkpoints of the section tree; it is also saved on close
+CHECKPOINT_SECONDS = 30
+
+
+def parse_shard_spec(spec):
+    """Parse a shard spec like "3/8" into (index, count), index counted from 0"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected INDEX/COUNT")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec {spec!r}, need 0 <= INDEX < COUNT")
+    return index, count
+
+
+def shard_for_url(url, count):
+    """Stable shard number for a URL, identical across processes and machines"""
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return int(digest, 16) % count
 
 
 class MerckvetmanualSpider(scrapy.Spider):
@@ -35,37 +55,21 @@ class MerckvetmanualSpider(scrapy.Spider):
 
     def __init__(self, *args, **kwargs):
         super(MerckvetmanualSpider, self).__init__(*args, **kwargs)
-        self.nav_patterns = [
-            "veterinary professionals",
-            "pet owners",
-            "resources",
-            "quizzes",
-            "about",
-            "login",
-            "register",
-            "search",
-            "home",
-            "contact",
-            "legal",
-            "privacy",
-            "advertise",
-            "careers",
-            "help",
-            "terms",
-            "support",
-            "faq",
-            "feedback",
-            "menu",
-            "share",
-            "print",
-            "cookie preferences",
-            "cookie",
-        ]
-
         self.all_sections = {}
+        self.parsed_urls = set()
+        # Running progress totals: tree pages known, and how many are parsed
+        self.known_urls = set()
+        self.done_count = 0
+        self.last_checkpoint = time.monotonic()
         self.test_mode = kwargs.get("test", False)
+        self.shard = parse_shard_spec(kwargs["shard"]) if kwargs.get("shard") else None
+        self.graph = None
 
     def start_requests(self):
+        if self.load_job_state():
+            yield from self.resume_requests()
+            return
+
         yield SeleniumRequest(
             url="https://www.merckvetmanual.com/veterinary-topics",
             callback=self.parse_main_page,
@@ -74,18 +78,162 @@ class MerckvetmanualSpider(scrapy.Spider):
             dont_filter=True,
         )
 
+    def record_links(self, source_url, links, strategy):
+        """Keep the links found on a page in the link graph, in canonical form"""
+        if self.graph is None:
+            db_path = self.settings.get("LINK_GRAPH_DB")
+            if not db_path:
+                return
+            self.graph = LinkGraph(db_path)
+        try:
+            self.graph.add_links(
+                canonicalize_url(source_url),
+                [{"url": canonicalize_url(link["url"]), "title": link["title"]} for link in links],
+                strategy,
+            )
+        except sqlite3.Error as e:
+            # Priorities only; the crawl itself does not depend on the graph
+            self.logger.warning(f"Could not record links from {source_url}: {e}")
+
+    def get_job_state_path(self):
+        """Path of the section tree checkpoint inside JOBDIR, if one is set"""
+        jobdir = self.settings.get("JOBDIR")
+        if not jobdir:
+            return None
+        return os.path.join(jobdir, "sections_tree.json")
+
+    def load_job_state(self):
+        """Restore the partially built section tree from a previous run"""
+        state_path = self.get_job_state_path()
+        if not state_path or not os.path.exists(state_path):
+            return False
+
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.log(f"Could not read job state from {state_path}: {e}")
+            return False
+
+        self.all_sections = {
+            section["url"]: section for section in state.get("sections", [])
+        }
+        self.parsed_urls = set(state.get("parsed_urls", []))
+        for section_url, section in self.all_sections.items():
+            self.add_known([section_url] + [s["url"] for s in section["subsections"]])
+        self.log(
+            f"Resuming job: {len(self.all_sections)} sections, "
+            f"{len(self.parsed_urls)} pages already parsed"
+        )
+        return bool(self.all_sections)
+
+    def maybe_save_job_state(self):
+        """
+        Checkpoint at most every CHECKPOINT_SECONDS. Pages parsed after the
+        last checkpoint of a killed crawl are re-requested on resume.
+        """
+        if time.monotonic() - self.last_checkpoint >= CHECKPOINT_SECONDS:
+            self.save_job_state()
+
+    def save_job_state(self):
+        """Checkpoint the section tree so a killed crawl can pick up from here"""
+        self.last_checkpoint = time.monotonic()
+        state_path = self.get_job_state_path()
+        if not state_path:
+            return
+
+        Path(state_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "sections": list(self.all_sections.values()),
+                    "parsed_urls": sorted(self.parsed_urls),
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, state_path)
+
+    def resume_requests(self):
+        """Re-issue requests for every known page that has not been parsed yet.
+
+        Pages that were in flight when the previous run was killed are already
+        in the persisted dupefilter, so these requests bypass it. A page that
+        is also still in the persisted scheduler queue is then fetched twice,
+        and the second response is skipped as already parsed.
+        """
+        requests = []
+        for section_url, section in self.all_sections.items():
+            if section_url not in self.parsed_urls:
+                requests.append(self.section_request(section_url, dont_filter=True))
+                continue
+
+            for subsection in section["subsections"]:
+                if subsection["url"] not in self.parsed_urls:
+                    requests.append(
+                        self.subsection_request(
+                            section_url, subsection["url"], dont_filter=True
+                        )
+                    )
+
+        self.emit_progress("discovered", pages=len(requests))
+        yield from requests
+
+    def emit_progress(self, event, **fields):
+        """
+        Log a structured progress event that fetch_subsections.py parses live.
+        Every event carries the job's totals so far (known and parsed pages,
+        including earlier runs), which stay right when a shard is restarted.
+        """
+        totals = {"total": len(self.known_urls), "done": self.done_count}
+        self.logger.info("PROGRESS %s", json.dumps({"event": event, **fields, **totals}))
+
+    def add_known(self, urls):
+        """Count pages of the section tree towards the progress totals"""
+        for url in urls:
+            if url not in self.known_urls:
+                self.known_urls.add(url)
+                if url in self.parsed_urls:
+                    self.done_count += 1
+
+    def mark_parsed(self, url):
+        if url not in self.parsed_urls:
+            self.parsed_urls.add(url)
+            if url in self.known_urls:
+                self.done_count += 1
+
+    def section_request(self, section_url, dont_filter=False):
+        return SeleniumRequest(
+            url=section_url,
+            callback=self.parse_section,
+            wait_time=8,
+            meta={"section_url": section_url},
+            dont_filter=dont_filter,
+        )
+
+    def subsection_request(self, section_url, subsection_url, dont_filter=False):
+        return SeleniumRequest(
+            url=subsection_url,
+            callback=self.parse_subsection,
+            wait_time=5,
+            meta={"section_url": section_url, "subsection_url": subsection_url},
+            dont_filter=dont_filter,
+        )
+
     def parse_main_page(self, response):
         self.log("Parsing main veterinary topics page")
-        sections = self.extract_from_next_data(response)
-        if not sections:
-            self.log("Trying fallback extraction method using CSS selectors")
-            sections = self.extract_from_css(response)
+        sections = extract_sections(response.text)
 
         if not sections:
             self.log("No sections found using any method!")
             return
 
         self.log(f"Found {len(sections)} total sections")
+        if self.shard:
+            index, count = self.shard
+            sections = [s for s in sections if shard_for_url(s["url"], count) == index]
+            self.log(f"SHARD {index}/{count}: processing {len(sections)} sections")
         if self.test_mode:
             sections = sections[:3]
             self.log(f"TEST MODE: Only processing {len(sections)} sections")
@@ -96,69 +244,15 @@ class MerckvetmanualSpider(scrapy.Spider):
                 "url": section["url"],
                 "subsections": [],
             }
+        self.add_known(section["url"] for section in sections)
 
-            yield SeleniumRequest(
-                url=section["url"],
-                callback=self.parse_section,
-                wait_time=8,
-                meta={"section_url": section["url"]},
-                dont_filter=True,
-            )
-
-    def extract_from_next_data(self, response):
-        """Extract sections from __NEXT_DATA__ script"""
-        try:
-            script_data = response.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
-            if not script_data:
-                return []
-
-            data = json.loads(script_data)
-            section_data = (
-                data.get("props", {})
-                .get("pageProps", {})
-                .get("componentProps", {})
-                .get("eb190e7b-5914-4f3d-91a8-3fa8542b6178", {})
-                .get("data", [])
-            )
-            sections = []
-            for item in section_data:
-                title = item.get("titlecomputed_t", "")
-                path = item.get("relativeurlcomputed_s", "")
-
-                if title and path:
-                    url = f"{self.base_url}{path}"
-                    sections.append({"title": title, "url": url})
-                    self.log(f"Found section from JSON: {title}")
-
-            return sections
-
-        except Exception as e:
-            self.log(f"Error extracting from __NEXT_DATA__: {e}")
-            return []
-
-    def extract_from_css(self, response):
-        """Extract sections using CSS selectors as fallback"""
-        sections = []
-        section_items = response.css(
-            "div.SectionList_sectionListItem__NNP4c a, a.SectionList_sectionListItem__NNP4c"
-        )
-
-        if not section_items:
-            section_items = response.css(
-                "div[class*='section'] > a, a[href^='/'][class*='section']"
-            )
-
-        for link in section_items:
-            text = link.css("::text").get()
-            href = link.css("::attr(href)").get()
-
-            if text and href:
-                text = text.strip()
-                url = response.urljoin(href)
-                sections.append({"title": text, "url": url})
-                self.log(f"Found section from CSS: {text}")
+        self.mark_parsed(response.url)
+        self.save_job_state()
+        self.record_links(response.url, sections, "topics")
+        self.emit_progress("discovered", pages=len(sections))
 
-        return sections
+        for section in sections:
+            yield self.section_request(section["url"])
 
     def parse_section(self, response):
         section_url = response.meta.get("section_url")
@@ -166,158 +260,25 @@ class MerckvetmanualSpider(scrapy.Spider):
             self.log(f"Section URL not found in data structure: {section_url}")
             return
 
+        if section_url in self.parsed_urls:
+            self.log(f"Section already parsed in a previous run: {section_url}")
+            return
+
         section = self.all_sections[section_url]
         section_title = section["title"]
         self.log(f"Parsing section: {section_title} - {section_url}")
-        subsections = self.extract_subsections(response, section_url)
+        subsections = extract_subsections(response.text, section_url)
         self.all_sections[section_url]["subsections"] = subsections
+        self.add_known(subsection["url"] for subsection in subsections)
+        self.mark_parsed(section_url)
+        self.maybe_save_job_state()
+        self.record_links(section_url, subsections, "section")
+        self.emit_progress("parsed", kind="section", url=section_url)
+        self.emit_progress("discovered", pages=len(subsections))
 
         self.log(f"Found {len(subsections)} subsections for {section_title}")
         for subsection in subsections:
-            yield SeleniumRequest(
-                url=subsection["url"],
-                callback=self.parse_subsection,
-                wait_time=5,
-                meta={"section_url": section_url, "subsection_url": subsection["url"]},
-                dont_filter=True,
-            )
-            time.sleep(0.5)
-
-    def get_path_from_url(self, url):
-        """Safely extract path from URL"""
-        try:
-            if "merckvetmanual.com" in url:
-                parsed = urlparse(url)
-                return parsed.path.strip("/")
-            return ""
-        except Exception:
-            return ""
-
-    def extract_subsections(self, response, section_url):
-        """Extract subsections from a section page"""
-        section_path = self.get_path_from_url(section_url)
-        subsections = []
-        subsection_headers = response.css(
-            "div.SectionLayout_subsectionExpanded__SJT_i h2 a, "
-            "h2.SectionLayout_subsectionTitle__Lrw_e a, "
-            "div[class*='subsection'] h2 a, "
-            "h2[class*='subsection'] a"
-        )
-
-        for link in subsection_headers:
-            text = link.css("::text").get()
-            href = link.css("::attr(href)").get()
-
-            if text and href:
-                text = text.strip()
-                url = response.urljoin(href)
-                if url != section_url and text.lower() not in self.nav_patterns:
-                    url_path = self.get_path_from_url(url)
-                    if (
-                        section_path
-                        and section_path in url_path
-                        and section_path != url_path
-                    ):
-                        subsections.append(
-                            {"title": text, "url": url, "in_depth_links": []}
-                        )
-                        self.log(f"Found subsection from headers: {text}")
-        list_links = response.css("ul li a, ol li a")
-
-        for link in list_links:
-            text = link.css("::text").get()
-            href = link.css("::attr(href)").get()
-
-            if text and href:
-                text = text.strip()
-                url = response.urljoin(href)
-                if url != section_url and text.lower() not in self.nav_patterns:
-                    url_path = self.get_path_from_url(url)
-                    if (
-                        section_path
-                        and section_path in url_path
-                        and section_path != url_path
-                    ):
-                        if not any(s["url"] == url for s in subsections):
-                            subsections.append(
-                                {"title": text, "url": url, "in_depth_links": []}
-                            )
-                            self.log(f"Found subsection from lists: {text}")
-        script_data = response.xpath('//script[@id="__NEXT_DATA__"]/text()').get()
-
-        if script_data:
-            try:
-                data = json.loads(script_data)
-                component_props = (
-                    data.get("props", {}).get("pageProps", {}).get("componentProps", {})
-                )
-
-                for key, value in component_props.items():
-                    if isinstance(value, dict) and "data" in value:
-                        items = value.get("data", [])
-
-                        for item in items:
-                            title = item.get("titlecomputed_t", "")
-                            path = item.get("relativeurlcomputed_s", "")
-
-                            if title and path:
-                                url = f"{self.base_url}{path}"
-                                if url != section_url:
-                                    url_path = path.strip("/")
-                                    if (
-                                        section_path
-                                        and section_path in url_path
-                                        and section_path != url_path
-                                    ):
-                                        if not any(
-                                            s["url"] == url for s in subsections
-                                        ):
-                                            subsections.append(
-                                                {
-                                                    "title": title,
-                                                    "url": url,
-                                                    "in_depth_links": [],
-                                                }
-                                            )
-                                            self.log(
-                                                f"Found subsection from JSON: {title}"
-                                            )
-            except Exception as e:
-                self.log(f"Error extracting subsections from JSON: {e}")
-        if not subsections:
-            self.log("Trying more general link extraction for subsections")
-            general_links = response.css("a[href^='/']")
-
-            for link in general_links:
-                text = link.css("::text").get()
-                href = link.css("::attr(href)").get()
-
-                if text and href and len(text.strip()) > 3:
-                    text = text.strip()
-                    url = response.urljoin(href)
-
-                    if url != section_url and text.lower() not in self.nav_patterns:
-                        url_path = self.get_path_from_url(url)
-                        if (
-                            section_path
-                            and section_path in url_path
-                            and section_path != url_path
-                        ):
-                            if not any(s["url"] == url for s in subsections):
-                                subsections.append(
-                                    {"title": text, "url": url, "in_depth_links": []}
-                                )
-                                self.log(f"Found subsection from general links: {text}")
-        clean_subsections = []
-        seen_urls = set()
-
-        for subsection in subsections:
-            if subsection["url"] not in seen_urls:
-                seen_urls.add(subsection["url"])
-                if subsection["url"] != section_url:
-                    clean_subsections.append(subsection)
-
-        return clean_subsections
+            yield self.subsection_request(section_url, subsection["url"])
 
     def parse_subsection(self, response):
         section_url = response.meta.get("section_url")
@@ -325,6 +286,9 @@ class MerckvetmanualSpider(scrapy.Spider):
         if section_url not in self.all_sections:
             self.log(f"Section URL not found in data: {section_url}")
             return
+        if subsection_url in self.parsed_urls:
+            self.log(f"Subsection already parsed in a previous run: {subsection_url}")
+            return
         section = self.all_sections[section_url]
         subsection_index = next(
             (
@@ -342,65 +306,39 @@ class MerckvetmanualSpider(scrapy.Spider):
         subsection = section["subsections"][subsection_index]
 
         self.log(f"Parsing in-depth links for: {subsection['title']}")
-        in_depth_links = self.extract_in_depth_links(
-            response, section_url, subsection_url
+        in_depth_links = extract_in_depth_links(
+            response.text, section_url, subsection_url
         )
         self.all_sections[section_url]["subsections"][subsection_index][
             "in_depth_links"
         ] = in_depth_links
+        self.mark_parsed(subsection_url)
+        self.maybe_save_job_state()
+        self.record_links(subsection_url, in_depth_links, "subsection")
+        self.emit_progress("parsed", kind="subsection", url=subsection_url)
 
         self.log(
             f"Found {len(in_depth_links)} in-depth links for {subsection['title']}"
         )
 
-    def extract_in_depth_links(self, response, section_url, subsection_url):
-        """Extract in-depth links from a subsection page"""
-        section_path = self.get_path_from_url(section_url)
-        in_depth_links = []
-        content_links = response.css(
-            "ul li a, ol li a, div[class*='content'] a, "
-            "div[class*='topic'] a, div[class*='subsection'] a"
-        )
-
-        for link in content_links:
-            text = link.css("::text").get()
-            href = link.css("::attr(href)").get()
-
-            if text and href:
-                text = text.strip()
-                url = response.urljoin(href)
-                link_path = self.get_path_from_url(url)
-                if (
-                    url != section_url
-                    and url != subsection_url
-                    and text.lower() not in self.nav_patterns
-                    and len(text) > 3
-                ):
-                    if (
-                        section_path
-                        and section_path in link_path
-                        and link_path != section_path
-                    ):
-                        in_depth_links.append({"title": text, "url": url})
-                        self.log(f"Found in-depth link: {text}")
-        clean_links = []
-        seen_urls = set()
-
-        for link in in_depth_links:
-            if link["url"] not in seen_urls:
-                seen_urls.add(link["url"])
-                clean_links.append(link)
-
-        return clean_links
+    def get_output_path(self):
+        """Final tree path; each shard writes its own file for merge_shards.py"""
+        if self.shard:
+            index, count = self.shard
+            return f"merck_manual_final.shard-{index}-of-{count}.json"
+        return "merck_manual_final.json"
 
     def closed(self, reason):
         """Called when the spider is closed"""
+        self.save_job_state()
+        if self.graph is not None:
+            self.graph.close()
         sections_list = list(self.all_sections.values())
         non_empty_sections = [
             section for section in sections_list if section.get("subsections")
         ]
 
-        output_path = "merck_manual_final.json"
+        output_path = self.get_output_path()
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(non_empty_sections, f, indent=2, ensure_ascii=False)
         total_sections = len(sections_list)
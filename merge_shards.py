@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import re
+from pathlib import Path
+
+SHARD_FILE_PATTERN = re.compile(r"merck_manual_final\.shard-(\d+)-of-(\d+)\.json$")
+
+
+def find_shard_files(input_dir):
+    """Find per-shard spider outputs, ordered by shard index"""
+    shard_files = []
+    for path in Path(input_dir).glob("merck_manual_final.shard-*-of-*.json"):
+        match = SHARD_FILE_PATTERN.search(path.name)
+        if match:
+            shard_files.append((int(match.group(1)), int(match.group(2)), path))
+    return sorted(shard_files)
+
+
+def merge_links(existing_links, new_links):
+    """Append in-depth links whose URL has not been seen yet"""
+    seen_urls = {link["url"] for link in existing_links}
+    for link in new_links:
+        if link["url"] not in seen_urls:
+            seen_urls.add(link["url"])
+            existing_links.append(link)
+
+
+def merge_section_trees(trees):
+    """
+    Merge several section trees into one, deduplicating sections and
+    subsections by URL and in-depth links by URL within each subsection.
+    The first occurrence keeps its position and title.
+    """
+    merged = {}
+    for tree in trees:
+        for section in tree:
+            merged_section = merged.setdefault(
+                section["url"],
+                {"title": section["title"], "url": section["url"], "subsections": []},
+            )
+            subsections_by_url = {
+                subsection["url"]: subsection
+                for subsection in merged_section["subsections"]
+            }
+
+            for subsection in section.get("subsections", []):
+                existing = subsections_by_url.get(subsection["url"])
+                if existing is None:
+                    existing = {
+                        "title": subsection["title"],
+                        "url": subsection["url"],
+                        "in_depth_links": [],
+                    }
+                    subsections_by_url[subsection["url"]] = existing
+                    merged_section["subsections"].append(existing)
+                merge_links(
+                    existing["in_depth_links"], subsection.get("in_depth_links", [])
+                )
+
+    return list(merged.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge per-shard spider outputs into merck_manual_final.json"
+    )
+    parser.add_argument(
+        "--input-dir", default="merck", help="Directory holding the shard outputs"
+    )
+    parser.add_argument(
+        "--output",
+        default=os.path.join("merck", "merck_manual_final.json"),
+        help="Path of the merged output file",
+    )
+    args = parser.parse_args()
+
+    shard_files = find_shard_files(args.input_dir)
+    if not shard_files:
+        print(f"Error: no shard outputs found in {args.input_dir}")
+        return
+
+    counts = {count for _, count, _ in shard_files}
+    if len(counts) > 1:
+        print(f"Warning: shard outputs from different shard counts: {sorted(counts)}")
+    for count in counts:
+        present = {index for index, c, _ in shard_files if c == count}
+        missing = sorted(set(range(count)) - present)
+        if missing:
+            print(f"Warning: missing shards {missing} of {count}")
+
+    trees = []
+    for index, count, path in shard_files:
+        with open(path, "r", encoding="utf-8") as f:
+            tree = json.load(f)
+        print(f"Shard {index}/{count}: {len(tree)} sections from {path}")
+        trees.append(tree)
+
+    merged = merge_section_trees(trees)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+
+    total_subsections = sum(len(section["subsections"]) for section in merged)
+    print(f"\n=== Summary ===")
+    print(f"Merged {len(shard_files)} shard outputs")
+    print(f"Sections: {len(merged)}, subsections: {total_subsections}")
+    print(f"Merged data saved to: {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# pipeline.py - Staged producer/consumer pipeline with bounded queues
+#
+# Each stage has its own worker threads and a bounded input queue. A worker
+# that emits into a full queue blocks until the next stage catches up
+# (backpressure), so a slow stage never makes the others pile up work in
+# memory. Every stage records how its workers spent their time (busy, waiting
+# for input, blocked on the next stage) and how full its queue was, and the
+# report names the stage that limited the run.
+
+import queue
+import threading
+import time
+
+# Marks the end of a stage's input
+DONE = object()
+
+
+class Stage:
+    """
+    One pipeline stage: handler(item, emit) is called for every input item
+    and calls emit(result) for each item it passes on.
+    """
+
+    def __init__(self, name, handler, workers=1, maxsize=100):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize)
+        self.lock = threading.Lock()
+        self.stats = {
+            "in": 0,
+            "out": 0,
+            "errors": 0,
+            "busy": 0.0,
+            "idle": 0.0,
+            "blocked": 0.0,
+            "depth_samples": 0,
+            "depth_total": 0,
+        }
+
+    def add(self, name, value):
+        with self.lock:
+            self.stats[name] += value
+
+    def sample_depth(self):
+        with self.lock:
+            self.stats["depth_samples"] += 1
+            self.stats["depth_total"] += self.queue.qsize()
+
+
+class Pipeline:
+    """Stages connected in order; run() feeds the first stage and waits for the last"""
+
+    def __init__(self, stages, sample_interval=0.5):
+        self.stages = stages
+        self.sample_interval = sample_interval
+        self.elapsed = 0.0
+
+    def run(self, items):
+        started = time.monotonic()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            downstream = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            stage.remaining = stage.workers
+            for i in range(stage.workers):
+                thread = threading.Thread(
+                    target=self.worker, args=(stage, downstream), name=f"{stage.name}-{i}"
+                )
+                thread.start()
+                threads.append(thread)
+
+        stop = threading.Event()
+        sampler = threading.Thread(target=self.sample, args=(stop,), daemon=True)
+        sampler.start()
+
+        first = self.stages[0]
+        for item in items:
+            first.queue.put(item)
+        for _ in range(first.workers):
+            first.queue.put(DONE)
+
+        for thread in threads:
+            thread.join()
+        stop.set()
+        self.elapsed = time.monotonic() - started
+
+    def worker(self, stage, downstream):
+        blocked = 0.0
+
+        def emit(result):
+            nonlocal blocked
+            if downstream is None:
+                return
+            waited = time.monotonic()
+            downstream.queue.put(result)
+            blocked += time.monotonic() - waited
+            stage.add("out", 1)
+
+        while True:
+            waited = time.monotonic()
+            item = stage.queue.get()
+            stage.add("idle", time.monotonic() - waited)
+            if item is DONE:
+                break
+
+            stage.add("in", 1)
+            started = time.monotonic()
+            blocked = 0.0
+            try:
+                stage.handler(item, emit)
+            except Exception as e:
+                stage.add("errors", 1)
+                print(f"[{stage.name}] Error: {e}")
+            # Time spent blocked in emit() is not work done by this stage
+            stage.add("busy", max(time.monotonic() - started - blocked, 0.0))
+            stage.add("blocked", blocked)
+
+        # The last worker of a stage to finish ends the next stage's input
+        with stage.lock:
+            stage.remaining -= 1
+            last = stage.remaining == 0
+        if last and downstream is not None:
+            for _ in range(downstream.workers):
+                downstream.queue.put(DONE)
+
+    def sample(self, stop):
+        while not stop.wait(self.sample_interval):
+            for stage in self.stages:
+                stage.sample_depth()
+
+    def report(self):
+        """Per-stage occupancy rows and the name of the bottleneck stage"""
+        rows = []
+        for stage in self.stages:
+            stats = stage.stats
+            capacity = stage.workers * max(self.elapsed, 1e-9)
+            depth = stats["depth_total"] / stats["depth_samples"] if stats["depth_samples"] else 0
+            rows.append(
+                {
+                    "stage": stage.name,
+                    "workers": stage.workers,
+                    "in": stats["in"],
+                    "out": stats["out"],
+                    "errors": stats["errors"],
+                    "busy": stats["busy"] / capacity,
+                    "blocked": stats["blocked"] / capacity,
+                    "queue_fill": depth / stage.queue.maxsize if stage.queue.maxsize else 0,
+                }
+            )
+        bottleneck = max(rows, key=lambda row: row["busy"])["stage"] if rows else None
+        return rows, bottleneck
+
+    def print_report(self):
+        rows, bottleneck = self.report()
+        print(f"\n=== Pipeline ({self.elapsed:.0f}s) ===")
+        print(f"{'stage':<12}{'workers':>8}{'in':>7}{'out':>7}{'busy':>7}{'blocked':>9}{'queue':>7}")
+        for row in rows:
+            print(
+                f"{row['stage']:<12}{row['workers']:>8}{row['in']:>7}{row['out']:>7}"
+                f"{row['busy']:>7.0%}{row['blocked']:>9.0%}{row['queue_fill']:>7.0%}"
+            )
+        if bottleneck:
+            print(f"Bottleneck: {bottleneck} (busiest workers; add workers there first)")
@@ -0,0 +1,198 @@
+# print_profiles.py - Per-site print profiles and PDF size/time tracking
+#
+#   python full.py --print-profile merck           # the default
+#   python full.py --print-profile none            # print the page as served
+#   python print_profiles.py merck_data/print_stats.jsonl   # compare profiles
+#
+# Printing a page as the site serves it includes the header, navigation,
+# footer, related-content rails and ad slots, with their backgrounds. A print
+# profile removes such elements and injects a print stylesheet before the page
+# is printed (render_page's remove_selectors and print_css options), and can
+# override the printToPDF scale, margins and background. Every printed page
+# is logged with its profile, size, page count and print time, so runs with
+# different profiles can be compared.
+
+import argparse
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+
+# Stylesheet shared by the profiles: white background, no animations, and
+# fixed bars back in the flow so they are not repeated on every page
+PRINT_CSS = """
+html, body { background: #fff !important; }
+*, *::before, *::after {
+    animation: none !important;
+    transition: none !important;
+    box-shadow: none !important;
+}
+[style*="position: fixed"], [style*="position:fixed"], [style*="position: sticky"] {
+    position: static !important;
+}
+img, svg, video { max-width: 100% !important; height: auto; }
+main, article, [role="main"] {
+    width: auto !important;
+    max-width: none !important;
+    margin: 0 !important;
+    float: none !important;
+}
+"""
+
+# Page furniture found on both sites
+COMMON_REMOVE = [
+    "header",
+    "footer",
+    "nav",
+    "iframe",
+    "[role='banner']",
+    "[role='navigation']",
+    "[role='contentinfo']",
+    "[id^='google_ads']",
+    "[class*='advert']",
+    "[class*='ad-slot']",
+    "#onetrust-consent-sdk",
+]
+
+PRINT_PROFILES = {
+    # The page as the site serves it
+    "none": {},
+    "merck": {
+        "remove": COMMON_REMOVE
+        + [
+            "aside",
+            "[class*='RelatedContent']",
+            "[class*='SocialShare']",
+            "[class*='Feedback']",
+            "[class*='BackToTop']",
+            "[data-testid='topicNavigation']",
+        ],
+        "css": PRINT_CSS,
+        "print_options": {"printBackground": False},
+    },
+    "cornell": {
+        "remove": COMMON_REMOVE
+        + [
+            "#skipnav",
+            "[class*='breadcrumb']",
+            "[class*='sidebar']",
+            "[class*='social']",
+        ],
+        "css": PRINT_CSS,
+        "print_options": {
+            "printBackground": False,
+            "marginTop": 0.3,
+            "marginBottom": 0.3,
+            "marginLeft": 0.3,
+            "marginRight": 0.3,
+        },
+    },
+}
+
+PAGE_PATTERN = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+PAGE_COUNT_PATTERN = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)")
+
+
+def count_pages(data):
+    """
+    Pages in PDF bytes (or a memory map): the page objects, or the page tree's
+    /Count when the pages are inside compressed object streams
+    """
+    pages = len(PAGE_PATTERN.findall(data))
+    if pages:
+        return pages
+    return max((int(count) for count in PAGE_COUNT_PATTERN.findall(data)), default=0)
+
+
+def pdf_page_count(pdf_path):
+    with open(pdf_path, "rb") as f:
+        return count_pages(f.read())
+
+
+class PrintProfile:
+    """
+    A named profile with the render() options that apply it and running
+    totals of what it produced; pages are also appended to log_path as JSON
+    lines when it is set.
+    """
+
+    def __init__(self, name, log_path=None):
+        if name not in PRINT_PROFILES:
+            raise ValueError(f"Unknown print profile {name!r}; choose from {', '.join(PRINT_PROFILES)}")
+        self.name = name
+        self.profile = PRINT_PROFILES[name]
+        self.log_path = log_path
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+
+    def render_options(self, print_options):
+        """render() options for this profile over the given printToPDF parameters"""
+        options = {"print_options": {**print_options, **self.profile.get("print_options", {})}}
+        if self.profile.get("remove"):
+            options["remove_selectors"] = list(self.profile["remove"])
+        if self.profile.get("css"):
+            options["print_css"] = self.profile["css"]
+        return options
+
+    def record(self, result):
+        """Add a render result with a PDF to the totals and the log"""
+        if not result.get("pdf_path"):
+            return
+        timings = result["timings"]
+        row = {
+            "url": result["url"],
+            "profile": self.name,
+            "pdf_bytes": result.get("pdf_bytes") or os.path.getsize(result["pdf_path"]),
+            "pdf_pages": pdf_page_count(result["pdf_path"]),
+            "removed_elements": result.get("removed_elements", 0),
+            "print_seconds": timings.get("print", 0.0),
+            "total_seconds": timings.get("total", 0.0),
+        }
+        with self.lock:
+            self.totals["pdfs"] += 1
+            for key in ("pdf_bytes", "pdf_pages", "print_seconds", "total_seconds"):
+                self.totals[key] += row[key]
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(row) + "\n")
+
+    def summary(self):
+        with self.lock:
+            return format_totals(self.name, self.totals)
+
+
+def format_totals(name, totals):
+    pdfs = totals["pdfs"]
+    if not pdfs:
+        return f"{name}: no PDFs"
+    return (
+        f"{name}: {pdfs:.0f} PDFs, avg {totals['pdf_bytes'] / pdfs / 1024:.0f} KB, "
+        f"{totals['pdf_pages'] / pdfs:.1f} pages, print {totals['print_seconds'] / pdfs:.2f}s, "
+        f"render {totals['total_seconds'] / pdfs:.2f}s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare print profiles from their stats logs")
+    parser.add_argument("logs", nargs="+", help="print_stats.jsonl files")
+    args = parser.parse_args()
+
+    totals = defaultdict(lambda: defaultdict(float))
+    for path in args.logs:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                profile = totals[row["profile"]]
+                profile["pdfs"] += 1
+                for key in ("pdf_bytes", "pdf_pages", "print_seconds", "total_seconds"):
+                    profile[key] += row.get(key, 0)
+
+    for name in sorted(totals):
+        print(format_totals(name, totals[name]))
+
+
+if __name__ == "__main__":
+    main()
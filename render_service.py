@@ -0,0 +1,489 @@
+# render_service.py - Long-running render daemon with a pool of warm browsers
+#
+# Start it once:    python render_service.py --browsers 3
+# and point the scripts at it with RENDER_SERVICE_URL=http://127.0.0.1:8765.
+# Without RENDER_SERVICE_URL the scripts render in-process with LocalRenderer.
+
+import argparse
+import json
+import os
+import queue
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from browser import (
+    DEFAULT_PRINT_OPTIONS,
+    apply_print_profile,
+    capture_snapshot,
+    chrome_options,
+    create_driver,
+    handle_cookie_consent,
+    print_to_pdf,
+)
+from browser_watchdog import DEFAULT_MAX_RSS_MB, DEFAULT_PAGE_DEADLINE, BrowserWatchdog
+
+DEFAULT_PORT = 8765
+
+
+class RenderError(Exception):
+    """
+    A render job failed; kind is "timeout", "http" (status holds the HTTP
+    status code), "webdriver" or "error"
+    """
+
+    def __init__(self, message, kind="error", status=None):
+        super().__init__(message)
+        self.kind = kind
+        self.status = status
+
+
+# Status of the main document, where the browser reports it (0 for file:// URLs)
+NAVIGATION_STATUS_SCRIPT = (
+    "const entry = performance.getEntriesByType('navigation')[0];"
+    "return entry ? entry.responseStatus || 0 : 0;"
+)
+
+
+def title_to_filename(page_title):
+    """Filename for a PDF named after the page title (as dosave.py does)"""
+    if " - " in page_title:
+        page_title = page_title.split(" - ")[0]
+    return re.sub(r"[^\w\-_]", "_", page_title).strip("_") + ".pdf"
+
+
+def render_page(driver, job):
+    """
+    Run one render job on a driver. A job is a dict with the URL plus options:
+
+        url              page to load (required)
+        pdf_path         write the PDF here
+        output_dir       or write it here, named after the page title
+        snapshot_path    save an MHTML snapshot here (see snapshot_print.py)
+        return_html      include the rendered page source in the result
+        cookie_consent   dismiss cookie banners before printing
+        wait_for         CSS selector to wait for (default "body")
+        wait_timeout     seconds to wait for it (default 10)
+        settle           seconds to let scripts finish after loading
+        window_size      [width, height] of the browser window
+        remove_selectors CSS selectors of elements to remove before printing
+        print_css        stylesheet to add before printing
+        print_options    Page.printToPDF parameters
+        error_screenshot save a screenshot here if the job fails
+
+    Returns the PDF path and size, page title, optional HTML and the time
+    spent in each step.
+    """
+    timings = {}
+    started = time.monotonic()
+    step_started = started
+
+    def mark(step):
+        nonlocal step_started
+        now = time.monotonic()
+        timings[step] = round(now - step_started, 3)
+        step_started = now
+
+    try:
+        if job.get("window_size"):
+            driver.set_window_size(*job["window_size"])
+        driver.get(job["url"])
+        mark("load")
+
+        status = driver.execute_script(NAVIGATION_STATUS_SCRIPT)
+        if status and status >= 400:
+            raise RenderError(f"HTTP {status} for {job['url']}", "http", status)
+
+        if job.get("cookie_consent"):
+            handle_cookie_consent(driver)
+            mark("consent")
+
+        try:
+            WebDriverWait(driver, job.get("wait_timeout", 10)).until(
+                EC.presence_of_element_located(
+                    (By.CSS_SELECTOR, job.get("wait_for") or "body")
+                )
+            )
+        except TimeoutException:
+            print(f"Timeout waiting for {job['url']} to load. Continuing anyway...")
+        mark("wait")
+
+        if job.get("settle"):
+            time.sleep(job["settle"])
+            mark("settle")
+
+        result = {"url": job["url"], "final_url": driver.current_url, "title": driver.title}
+        if job.get("return_html"):
+            result["html"] = driver.page_source
+
+        saves_output = job.get("snapshot_path") or job.get("pdf_path") or job.get("output_dir")
+        if saves_output and (job.get("remove_selectors") or job.get("print_css")):
+            result["removed_elements"] = apply_print_profile(
+                driver, job.get("remove_selectors"), job.get("print_css")
+            )
+            mark("profile")
+
+        if job.get("snapshot_path"):
+            Path(job["snapshot_path"]).parent.mkdir(parents=True, exist_ok=True)
+            result["snapshot_bytes"] = capture_snapshot(driver, job["snapshot_path"])
+            result["snapshot_path"] = job["snapshot_path"]
+            mark("snapshot")
+
+        pdf_path = job.get("pdf_path")
+        if not pdf_path and job.get("output_dir"):
+            pdf_path = os.path.join(job["output_dir"], title_to_filename(driver.title))
+        if pdf_path:
+            Path(pdf_path).parent.mkdir(parents=True, exist_ok=True)
+            print_options = {**DEFAULT_PRINT_OPTIONS, **(job.get("print_options") or {})}
+            result["pdf_bytes"] = print_to_pdf(driver, pdf_path, print_options)
+            result["pdf_path"] = pdf_path
+            mark("print")
+    except Exception as e:
+        if job.get("error_screenshot"):
+            try:
+                driver.save_screenshot(job["error_screenshot"])
+            except Exception:
+                pass
+        if isinstance(e, RenderError):
+            raise
+        if isinstance(e, TimeoutException):
+            raise RenderError(str(e), "timeout") from e
+        if isinstance(e, WebDriverException):
+            raise RenderError(str(e), "webdriver") from e
+        raise RenderError(str(e)) from e
+
+    timings["total"] = round(time.monotonic() - started, 3)
+    result["timings"] = timings
+    return result
+
+
+def quit_driver(driver):
+    try:
+        driver.quit()
+    except Exception:
+        pass
+
+
+class BrowserPool:
+    """
+    Warm Chrome drivers shared by the render threads. A slot holds None while
+    its browser still has to be (re)started, so a browser that fails to start
+    does not shrink the pool. The watchdog replaces browsers that use too
+    much memory or respond slowly, and kills one that hangs on a page; the
+    page is then retried once on a fresh browser.
+    """
+
+    def __init__(
+        self, size, max_pages=200, window_size="1920,1080", options=None, watchdog=None
+    ):
+        self.size = size
+        self.max_pages = max_pages
+        self.window_size = window_size
+        self.options = options
+        self.watchdog = watchdog or BrowserWatchdog()
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.stats = {"jobs": 0, "failed": 0, "started": 0, "recycled": 0, "replaced": 0, "retried": 0}
+
+    def start(self, warm=True):
+        """Start every browser now, or with warm=False on first use"""
+        for _ in range(self.size):
+            self.idle.put(self.new_entry() if warm else None)
+
+    def new_entry(self):
+        driver = create_driver(self.options or chrome_options(window_size=self.window_size))
+        with self.lock:
+            self.stats["started"] += 1
+        return {"driver": driver, "pages": 0}
+
+    def ready(self, entry):
+        """entry if its browser is healthy, otherwise a new one"""
+        if entry is not None:
+            reason = self.watchdog.check(entry["driver"])
+            if reason:
+                print(f"Replacing browser after {entry['pages']} pages: {reason}")
+                quit_driver(entry["driver"])
+                with self.lock:
+                    self.stats["replaced"] += 1
+                entry = None
+        if entry is None:
+            try:
+                entry = self.new_entry()
+            except Exception as e:
+                self.idle.put(None)
+                raise RenderError(f"Could not start browser: {e}", "webdriver") from e
+        return entry
+
+    def render(self, job):
+        queued = time.monotonic()
+        entry = self.idle.get()
+        queue_wait = round(time.monotonic() - queued, 3)
+
+        for attempt in range(2):
+            entry = self.ready(entry)
+            try:
+                with self.watchdog.guard(entry["driver"]) as state:
+                    result = render_page(entry["driver"], job)
+            except RenderError as e:
+                if state["killed"] and attempt == 0:
+                    print(f"Retrying {job['url']} on a new browser")
+                    quit_driver(entry["driver"])
+                    with self.lock:
+                        self.stats["retried"] += 1
+                    entry = None
+                    continue
+                with self.lock:
+                    self.stats["failed"] += 1
+                if e.kind == "webdriver" or state["killed"]:
+                    # The browser may have crashed; start a fresh one next time
+                    self.discard(entry)
+                else:
+                    self.release(entry)
+                raise
+            break
+
+        result["timings"]["queue"] = queue_wait
+        with self.lock:
+            self.stats["jobs"] += 1
+        self.release(entry)
+        return result
+
+    def release(self, entry):
+        entry["pages"] += 1
+        if self.max_pages and entry["pages"] >= self.max_pages:
+            with self.lock:
+                self.stats["recycled"] += 1
+            self.discard(entry)
+            return
+        self.idle.put(entry)
+
+    def discard(self, entry):
+        quit_driver(entry["driver"])
+        self.idle.put(None)
+
+    def close(self):
+        while not self.idle.empty():
+            entry = self.idle.get_nowait()
+            if entry is not None:
+                entry["driver"].quit()
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    pool = None
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self.send_json(404, {"ok": False, "error": "Not found"})
+            return
+        with self.pool.lock:
+            stats = dict(self.pool.stats)
+        stats["idle_browsers"] = self.pool.idle.qsize()
+        stats["watchdog"] = self.pool.watchdog.summary()
+        self.send_json(200, {"ok": True, "stats": stats})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_json(404, {"ok": False, "error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length))
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"ok": False, "error": f"Invalid job: {e}"})
+            return
+        if not job.get("url"):
+            self.send_json(400, {"ok": False, "error": "Job needs a url"})
+            return
+
+        try:
+            result = self.pool.render(job)
+        except RenderError as e:
+            self.send_json(
+                200, {"ok": False, "error": str(e), "error_type": e.kind, "status": e.status}
+            )
+            return
+        print(f"Rendered {job['url']} in {result['timings']['total']}s")
+        self.send_json(200, {"ok": True, **result})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class RenderClient:
+    """Sends render jobs to a running render_service.py"""
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def render(self, url, **options):
+        # PDFs are written by the service, so paths must be absolute
+        for key in ("pdf_path", "snapshot_path", "output_dir", "error_screenshot"):
+            if options.get(key):
+                options[key] = os.path.abspath(options[key])
+        try:
+            response = requests.post(
+                f"{self.base_url}/render",
+                json={"url": url, **options},
+                timeout=self.timeout,
+            )
+        except requests.Timeout as e:
+            raise RenderError(str(e), "timeout") from e
+        except requests.RequestException as e:
+            raise RenderError(f"Render service unavailable: {e}") from e
+
+        if response.status_code != 200:
+            raise RenderError(f"Render service returned {response.status_code}: {response.text}")
+        result = response.json()
+        if not result.pop("ok"):
+            raise RenderError(
+                result["error"], result.get("error_type", "error"), result.get("status")
+            )
+        return result
+
+    def close(self):
+        pass
+
+
+class LocalRenderer:
+    """
+    Renders in this process on one browser, started on first use and
+    replaced after max_pages pages or when the watchdog finds it unhealthy.
+    A page whose browser hung is retried once on a fresh browser.
+    """
+
+    def __init__(self, options=None, max_pages=200, watchdog=None):
+        self.options = options
+        self.max_pages = max_pages
+        self.watchdog = watchdog or BrowserWatchdog()
+        self.driver = None
+        self.pages = 0
+
+    def ready(self):
+        if self.driver is not None:
+            if self.max_pages and self.pages >= self.max_pages:
+                reason = "page limit reached"
+            else:
+                reason = self.watchdog.check(self.driver)
+            if reason:
+                print(f"Replacing browser after {self.pages} pages: {reason}")
+                self.close()
+        if self.driver is None:
+            self.driver = create_driver(self.options)
+            self.pages = 0
+
+    def render(self, url, **options):
+        for attempt in range(2):
+            self.ready()
+            try:
+                with self.watchdog.guard(self.driver) as state:
+                    result = render_page(self.driver, {"url": url, **options})
+            except RenderError as e:
+                if e.kind == "webdriver" or state["killed"]:
+                    self.close()
+                if state["killed"] and attempt == 0:
+                    print(f"Retrying {url} on a new browser")
+                    continue
+                raise
+            self.pages += 1
+            return result
+
+    def close(self):
+        if self.driver is not None:
+            quit_driver(self.driver)
+            self.driver = None
+
+
+class PooledRenderer:
+    """
+    Renders in this process on a BrowserPool, for scripts with several worker
+    threads. Browsers start on first use and are shared by all threads.
+    """
+
+    def __init__(self, browsers, options=None, max_pages=200, watchdog=None):
+        self.pool = BrowserPool(browsers, max_pages, options=options, watchdog=watchdog)
+        self.watchdog = self.pool.watchdog
+        self.pool.start(warm=False)
+
+    def render(self, url, **options):
+        return self.pool.render({"url": url, **options})
+
+    def close(self):
+        self.pool.close()
+
+
+def get_renderer(options=None, browsers=1):
+    """
+    RenderClient when RENDER_SERVICE_URL points at a running service,
+    otherwise a LocalRenderer with the given Chrome options, or a
+    PooledRenderer when more than one browser is wanted.
+    """
+    service_url = os.environ.get("RENDER_SERVICE_URL")
+    if service_url:
+        print(f"Using render service at {service_url}")
+        return RenderClient(service_url)
+    if browsers > 1:
+        return PooledRenderer(browsers, options)
+    return LocalRenderer(options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render daemon with warm browsers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--browsers", type=int, default=2, help="Warm browsers to keep")
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=200,
+        help="Replace a browser after this many pages (0 = never)",
+    )
+    parser.add_argument(
+        "--max-rss-mb",
+        type=int,
+        default=DEFAULT_MAX_RSS_MB,
+        help="Replace a browser whose process tree uses more memory (0 = no limit)",
+    )
+    parser.add_argument(
+        "--page-deadline",
+        type=float,
+        default=DEFAULT_PAGE_DEADLINE,
+        help="Kill a browser that spends longer than this on one page (seconds)",
+    )
+    args = parser.parse_args()
+
+    watchdog = BrowserWatchdog(max_rss_mb=args.max_rss_mb, page_deadline=args.page_deadline)
+    pool = BrowserPool(args.browsers, args.max_pages, watchdog=watchdog)
+    print(f"Starting {args.browsers} browsers...")
+    pool.start()
+
+    RenderRequestHandler.pool = pool
+    server = ThreadingHTTPServer((args.host, args.port), RenderRequestHandler)
+    print(f"Render service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        server.server_close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
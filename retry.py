@@ -0,0 +1,116 @@
+# retry.py - Error classification and tiered retries for page renders
+#
+# A failed render is classified as a timeout, an HTTP error, a renderer crash
+# or another error. Timeouts, crashes and 429/5xx responses are retried once
+# right away after a short pause; pages that still fail go to a deferred
+# queue that is retried at the end of the run, when a passing outage is
+# likely over. Every outcome is fed to the host throttle, whose circuit
+# breaker pauses the crawl while the site keeps failing.
+
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from throttle import BACKOFF_STATUS_CODES
+
+# Seconds before the quick retry of a failed page
+QUICK_RETRY_DELAY = 5
+
+
+def classify_error(error):
+    """"timeout", "http", "crash" or "error" for a failed render"""
+    kind = getattr(error, "kind", None)
+    if kind == "timeout" or isinstance(error, requests.Timeout):
+        return "timeout"
+    if kind == "http" or isinstance(error, requests.HTTPError):
+        return "http"
+    if kind == "webdriver":
+        return "crash"
+    return "error"
+
+
+def is_retryable(kind, status=None):
+    """Timeouts, crashes and throttling or server errors may pass on a retry"""
+    if kind == "http":
+        return status in BACKOFF_STATUS_CODES
+    return kind in ("timeout", "crash")
+
+
+def render_with_retry(
+    renderer, url, throttle=None, retries=1, retry_delay=QUICK_RETRY_DELAY, **options
+):
+    """
+    renderer.render() paced by the throttle, with up to `retries` quick
+    retries of a retryable failure. Raises the last RenderError. Failures
+    are fed to the throttle with their status and how long they took.
+    """
+    attempt = 0
+    while True:
+        if throttle:
+            throttle.wait()
+        started = time.monotonic()
+        try:
+            result = renderer.render(url, **options)
+        except Exception as e:
+            kind = classify_error(e)
+            status = getattr(e, "status", None)
+            if throttle:
+                throttle.record(
+                    time.monotonic() - started,
+                    status=status,
+                    error=kind in ("timeout", "crash"),
+                )
+            if attempt >= retries or not is_retryable(kind, status):
+                raise
+            attempt += 1
+            print(f"{kind} rendering {url}; retrying in {retry_delay}s ({attempt}/{retries})")
+            time.sleep(retry_delay)
+            continue
+        if throttle:
+            throttle.record(result["timings"]["load"])
+        return result
+
+
+class DeferredRetries:
+    """
+    Pages whose quick retries failed, kept for one more attempt at the end of
+    the run, with counts of deferred and finally failed pages by error class
+    """
+
+    def __init__(self):
+        self.items = []
+        self.deferred = Counter()
+        self.failed = Counter()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+    def add(self, item, error):
+        """Defer item if error is retryable; otherwise count it as failed"""
+        kind = classify_error(error)
+        with self.lock:
+            if is_retryable(kind, getattr(error, "status", None)):
+                self.items.append(item)
+                self.deferred[kind] += 1
+                return True
+            self.failed[kind] += 1
+            return False
+
+    def fail(self, error):
+        with self.lock:
+            self.failed[classify_error(error)] += 1
+
+    def drain(self):
+        with self.lock:
+            items, self.items = self.items, []
+        return items
+
+    def summary(self):
+        with self.lock:
+            deferred = ", ".join(f"{k} {v}" for k, v in sorted(self.deferred.items())) or "none"
+            failed = ", ".join(f"{k} {v}" for k, v in sorted(self.failed.items())) or "none"
+        return f"deferred: {deferred}; failed: {failed}"
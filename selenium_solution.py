@@ -1,95 +1,78 @@
+import argparse
 import json
 import os
 import re
-import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from webdriver_manager.chrome import ChromeDriverManager
+from browser import chrome_options
+from extractors import MERCK_BASE_URL, extract_content_links, parse_html
+from render_service import get_renderer
+from retry import render_with_retry
+from throttle import host_throttle
 
+# Links that show a subsection page lists in-depth content
+IN_DEPTH_INDICATORS = "ul li a, div[class*='subsection'] a, div[class*='section'] a"
 
-def extract_content_from_page(driver, url, base_section_path):
+# Seconds to let a page finish rendering when it first yields no links
+RETRY_SETTLE = 3
+
+
+class PageCounter:
+    """Pages rendered across all section workers"""
+
+    def __init__(self):
+        self.pages = 0
+        self.lock = threading.Lock()
+
+    def add(self):
+        with self.lock:
+            self.pages += 1
+
+
+def render_html(renderer, url, throttle, counter, settle=0):
+    """Render a page at the pace set by the shared throttle and return its HTML"""
+    result = render_with_retry(renderer, url, throttle, return_html=True, settle=settle)
+    counter.add()
+    return result["html"]
+
+
+def extract_content_from_page(html, url, base_section_path):
     """
     Extract links from a page - works for both subsections and in-depth pages
     """
-    links = driver.find_elements(By.TAG_NAME, "a")
-    content_links = []
-    base_url = "https://www.merckvetmanual.com"
-
-    for link in links:
-        try:
-            href = link.get_attribute("href")
-            text = link.text.strip()
-
-            if (
-                href
-                and text
-                and len(text) > 3
-                and href.startswith(base_url)
-                and href != url
-                and not any(
-                    x in text.lower()
-                    for x in [
-                        "veterinary",
-                        "pet owners",
-                        "resources",
-                        "quizzes",
-                        "about",
-                        "contact",
-                        "disclaimer",
-                        "privacy",
-                        "terms",
-                        "cookie",
-                        "licensing",
-                        "copyright",
-                    ]
-                )
-            ):
+    return extract_content_links(html, url, base_section_path)
 
-                if base_section_path in href:
-                    content_links.append({"title": text, "url": href})
-        except Exception as e:
-            print(f"  Error processing link: {e}")
-            continue
 
-    return content_links
+def extract_with_retry(renderer, url, base_section_path, throttle, counter):
+    """
+    Render a page and extract its content links. Most pages are complete as
+    soon as they load; only a page that yields nothing is rendered again with
+    time to settle, instead of sleeping on every page.
+    """
+    html = render_html(renderer, url, throttle, counter)
+    links = extract_content_from_page(html, url, base_section_path)
+    if not links:
+        html = render_html(renderer, url, throttle, counter, settle=RETRY_SETTLE)
+        links = extract_content_from_page(html, url, base_section_path)
+    return html, links
 
 
-def extract_subsections_with_selenium(url, section_title):
+def extract_subsections_with_selenium(renderer, url, section_title, throttle, counter):
     """
     Extract subsections and their in-depth content from Merck Veterinary Manual section
     """
     print(f"Extracting subsections for {section_title} from {url}")
 
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")  # Run in headless mode
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-
-    driver = webdriver.Chrome(
-        service=Service(ChromeDriverManager().install()), options=chrome_options
-    )
-
     try:
-        driver.get(url)
-
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        time.sleep(5)
         section_path = url.split("merckvetmanual.com")[1]
-        base_url = "https://www.merckvetmanual.com"
         print("Extracting first-level subsections...")
-        subsections = extract_content_from_page(driver, url, section_path)
+        _, subsections = extract_with_retry(renderer, url, section_path, throttle, counter)
         filtered_subsections = []
         for item in subsections:
-            relative_path = item["url"].replace(base_url, "")
+            relative_path = item["url"].replace(MERCK_BASE_URL, "")
             parts = relative_path.strip("/").split("/")
 
             if len(parts) > 1 and section_path.strip("/") == parts[0]:
@@ -99,7 +82,8 @@ def extract_subsections_with_selenium(url, section_title):
         processed_subsections = []
         for i, subsection in enumerate(filtered_subsections):
             print(
-                f"Processing subsection {i+1}/{len(filtered_subsections)}: {subsection['title']}"
+                f"[{section_title}] Processing subsection {i+1}/{len(filtered_subsections)}: "
+                f"{subsection['title']}"
             )
 
             subsection_data = {
@@ -108,25 +92,13 @@ def extract_subsections_with_selenium(url, section_title):
                 "in_depth_links": [],
             }
             try:
-                driver.get(subsection["url"])
-                WebDriverWait(driver, 10).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                time.sleep(3)
-                list_indicators = driver.find_elements(
-                    By.CSS_SELECTOR,
-                    "ul li a, div[class*='subsection'] a, div[class*='section'] a",
+                section_base_path = subsection["url"].replace(MERCK_BASE_URL, "")
+                html, in_depth_links = extract_with_retry(
+                    renderer, subsection["url"], section_base_path, throttle, counter
                 )
 
-                in_depth_links = []
-
-                if list_indicators:
-                    print(f"  Found potential in-depth links on subsection page")
-                    section_base_path = subsection["url"].replace(base_url, "")
-                    in_depth_links = extract_content_from_page(
-                        driver, subsection["url"], section_base_path
-                    )
-                    filtered_links = []
+                filtered_links = []
+                if parse_html(html).select(IN_DEPTH_INDICATORS):
                     for link in in_depth_links:
                         if (
                             section_base_path in link["url"]
@@ -135,12 +107,8 @@ def extract_subsections_with_selenium(url, section_title):
                             filtered_links.append(link)
                             print(f"  Found in-depth link: {link['title']}")
 
-                    in_depth_links = filtered_links
-
-                subsection_data["in_depth_links"] = in_depth_links
+                subsection_data["in_depth_links"] = filtered_links
                 processed_subsections.append(subsection_data)
-                if i < len(filtered_subsections) - 1:
-                    time.sleep(1)
 
             except Exception as e:
                 print(f"  Error processing subsection {subsection['title']}: {e}")
@@ -152,12 +120,47 @@ def extract_subsections_with_selenium(url, section_title):
         print(f"Error: {e}")
         return []
 
-    finally:
-        driver.quit()
+
+def get_output_path(output_dir, title):
+    safe_title = re.sub(r'[\\/*?:"<>|]', "_", title)
+    return os.path.join(output_dir, f"{safe_title}.json")
+
+
+def is_fresh(output_path, max_age_hours):
+    """True when a section file exists, holds subsections and is recent enough"""
+    if not os.path.exists(output_path):
+        return False
+    if max_age_hours and time.time() - os.path.getmtime(output_path) > max_age_hours * 3600:
+        return False
+    try:
+        with open(output_path, "r", encoding="utf-8") as f:
+            return bool(json.load(f))
+    except (OSError, json.JSONDecodeError):
+        return False
 
 
 def main():
-    test_mode = "--test" in sys.argv
+    parser = argparse.ArgumentParser(description="Extract Merck subsections with Selenium")
+    parser.add_argument(
+        "--test", action="store_true", help="Only process the Circulatory System section"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Sections processed concurrently, one browser each",
+    )
+    parser.add_argument(
+        "--max-age-hours",
+        type=float,
+        default=168,
+        help="Skip sections whose output file is newer than this (0 = any age)",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-extract sections that are already saved"
+    )
+    args = parser.parse_args()
+
     sections_path = os.path.join("merck", "clean_sections.json")
 
     if not os.path.exists(sections_path):
@@ -170,14 +173,8 @@ def main():
 
         output_dir = os.path.join("merck", "subsections")
         Path(output_dir).mkdir(exist_ok=True)
-        if test_mode:
+        if args.test:
             print("Running in TEST mode - only processing Circulatory System")
-        else:
-            print(f"Preparing to extract subsections for {len(sections)} sections")
-
-        processed = 0
-        successful = 0
-        if test_mode:
             circulatory_section = next(
                 (s for s in sections if s["title"] == "Circulatory System"), None
             )
@@ -186,35 +183,73 @@ def main():
             else:
                 print("Error: Circulatory System section not found")
                 return
-        total_sections = len(sections)
-        for i, section in enumerate(sections, 1):
-            title = section.get("title")
-            url = section.get("url")
-
-            if not title or not url:
-                continue
 
-            print(f"\n[{i}/{total_sections}] Processing: {title}")
-            subsections = extract_subsections_with_selenium(url, title)
-            processed += 1
+        sections = [s for s in sections if s.get("title") and s.get("url")]
+        pending = []
+        for section in sections:
+            output_path = get_output_path(output_dir, section["title"])
+            if not args.force and is_fresh(output_path, args.max_age_hours):
+                print(f"Skipping {section['title']}: {output_path} is up to date")
+            else:
+                pending.append(section)
 
-            if subsections:
-                safe_title = re.sub(r'[\\/*?:"<>|]', "_", title)
-                output_path = os.path.join(output_dir, f"{safe_title}.json")
+        total_sections = len(pending)
+        print(
+            f"Preparing to extract subsections for {total_sections} sections "
+            f"({len(sections) - total_sections} up to date) with {args.workers} workers"
+        )
+        if not pending:
+            return
 
-                with open(output_path, "w", encoding="utf-8") as f:
-                    json.dump(subsections, f, indent=2, ensure_ascii=False)
+        throttle = host_throttle(
+            MERCK_BASE_URL, max_concurrency=args.workers, start_delay=1.0, min_delay=0.5
+        )
 
-                print(f"✓ Saved {len(subsections)} subsections to {output_path}")
-                successful += 1
-            else:
-                print(f"✗ No subsections found for {title}")
-            if i < total_sections:
-                print("Waiting 2 seconds before next request...")
-                time.sleep(2)
+        workers = min(args.workers, total_sections)
+        renderer = get_renderer(chrome_options(), browsers=workers)
+        counter = PageCounter()
+        started = time.monotonic()
+        processed = 0
+        successful = 0
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(
+                        extract_subsections_with_selenium,
+                        renderer,
+                        section["url"],
+                        section["title"],
+                        throttle,
+                        counter,
+                    ): section
+                    for section in pending
+                }
+                for future in as_completed(futures):
+                    title = futures[future]["title"]
+                    subsections = future.result()
+                    processed += 1
+
+                    print(f"\n[{processed}/{total_sections}] Finished: {title}")
+                    if subsections:
+                        output_path = get_output_path(output_dir, title)
+                        with open(output_path, "w", encoding="utf-8") as f:
+                            json.dump(subsections, f, indent=2, ensure_ascii=False)
+
+                        print(f"✓ Saved {len(subsections)} subsections to {output_path}")
+                        successful += 1
+                    else:
+                        print(f"✗ No subsections found for {title}")
+        finally:
+            renderer.close()
+
+        elapsed = time.monotonic() - started
         print(f"\n=== Summary ===")
         print(f"Processed: {processed}/{total_sections} sections")
         print(f"Successful: {successful}/{processed} sections")
+        print(
+            f"Rendered {counter.pages} pages in {elapsed:.0f}s "
+            f"({60 * counter.pages / max(elapsed, 1):.1f} pages/min)"
+        )
         print(f"All subsections have been saved to: {os.path.abspath(output_dir)}")
 
     except Exception as e:
@@ -0,0 +1,308 @@
+# site_adapters.py - What the crawl engine needs to know about each site
+#
+# An adapter declares how a site's listing is discovered (seeds), which links
+# on a rendered page are followed (children), which URLs are external and
+# skipped, how pages are rendered and where PDFs and the index are written.
+# crawl_engine.py does the rest: scheduling, politeness, rendering, indexing.
+
+import json
+import os
+
+from browser import DEFAULT_PRINT_OPTIONS
+from cornell_export import CORNELL_PRINT_OPTIONS, file_sha256, is_valid_pdf, safe_name
+from url_canon import canonicalize_url
+
+MERCK_BASE_URL = "https://www.merckvetmanual.com"
+
+
+class SiteAdapter:
+    name = None
+    base_url = None
+    output_dir = None
+    index_file = None
+    skip_hosts = ()
+    # Pages rendered at once on this host
+    concurrency = 2
+    # Page furniture stripped before printing (see print_profiles.py)
+    print_profile = "none"
+
+    def seeds(self):
+        """Tasks to start from; each task is a dict with at least url and title"""
+        raise NotImplementedError
+
+    def children(self, task, html):
+        """Tasks for the links on a rendered page worth following"""
+        return []
+
+    def expands(self, task):
+        """True when the rendered HTML of a task is needed to find children"""
+        return False
+
+    def render_options(self, task):
+        """Options for renderer.render(), apart from pdf_path and return_html"""
+        return {}
+
+    def index_key(self, task_or_entry):
+        return canonicalize_url(task_or_entry["url"])
+
+    def is_done(self, task, entry):
+        """True when an index entry from an earlier run covers the task"""
+        return entry is not None and os.path.exists(entry.get("pdf_path", ""))
+
+    def is_external(self, task):
+        return any(host in task["url"] for host in self.skip_hosts)
+
+    def index_entry(self, task, result):
+        raise NotImplementedError
+
+    def failure_entry(self, task, error):
+        """Index entry for a failed page, or None to leave failures out"""
+        return None
+
+    def skipped_entry(self, task):
+        """Index entry for an external URL, or None to leave it out"""
+        return None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.output_dir, self.index_file)
+
+
+class MerckAdapter(SiteAdapter):
+    """
+    Sections, subsections and in-depth pages of the Merck Veterinary Manual,
+    filtered to cats and dogs, in the same layout and index as full.py.
+    """
+
+    name = "merck"
+    base_url = MERCK_BASE_URL
+    output_dir = "merck_data"
+    index_file = "pdf_index.json"
+    concurrency = 2
+    print_profile = "merck"
+
+    def __init__(self):
+        # full.py holds the section scraper and the relevance rules
+        import full
+
+        self.full = full
+        self.pdf_dir = os.path.join(self.output_dir, "pdfs")
+
+    def seeds(self):
+        sections = self.full.scrape_merck_vet_manual_sections()
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, "merck_sections.json"), "w", encoding="utf-8") as f:
+            json.dump(sections, f, indent=2, ensure_ascii=False)
+
+        tasks = []
+        for section in sections:
+            if section.get("title") in self.full.IGNORED_SECTIONS or not section.get("url"):
+                continue
+            tasks.append(
+                self.task(
+                    "section",
+                    section["title"],
+                    section["url"],
+                    full_title=section["title"],
+                    section_path=section["url"].split("merckvetmanual.com")[1],
+                )
+            )
+        return tasks
+
+    def task(self, kind, title, url, full_title, **meta):
+        clean_url = self.full.strip_url_fragment(url)
+        safe_title = self.full.clean_filename(full_title)
+        return {
+            "kind": kind,
+            "title": title,
+            "full_title": full_title,
+            "url": clean_url,
+            "original_url": url,
+            "pdf_path": os.path.join(self.pdf_dir, f"{safe_title}.pdf"),
+            "safe_title": safe_title,
+            **meta,
+        }
+
+    def expands(self, task):
+        return task["kind"] in ("section", "subsection")
+
+    def render_options(self, task):
+        return {
+            "cookie_consent": True,
+            "settle": 3 if task["kind"] == "section" else 2,
+            "window_size": [1920, 1080],
+            "print_options": DEFAULT_PRINT_OPTIONS,
+            "error_screenshot": f"error_screenshot_{task['safe_title']}.png",
+        }
+
+    def children(self, task, html):
+        if task["kind"] == "section":
+            section_path = task["section_path"]
+            links = self.full.extract_content_from_page(html, task["url"], section_path)
+            children = []
+            for link in links:
+                parts = link["url"].replace(MERCK_BASE_URL, "").strip("/").split("/")
+                if len(parts) > 1 and section_path.strip("/") == parts[0]:
+                    children.append(
+                        self.task(
+                            "subsection",
+                            link["title"],
+                            link["url"],
+                            full_title=f"{task['title']} - {link['title']}",
+                            parent_section=task["title"],
+                        )
+                    )
+            return children
+
+        if task["kind"] == "subsection":
+            base_path = self.full.strip_url_fragment(task["url"].replace(MERCK_BASE_URL, ""))
+            links = self.full.extract_content_from_page(html, task["url"], base_path)
+            return [
+                self.task(
+                    "in_depth",
+                    link["title"],
+                    link["original_url"],
+                    full_title=f"{task['full_title']} - {link['title']}",
+                    parent_section=task["parent_section"],
+                    parent_subsection=task["title"],
+                )
+                for link in links
+                if base_path in link["url"] and link["url"] != task["url"]
+            ]
+        return []
+
+    def index_entry(self, task, result):
+        entry = {"title": task["title"]}
+        if task["kind"] != "section":
+            entry["full_title"] = task["full_title"]
+        entry["url"] = task["url"]
+        if task["kind"] == "in_depth":
+            entry["original_url"] = task["original_url"]
+        entry["pdf_path"] = result["pdf_path"]
+        if task["kind"] != "section":
+            entry["parent_section"] = task["parent_section"]
+        if task["kind"] == "in_depth":
+            entry["parent_subsection"] = task["parent_subsection"]
+        entry["type"] = task["kind"]
+        return entry
+
+
+class CornellAdapter(SiteAdapter):
+    """
+    Cornell health topic listings: every subcategory page becomes a PDF under
+    <output_dir>/<category>/, logged in processing_log.json as canine.py and
+    feline.py do.
+    """
+
+    base_url = "https://www.vet.cornell.edu"
+    index_file = "processing_log.json"
+    concurrency = 3
+    print_profile = "cornell"
+
+    def fetch_categories(self):
+        raise NotImplementedError
+
+    def seeds(self):
+        categories = self.fetch_categories() or []
+        # A failed fetch must not replace the last good topic list
+        if categories:
+            with open(self.topics_file, "w", encoding="utf-8") as f:
+                json.dump(categories, f, indent=4, ensure_ascii=False)
+
+        tasks = []
+        for category in categories:
+            category_dir = os.path.join(
+                self.output_dir, category["title"].replace(" ", "_").replace("/", "_")
+            )
+            for subcategory in category["subcategories"]:
+                pdf_name = f"{safe_name(subcategory['title'])}.pdf"
+                tasks.append(
+                    {
+                        "category": category["title"],
+                        "title": subcategory["title"],
+                        "url": subcategory["url"],
+                        "pdf_path": os.path.join(category_dir, pdf_name),
+                    }
+                )
+        return tasks
+
+    def render_options(self, task):
+        return {
+            "settle": 1,
+            "window_size": [1200, 1200],
+            "print_options": CORNELL_PRINT_OPTIONS,
+        }
+
+    def index_key(self, task_or_entry):
+        # A page listed under two categories is printed once per category
+        return task_or_entry.get("pdf_path") or task_or_entry["url"]
+
+    def is_done(self, task, entry):
+        return (
+            entry is not None
+            and entry.get("status") == "success"
+            and is_valid_pdf(task["pdf_path"], entry)
+        )
+
+    def base_entry(self, task):
+        return {"category": task["category"], "title": task["title"], "url": task["url"]}
+
+    def index_entry(self, task, result):
+        entry = self.base_entry(task)
+        if not is_valid_pdf(result["pdf_path"]):
+            entry.update(status="error", error="Failed to save PDF", pdf_path=task["pdf_path"])
+            return entry
+        entry.update(
+            pdf_path=result["pdf_path"],
+            status="success",
+            bytes=os.path.getsize(result["pdf_path"]),
+            sha256=file_sha256(result["pdf_path"]),
+        )
+        return entry
+
+    def failure_entry(self, task, error):
+        entry = self.base_entry(task)
+        entry.update(status="error", error=str(error), pdf_path=task["pdf_path"])
+        return entry
+
+    def skipped_entry(self, task):
+        entry = self.base_entry(task)
+        entry.update(status="skipped", reason="External URL", pdf_path=task["pdf_path"])
+        return entry
+
+
+class CanineAdapter(CornellAdapter):
+    name = "canine"
+    output_dir = "canine_health_pdfs"
+    topics_file = "canine_health_topics.json"
+
+    def __init__(self):
+        import canine
+
+        self.canine = canine
+        self.skip_hosts = canine.SKIP_HOSTS
+
+    def fetch_categories(self):
+        return self.canine.fetch_canine_health_data()
+
+
+class FelineAdapter(CornellAdapter):
+    name = "feline"
+    output_dir = "feline_health_pdfs"
+    topics_file = "feline_health_topics.json"
+
+    def __init__(self):
+        import feline
+
+        self.feline = feline
+        self.skip_hosts = feline.SKIP_HOSTS
+
+    def fetch_categories(self):
+        return self.feline.fetch_feline_health_data()
+
+
+ADAPTERS = {
+    "merck": MerckAdapter,
+    "canine": CanineAdapter,
+    "feline": FelineAdapter,
+}
@@ -0,0 +1,138 @@
+# snapshot_print.py - Print MHTML snapshots to PDF offline, in parallel
+#
+#   python full.py --snapshot                  # crawl: save snapshots, no printing
+#   python snapshot_print.py --browsers 4      # print them to merck_data/pdfs
+#   python snapshot_print.py --force --print-options '{"scale": 0.8}'   # re-print
+#   python snapshot_print.py --print-profile cornell   # strip another site's furniture
+#
+# In snapshot mode full.py saves each page as a self-contained MHTML file
+# under merck_data/snapshots and lists it in merck_data/snapshot_index.json,
+# so the crawl never waits for printing. This script prints the snapshots
+# from local files with browsers that cannot resolve any host, so a re-print
+# with new layout options never touches the site, and appends the printed
+# pages to pdf_index.json as full.py would.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from browser import DEFAULT_PRINT_OPTIONS, chrome_options
+from print_profiles import PRINT_PROFILES, PrintProfile
+from render_service import LocalRenderer, PooledRenderer, RenderError
+from work_queue import DEFAULT_INDEX, append_to_index
+
+SNAPSHOT_INDEX = os.path.join("merck_data", "snapshot_index.json")
+
+
+def snapshot_path_for(pdf_path):
+    """Snapshot of a page next to its PDF directory: pdfs/X.pdf -> snapshots/X.mhtml"""
+    pdf_dir, pdf_name = os.path.split(pdf_path)
+    return os.path.join(
+        os.path.dirname(pdf_dir), "snapshots", os.path.splitext(pdf_name)[0] + ".mhtml"
+    )
+
+
+def offline_chrome_options():
+    """Chrome options with every host name unresolvable, for printing local files"""
+    options = chrome_options()
+    options.add_argument("--host-resolver-rules=MAP * ~NOTFOUND")
+    return options
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_snapshot(renderer, entry, render_options):
+    """Print one snapshot to the entry's pdf_path and return the render result"""
+    snapshot_url = Path(snapshot_path_for(entry["pdf_path"])).resolve().as_uri()
+    return renderer.render(
+        snapshot_url,
+        pdf_path=entry["pdf_path"],
+        wait_timeout=5,
+        **render_options,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print saved page snapshots to PDF")
+    parser.add_argument("--index", default=SNAPSHOT_INDEX, help="Snapshot index written by full.py --snapshot")
+    parser.add_argument("--pdf-index", default=DEFAULT_INDEX, help="PDF index to append printed pages to")
+    parser.add_argument("--browsers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument(
+        "--print-options",
+        type=json.loads,
+        default={},
+        help="JSON Page.printToPDF parameters merged over the defaults and the profile's",
+    )
+    parser.add_argument(
+        "--print-profile",
+        choices=list(PRINT_PROFILES),
+        default="merck",
+        help="Page furniture to strip before printing, as in full.py --print-profile",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Re-print snapshots that already have a PDF"
+    )
+    args = parser.parse_args()
+
+    printed_urls = {entry["url"] for entry in load_json(args.pdf_index)}
+    pending = []
+    missing = 0
+    for entry in load_json(args.index):
+        if not os.path.exists(snapshot_path_for(entry["pdf_path"])):
+            missing += 1
+        elif args.force or entry["url"] not in printed_urls or not os.path.exists(entry["pdf_path"]):
+            pending.append(entry)
+
+    print(f"Printing {len(pending)} snapshots with {args.browsers} browsers ({missing} missing)")
+    if not pending:
+        return
+
+    profile = PrintProfile(
+        args.print_profile, os.path.join(os.path.dirname(pending[0]["pdf_path"]), "print_stats.jsonl")
+    )
+    render_options = profile.render_options(DEFAULT_PRINT_OPTIONS)
+    render_options["print_options"].update(args.print_options)
+    browsers = min(args.browsers, len(pending))
+    options = offline_chrome_options()
+    renderer = PooledRenderer(browsers, options) if browsers > 1 else LocalRenderer(options)
+    started = time.monotonic()
+    printed = 0
+    failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=browsers) as executor:
+            futures = {
+                executor.submit(print_snapshot, renderer, entry, render_options): entry
+                for entry in pending
+            }
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    result = future.result()
+                except RenderError as e:
+                    failed += 1
+                    print(f"✗ {entry['title']}: {e}")
+                    continue
+                printed += 1
+                profile.record(result)
+                append_to_index(args.pdf_index, entry)
+                print(f"[{printed + failed}/{len(pending)}] {entry['pdf_path']}")
+    finally:
+        renderer.close()
+
+    elapsed = time.monotonic() - started
+    print(f"\n=== Summary ===")
+    print(f"Printed: {printed}, failed: {failed}")
+    print(f"{60 * printed / max(elapsed, 1):.1f} PDFs/min over {elapsed:.0f}s")
+    print(f"Print profile {profile.summary()}")
+
+
+if __name__ == "__main__":
+    main()
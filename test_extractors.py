@@ -0,0 +1,34 @@
+# test_extractors.py - Checks that every parser backend extracts the same titles
+#
+#   python -m pytest test_extractors.py
+
+import pytest
+
+from extractors import available_backends, extract_in_depth_links, parse_html
+
+SECTION_URL = "https://www.merckvetmanual.com/circulatory-system"
+SUBSECTION_URL = f"{SECTION_URL}/heartworm-disease"
+ARTICLE_URL = f"{SUBSECTION_URL}/heartworm-disease-in-dogs"
+
+INLINE_MARKUP_PAGE = f"""
+<html><body><ul>
+  <li><a href="{ARTICLE_URL}">Overview of <i>Dirofilaria</i> immitis infection</a></li>
+  <li><a href="{ARTICLE_URL}#treatment">  Treatment
+      and <b>Control</b></a></li>
+</ul></body></html>
+"""
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_inline_markup_keeps_spaces(backend):
+    links = extract_in_depth_links(INLINE_MARKUP_PAGE, SECTION_URL, SUBSECTION_URL, backend)
+    assert [link["title"] for link in links] == [
+        "Overview of Dirofilaria immitis infection",
+        "Treatment and Control",
+    ]
+
+
+@pytest.mark.parametrize("backend", available_backends())
+def test_text_of_nested_elements(backend):
+    doc = parse_html("<div><h3>Heart <em>and</em>\n Blood</h3><p>Vessels</p></div>", backend)
+    assert doc.select("div")[0].text() == "Heart and Blood Vessels"
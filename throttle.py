@@ -0,0 +1,371 @@
+import fcntl
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import deque
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+# Responses that mean the site wants us to slow down
+BACKOFF_STATUS_CODES = {429, 500, 502, 503, 504, 522, 524}
+
+# Requests per second and burst size per host unless HOST_RATE_LIMITS says
+# otherwise, e.g. HOST_RATE_LIMITS="www.merckvetmanual.com=0.5,www.vet.cornell.edu=2/4"
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 2
+DEFAULT_RATE_LIMIT_DIR = os.path.join("~", ".cache", "merck-scraper", "ratelimit")
+
+
+def fetch_crawl_delay(base_url, user_agent="*", timeout=10):
+    """Return the robots.txt Crawl-delay for user_agent in seconds, or None"""
+    robots_url = urljoin(base_url, "/robots.txt")
+    try:
+        request = urllib.request.Request(robots_url, headers={"User-Agent": user_agent})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            lines = response.read().decode("utf-8", errors="replace").splitlines()
+    except Exception as e:
+        print(f"Could not read {robots_url}: {e}")
+        return None
+
+    parser = RobotFileParser()
+    parser.parse(lines)
+    delay = parser.crawl_delay(user_agent)
+    return float(delay) if delay is not None else None
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease control of concurrency and
+    request delay, shared by the spider and the Selenium scripts.
+
+    Every response is recorded with its latency. Once a full window of
+    responses is healthy (mean latency under target, error rate at most the
+    threshold) concurrency grows by one and the delay shrinks by one step.
+    A 429/5xx or a timeout halves concurrency and doubles the delay straight
+    away, and so does a window whose mean latency is over target. The delay
+    never drops below the robots.txt crawl-delay.
+    """
+
+    def __init__(
+        self,
+        start_concurrency=1,
+        min_concurrency=1,
+        max_concurrency=8,
+        start_delay=1.0,
+        min_delay=0.0,
+        max_delay=30.0,
+        delay_step=0.25,
+        target_latency=8.0,
+        max_error_rate=0.1,
+        window=10,
+        backoff_factor=0.5,
+    ):
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.concurrency = min(max(start_concurrency, min_concurrency), max_concurrency)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.delay = min(max(start_delay, min_delay), max_delay)
+        self.delay_step = delay_step
+        self.target_latency = target_latency
+        self.max_error_rate = max_error_rate
+        self.backoff_factor = backoff_factor
+        self.crawl_delay = None
+        self.samples = deque(maxlen=window)
+        self.increases = 0
+        self.backoffs = 0
+        self.last_request = 0.0
+        self.lock = threading.Lock()
+        # Shared TokenBucket for the host, if the machine-wide limit is used
+        self.bucket = None
+        # CircuitBreaker that pauses requests while the host is failing
+        self.breaker = None
+
+    def set_crawl_delay(self, seconds):
+        """Honor a robots.txt Crawl-delay as the lower bound of the delay"""
+        with self.lock:
+            self.crawl_delay = seconds
+            self.delay = max(self.delay, self.delay_floor())
+
+    def delay_floor(self):
+        return max(self.min_delay, self.crawl_delay or 0.0)
+
+    def record(self, latency, status=None, error=False):
+        """
+        Record one finished request. error is True for timeouts and crashes;
+        status is the HTTP status code when one is known.
+        """
+        failed = error or status in BACKOFF_STATUS_CODES
+        if self.breaker:
+            self.breaker.record(failed)
+        with self.lock:
+            self.samples.append((latency, failed))
+            if failed:
+                self.back_off()
+                return
+
+            if len(self.samples) < self.samples.maxlen:
+                return
+
+            mean_latency = sum(latency for latency, _ in self.samples) / len(self.samples)
+            error_rate = sum(1 for _, bad in self.samples if bad) / len(self.samples)
+            if mean_latency > self.target_latency:
+                self.back_off()
+                self.samples.clear()
+            elif error_rate <= self.max_error_rate:
+                self.increase()
+                self.samples.clear()
+
+    def increase(self):
+        self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+        self.delay = max(self.delay - self.delay_step, self.delay_floor())
+        self.increases += 1
+
+    def back_off(self):
+        self.concurrency = max(
+            int(self.concurrency * self.backoff_factor), self.min_concurrency
+        )
+        self.delay = min(max(self.delay * 2, self.delay_step), self.max_delay)
+        self.delay = max(self.delay, self.delay_floor())
+        self.backoffs += 1
+
+    def wait(self):
+        """
+        Sleep until the current delay has passed since the previous request,
+        after waiting out an open circuit breaker and taking a token from the
+        host's shared bucket
+        """
+        if self.breaker:
+            self.breaker.wait()
+        if self.bucket:
+            self.bucket.acquire()
+        with self.lock:
+            now = time.monotonic()
+            wait_time = max(0.0, self.last_request + self.delay - now)
+            self.last_request = now + wait_time
+        if wait_time:
+            time.sleep(wait_time)
+
+    def state(self):
+        with self.lock:
+            state = {
+                "concurrency": self.concurrency,
+                "delay": round(self.delay, 3),
+                "crawl_delay": self.crawl_delay,
+                "increases": self.increases,
+                "backoffs": self.backoffs,
+            }
+        if self.bucket:
+            state["rate_limit_wait"] = round(self.bucket.waited, 1)
+        if self.breaker:
+            state.update(self.breaker.state())
+        return state
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host while it is failing. When at least half of the
+    recent requests (and min_samples of them) failed, the breaker opens and
+    every wait() sleeps until the cooldown is over. Then one request goes
+    through as a probe while the other waiters stay paused: a success closes
+    the breaker, a failure opens it again with twice the cooldown. A probe
+    that reports nothing within a cooldown is handed to the next waiter. A
+    site outage thus costs a few paused minutes instead of a timeout for
+    every remaining page.
+    """
+
+    def __init__(
+        self,
+        host="",
+        window=20,
+        min_samples=6,
+        error_threshold=0.5,
+        cooldown=60.0,
+        max_cooldown=900.0,
+    ):
+        self.host = host
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.error_threshold = error_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.status = "closed"
+        self.open_until = 0.0
+        self.opens = 0
+        self.paused = 0.0
+        # monotonic start of the half-open probe in flight, or None
+        self.probe_started = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def record(self, failed):
+        with self.lock:
+            if self.status == "half_open":
+                self.probe_started = None
+                self.changed.notify_all()
+                if failed:
+                    self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                    self.trip()
+                else:
+                    print(f"Circuit for {self.host} closed, resuming")
+                    self.status = "closed"
+                    self.cooldown = self.base_cooldown
+                    self.samples.clear()
+                return
+
+            self.samples.append(failed)
+            if (
+                self.status == "closed"
+                and len(self.samples) >= self.min_samples
+                and sum(self.samples) / len(self.samples) >= self.error_threshold
+            ):
+                self.trip()
+
+    def trip(self):
+        self.status = "open"
+        self.open_until = time.monotonic() + self.cooldown
+        self.opens += 1
+        self.samples.clear()
+        print(
+            f"Circuit for {self.host} open: too many failures, "
+            f"pausing requests for {self.cooldown:.0f}s"
+        )
+
+    def wait(self):
+        """
+        Sleep while the breaker is open, or half open with a probe in flight;
+        returns the seconds paused
+        """
+        started = time.monotonic()
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                if self.status == "open":
+                    if now < self.open_until:
+                        self.changed.wait(self.open_until - now)
+                        continue
+                    self.status = "half_open"
+                if self.status == "half_open":
+                    if self.probe_started is None or now - self.probe_started > self.cooldown:
+                        # This request is the probe
+                        self.probe_started = now
+                        break
+                    self.changed.wait(self.probe_started + self.cooldown - now)
+                    continue
+                break
+            pause = time.monotonic() - started
+            self.paused += pause
+        return pause
+
+    def state(self):
+        with self.lock:
+            return {
+                "circuit": self.status,
+                "circuit_opens": self.opens,
+                "circuit_paused": round(self.paused, 1),
+            }
+
+
+class TokenBucket:
+    """
+    Token bucket for one host, shared by every process on the machine. The
+    bucket lives in a small JSON file that is only read and updated under an
+    exclusive flock, so crawlers, Selenium scripts and render workers all
+    draw from the same budget of `rate` requests per second.
+    """
+
+    def __init__(self, host, rate=DEFAULT_RATE, burst=DEFAULT_BURST, state_dir=None):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1, burst)
+        state_dir = state_dir or os.environ.get("RATE_LIMIT_DIR", DEFAULT_RATE_LIMIT_DIR)
+        state_dir = Path(os.path.expanduser(state_dir))
+        state_dir.mkdir(parents=True, exist_ok=True)
+        self.path = state_dir / f"{host}.bucket"
+        self.waited = 0.0
+        self.acquired = 0
+
+    def try_acquire(self):
+        """Take a token if one is available; otherwise return seconds until one is"""
+        with open(self.path, "a+", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    state = {}
+                now = time.time()
+                tokens = state.get("tokens", self.burst)
+                updated = state.get("updated", now)
+                tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+
+                wait_time = 0.0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait_time = (1 - tokens) / self.rate
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({"tokens": tokens, "updated": now, "rate": self.rate}))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait_time
+
+    def acquire(self):
+        """Block until a token is taken; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            wait_time = self.try_acquire()
+            if not wait_time:
+                break
+            time.sleep(wait_time)
+            waited += wait_time
+        self.waited += waited
+        self.acquired += 1
+        return waited
+
+
+def configured_rate(host):
+    """(rate, burst) for a host from HOST_RATE_LIMITS, or the defaults"""
+    for item in os.environ.get("HOST_RATE_LIMITS", "").split(","):
+        name, _, value = item.strip().partition("=")
+        if name == host and value:
+            rate, _, burst = value.partition("/")
+            return float(rate), int(burst) if burst else DEFAULT_BURST
+    return DEFAULT_RATE, DEFAULT_BURST
+
+
+def host_bucket(url, crawl_delay=None):
+    """
+    The shared TokenBucket for the host of url. A robots.txt Crawl-delay caps
+    the rate at one request per delay, without bursts.
+    """
+    host = urlparse(url).netloc
+    rate, burst = configured_rate(host)
+    if crawl_delay:
+        rate = min(rate, 1.0 / crawl_delay)
+        burst = 1
+    return TokenBucket(host, rate, burst)
+
+
+def host_throttle(base_url, **controller_settings):
+    """
+    AimdController for a host that honors its robots.txt Crawl-delay, draws
+    from the machine-wide token bucket for the host and pauses while the
+    host's circuit breaker is open
+    """
+    throttle = AimdController(**controller_settings)
+    crawl_delay = fetch_crawl_delay(base_url)
+    if crawl_delay:
+        print(f"Honoring robots.txt Crawl-delay of {crawl_delay}s for {urlparse(base_url).netloc}")
+        throttle.set_crawl_delay(crawl_delay)
+    throttle.bucket = host_bucket(base_url, crawl_delay)
+    throttle.breaker = CircuitBreaker(urlparse(base_url).netloc)
+    return throttle
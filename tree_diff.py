@@ -0,0 +1,399 @@
+# tree_diff.py - Structured diff between two crawl snapshots of the Merck tree
+#
+#   python tree_diff.py diff old/merck_manual_final.json merck/merck_manual_final.json
+#   python tree_diff.py diff OLD NEW --output merck_data/tree_delta.jsonl
+#   python tree_diff.py apply OLD merck_data/tree_delta.jsonl --output rebuilt.json
+#
+# Both snapshots are section trees (merck_manual_final.json or
+# merck_complete_data.json): sections with subsections with in-depth links.
+# They are read one section at a time and reduced to a compact index of
+# nodes keyed by canonical URL (in-depth links keep their #fragment), so the
+# trees themselves are never held in memory. The delta lists the sections,
+# subsections and in-depth links that were added, removed (with their
+# subtree), moved (to another parent, or out of order among their siblings),
+# retitled, or given a new URL (same title under the same parent), one JSON
+# object per line after a header line. `apply` replays a delta on the old
+# snapshot and reproduces the new one, so consumers can follow the site
+# without re-ingesting the whole tree.
+
+import argparse
+import bisect
+import json
+import os
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from url_canon import canonicalize_url
+
+LEVELS = ("section", "subsection", "in_depth")
+CHILDREN = {"section": "subsections", "subsection": "in_depth_links"}
+CHILD_LEVEL = {"section": "subsection", "subsection": "in_depth"}
+
+DELTA_FORMAT = 1
+OPS = ("url_changed", "retitled", "added", "moved", "removed")
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the items of a file holding a JSON array one at a time"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not hold a JSON array")
+        buffer = buffer[1:]
+        exhausted = False
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                if not buffer:
+                    raise json.JSONDecodeError("Need more data", buffer, 0)
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+                # Grow the read with the buffer so a large item is decoded a
+                # bounded number of times
+                chunk = f.read(max(chunk_size, len(buffer)))
+                exhausted = not chunk
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def node_key(url):
+    """Canonical URL of a node; in-depth links are anchors, so the fragment is kept"""
+    fragment = urlsplit(url.strip()).fragment
+    key = canonicalize_url(url)
+    return f"{key}#{fragment}" if fragment else key
+
+
+def walk_tree(path):
+    """
+    (key, level, parent key, position, node) for every node of a snapshot, in
+    document order. A URL repeated at one level (the same in-depth link under
+    two subsections) gets "~2", "~3" ... appended to its later keys.
+    """
+    occurrences = Counter()
+
+    def unique_key(level, url):
+        key = node_key(url)
+        occurrences[level, key] += 1
+        count = occurrences[level, key]
+        return key if count == 1 else f"{key}~{count}"
+
+    def walk(node, level, parent, position):
+        key = unique_key(level, node["url"])
+        yield key, level, parent, position, node
+        if level in CHILDREN:
+            for child_position, child in enumerate(node.get(CHILDREN[level]) or []):
+                yield from walk(child, CHILD_LEVEL[level], key, child_position)
+
+    for position, section in enumerate(iter_json_array(path)):
+        yield from walk(section, "section", None, position)
+
+
+def node_fields(node, level):
+    """A node without its children"""
+    return {k: v for k, v in node.items() if k != CHILDREN.get(level)}
+
+
+def index_tree(path, keep_fields=None):
+    """
+    Compact index of a snapshot: key -> (level, title, parent key, position,
+    url). The node's own fields are kept in the returned fields dict only for
+    keys keep_fields() accepts.
+    """
+    index = {}
+    fields = {}
+    for key, level, parent, position, node in walk_tree(path):
+        index[key] = (level, node.get("title") or "", parent, position, node["url"])
+        if keep_fields and keep_fields(key):
+            fields[key] = node_fields(node, level)
+    return index, fields
+
+
+def diff_trees(old_path, new_path):
+    """The changes from one snapshot to the other, as a list of delta ops"""
+    old, _ = index_tree(old_path)
+    new, new_fields = index_tree(new_path, keep_fields=lambda key: key not in old)
+
+    removed = [key for key in old if key not in new]
+    added = [key for key in new if key not in old]
+
+    # A removed and an added node with the same title under the same parent
+    # are one node whose URL changed; pairs are only made when the match is
+    # unique, level by level so a parent's new URL is followed by its children
+    renamed = {}
+    for level in LEVELS:
+        removed_by_place = defaultdict(list)
+        for key in removed:
+            key_level, title, parent, *_ = old[key]
+            if key_level == level:
+                removed_by_place[renamed.get(parent, parent), title].append(key)
+        added_by_place = defaultdict(list)
+        for key in added:
+            key_level, title, parent, *_ = new[key]
+            if key_level == level:
+                added_by_place[parent, title].append(key)
+        for place, old_keys in removed_by_place.items():
+            new_keys = added_by_place.get(place, [])
+            if len(old_keys) == 1 and len(new_keys) == 1:
+                renamed[old_keys[0]] = new_keys[0]
+
+    ops = []
+    for old_key, new_key in renamed.items():
+        ops.append(
+            {
+                "op": "url_changed",
+                "level": new[new_key][0],
+                "key": old_key,
+                "to": new_key,
+                "url": new[new_key][4],
+            }
+        )
+
+    # Nodes present in both snapshots, including those whose URL changed;
+    # parents are compared after following URL changes
+    moved = []
+    stayed = defaultdict(list)
+    for old_key, (level, title, parent, position, *_) in old.items():
+        new_key = renamed.get(old_key, old_key)
+        if new_key not in new:
+            continue
+        _, new_title, new_parent, new_position, *_ = new[new_key]
+        if new_title != title:
+            ops.append({"op": "retitled", "level": level, "key": new_key, "title": new_title})
+        parent = renamed.get(parent, parent)
+        if parent != new_parent:
+            moved.append((new_key, parent))
+        else:
+            stayed[level, parent].append((new_position, position, new_key))
+
+    # Among the children that kept their parent, the longest run still in
+    # their old order stays put and the rest moved within the parent
+    for (_, parent), children in stayed.items():
+        children.sort()
+        in_order = longest_increasing([position for _, position, _ in children])
+        moved.extend((key, parent) for i, (*_, key) in enumerate(children) if i not in in_order)
+
+    for key, parent in moved:
+        level, _, new_parent, new_position, *_ = new[key]
+        ops.append(
+            {
+                "op": "moved",
+                "level": level,
+                "key": key,
+                "from": parent,
+                "to": new_parent,
+                "position": new_position,
+            }
+        )
+
+    renamed_to = set(renamed.values())
+    for key in added:
+        if key in renamed_to:
+            continue
+        level, _, parent, position, *_ = new[key]
+        ops.append(
+            {
+                "op": "added",
+                "level": level,
+                "key": key,
+                "parent": parent,
+                "position": position,
+                "node": new_fields[key],
+            }
+        )
+
+    # A removed node takes its subtree with it
+    gone = {key for key in removed if key not in renamed}
+    for key in removed:
+        if key in gone and old[key][2] not in gone:
+            ops.append({"op": "removed", "level": old[key][0], "key": key, "title": old[key][1]})
+
+    ops.sort(key=apply_order)
+    return ops
+
+
+def longest_increasing(values):
+    """Indices of a longest strictly increasing subsequence of values"""
+    tails = []
+    tail_indices = []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        j = bisect.bisect_left(tails, value)
+        if j == len(tails):
+            tails.append(value)
+            tail_indices.append(i)
+        else:
+            tails[j] = value
+            tail_indices[j] = i
+        previous[i] = tail_indices[j - 1] if j else None
+    indices = set()
+    i = tail_indices[-1] if tail_indices else None
+    while i is not None:
+        indices.add(i)
+        i = previous[i]
+    return indices
+
+
+def apply_order(op):
+    """
+    Sort key that makes a delta replayable: URL changes and retitles, then
+    removals, then additions and moves level by level in
+    the order of their new positions, so each lands at its final index
+    """
+    if op["op"] in ("added", "moved"):
+        return (2, LEVELS.index(op["level"]), op["position"])
+    if op["op"] == "removed":
+        return (1, 0, 0)
+    return (0, 0, 0)
+
+
+def count_ops(ops):
+    counts = Counter(op["op"] for op in ops)
+    return {op: counts[op] for op in OPS}
+
+
+def write_delta(path, old_path, new_path, ops):
+    """A header line and one op per line, written atomically"""
+    header = {
+        "format": DELTA_FORMAT,
+        "from": old_path,
+        "to": new_path,
+        "counts": count_ops(ops),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for line in [header, *ops]:
+            f.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+
+def read_delta(path):
+    """(header, ops) of a delta file"""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("format") != DELTA_FORMAT:
+        raise ValueError(f"{path} is not a tree delta (format {DELTA_FORMAT})")
+    return lines[0], lines[1:]
+
+
+def apply_delta(tree, ops):
+    """Apply delta ops to a loaded section tree in place and return it"""
+    nodes = {}
+    parents = {}
+    occurrences = Counter()
+    for section in tree:
+        stack = [(section, "section", None)]
+        while stack:
+            node, level, parent = stack.pop()
+            key = node_key(node["url"])
+            occurrences[level, key] += 1
+            if occurrences[level, key] > 1:
+                key = f"{key}~{occurrences[level, key]}"
+            nodes[key] = (node, level)
+            parents[key] = parent
+            if level in CHILDREN:
+                # Reversed so keys are numbered in document order, as in walk_tree()
+                children = node.get(CHILDREN[level]) or []
+                stack.extend((child, CHILD_LEVEL[level], key) for child in reversed(children))
+
+    def siblings(parent):
+        if parent is None:
+            return tree
+        parent_node, parent_level = nodes[parent]
+        return parent_node.setdefault(CHILDREN[parent_level], [])
+
+    def detach(key):
+        siblings(parents[key]).remove(nodes[key][0])
+
+    def attach(key, parent, position):
+        siblings(parent).insert(min(position, len(siblings(parent))), nodes[key][0])
+        parents[key] = parent
+
+    # Moved nodes are all taken out before any is put back, so the positions
+    # they are inserted at count only the nodes that end up before them
+    for op in ops:
+        key = op["key"]
+        if op["op"] == "added":
+            continue
+        if key not in nodes:
+            print(f"Skipping {op['op']} of {key}: not in the tree")
+        elif op["op"] == "removed":
+            # The node stays known: a child moved out of it is detached later
+            detach(key)
+        elif op["op"] == "url_changed":
+            node, level = nodes.pop(key)
+            node["url"] = op["url"]
+            nodes[op["to"]] = (node, level)
+            parents[op["to"]] = parents.pop(key)
+            for child, parent in parents.items():
+                if parent == key:
+                    parents[child] = op["to"]
+        elif op["op"] == "retitled":
+            nodes[key][0]["title"] = op["title"]
+        elif op["op"] == "moved":
+            detach(key)
+
+    for op in ops:
+        key = op["key"]
+        if op["op"] == "added":
+            node = dict(op["node"])
+            if op["level"] in CHILDREN:
+                node[CHILDREN[op["level"]]] = []
+            nodes[key] = (node, op["level"])
+            attach(key, op["parent"], op["position"])
+        elif op["op"] == "moved" and key in nodes:
+            attach(key, op["to"], op["position"])
+    return tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two crawl snapshots of the section tree")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    diff = commands.add_parser("diff", help="Write the changes between two snapshots")
+    diff.add_argument("old", help="Earlier snapshot, e.g. a saved merck_manual_final.json")
+    diff.add_argument("new", help="Later snapshot")
+    diff.add_argument("--output", help="Delta file to write (default: only print the counts)")
+    diff.add_argument("--show", type=int, default=20, help="Changes to print")
+
+    apply = commands.add_parser("apply", help="Apply a delta to a snapshot")
+    apply.add_argument("tree", help="Snapshot the delta was made from")
+    apply.add_argument("delta", help="Delta file written by `diff`")
+    apply.add_argument("--output", required=True, help="Where to write the updated snapshot")
+    args = parser.parse_args()
+
+    if args.command == "diff":
+        ops = diff_trees(args.old, args.new)
+        counts = count_ops(ops)
+        print(", ".join(f"{op.replace('_', ' ')} {count}" for op, count in counts.items()))
+        for op in ops[: args.show]:
+            detail = op.get("title") or op.get("url") or op.get("to") or op["node"].get("title")
+            print(f"  {op['op']:<11} {op['level']:<10} {op['key']} -> {detail}")
+        if len(ops) > args.show:
+            print(f"  ... {len(ops) - args.show} more")
+        if args.output:
+            write_delta(args.output, args.old, args.new, ops)
+            print(f"Delta saved to: {os.path.abspath(args.output)}")
+    else:
+        header, ops = read_delta(args.delta)
+        with open(args.tree, "r", encoding="utf-8") as f:
+            tree = json.load(f)
+        apply_delta(tree, ops)
+        tmp_path = args.output + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(tree, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, args.output)
+        print(f"Applied {len(ops)} changes ({header['from']} -> {header['to']})")
+        print(f"Snapshot saved to: {os.path.abspath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# url_canon.py - Canonical URLs and a memory-bounded seen-URL set
+#
+# canonicalize_url() maps the spellings of one page (host case, default port,
+# trailing slash, query order, tracking parameters, fragment) to one key.
+# SeenSet stores those keys exactly until a threshold, then switches to a
+# scalable Bloom filter whose false-positive rate stays within a budget and
+# is measured while it runs.
+#
+#   python url_canon.py --urls 2000000 --fp-rate 0.001    # measure memory and FP rate
+
+import argparse
+import hashlib
+import math
+import time
+import tracemalloc
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl", "ref"}
+TRACKING_PREFIXES = ("utm_",)
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url):
+    """
+    Canonical form of an absolute URL: lower-case scheme and host, no default
+    port, no fragment, no trailing slash (except the root), tracking
+    parameters removed and the remaining query parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def url_hashes(key):
+    """Two independent 64-bit hashes of a key, for double hashing"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little")
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter sized for `capacity` keys at `fp_rate`"""
+
+    def __init__(self, capacity, fp_rate):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.bits = max(8, int(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, hashes):
+        first, second = hashes
+        return [(first + i * second) % self.bits for i in range(self.hash_count)]
+
+    def contains(self, hashes):
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in self.positions(hashes))
+
+    def add(self, hashes):
+        for p in self.positions(hashes):
+            self.array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def expected_fp_rate(self):
+        return (1 - math.exp(-self.hash_count * self.count / self.bits)) ** self.hash_count
+
+
+class SeenSet:
+    """
+    Set of canonical URLs with bounded memory. Up to `threshold` URLs are
+    kept exactly; past that they move into Bloom filters that each hold
+    `capacity` URLs. Every new filter is twice as large with half the error,
+    so the combined false-positive rate stays under `fp_rate` however many
+    URLs arrive.
+
+    To measure the real false-positive rate, 1 in `sample_every` URLs (chosen
+    by hash) is also kept exactly. A sampled URL that the filters claim to
+    have seen but the sample has not is a false positive.
+
+    Items are stored as `key(item)`, canonicalize_url by default; pass
+    key=None to store other strings (such as file paths) as they are.
+    """
+
+    def __init__(
+        self,
+        threshold=100_000,
+        fp_rate=0.001,
+        capacity=1_000_000,
+        sample_every=64,
+        key=canonicalize_url,
+    ):
+        self.key = key or (lambda item: item)
+        self.threshold = threshold
+        self.fp_rate = fp_rate
+        self.capacity = capacity
+        self.sample_every = sample_every
+        self.exact = set()
+        self.filters = []
+        self.sample = set()
+        self.sample_checks = 0
+        self.false_positives = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        key = self.key(url)
+        if self.filters:
+            return any(f.contains(url_hashes(key)) for f in self.filters)
+        return key in self.exact
+
+    def add(self, url):
+        """Add a URL; returns False when it (probably) was already in the set"""
+        key = self.key(url)
+        if not self.filters:
+            if key in self.exact:
+                return False
+            self.exact.add(key)
+            self.count += 1
+            if len(self.exact) > self.threshold:
+                self.switch_to_bloom()
+            return True
+
+        hashes = url_hashes(key)
+        sampled = hashes[0] % self.sample_every == 0
+        if any(f.contains(hashes) for f in self.filters):
+            if sampled:
+                self.sample_checks += 1
+                if key not in self.sample:
+                    self.false_positives += 1
+            return False
+        if sampled:
+            self.sample_checks += 1
+            self.sample.add(key)
+        self.filter_for_new_key().add(hashes)
+        self.count += 1
+        return True
+
+    def filter_for_new_key(self):
+        last = self.filters[-1]
+        if last.count >= last.capacity:
+            last = BloomFilter(last.capacity * 2, last.fp_rate / 2)
+            self.filters.append(last)
+        return last
+
+    def switch_to_bloom(self):
+        # The first filter gets half the budget; the series 1/2 + 1/4 + ...
+        # keeps the total under fp_rate
+        self.filters.append(BloomFilter(max(self.capacity, len(self.exact) * 2), self.fp_rate / 2))
+        for key in self.exact:
+            hashes = url_hashes(key)
+            if hashes[0] % self.sample_every == 0:
+                self.sample.add(key)
+            self.filter_for_new_key().add(hashes)
+        self.exact = set()
+
+    def memory_bytes(self):
+        """Approximate bytes held by the filters or the exact set"""
+        if self.filters:
+            return sum(len(f.array) for f in self.filters) + 100 * len(self.sample)
+        return 100 * len(self.exact)
+
+    def stats(self):
+        stats = {
+            "urls": self.count,
+            "mode": "bloom" if self.filters else "exact",
+            "memory_mb": round(self.memory_bytes() / 1e6, 2),
+        }
+        if self.filters:
+            stats["filters"] = len(self.filters)
+            stats["fp_budget"] = self.fp_rate
+            stats["fp_expected"] = round(1 - math.prod(1 - f.expected_fp_rate() for f in self.filters), 6)
+            if self.sample_checks:
+                stats["fp_measured"] = round(self.false_positives / self.sample_checks, 6)
+        return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure SeenSet memory and false positives")
+    parser.add_argument("--urls", type=int, default=1_000_000)
+    parser.add_argument("--threshold", type=int, default=100_000)
+    parser.add_argument("--fp-rate", type=float, default=0.001)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    seen = SeenSet(threshold=args.threshold, fp_rate=args.fp_rate)
+    started = time.perf_counter()
+    for i in range(args.urls):
+        seen.add(f"https://www.merckvetmanual.com/section-{i % 97}/page-{i}?utm_source=x")
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # URLs never added: every "seen" answer is a false positive
+    probes = min(args.urls, 200_000)
+    false_positives = sum(
+        f"https://www.merckvetmanual.com/other/page-{i}" in seen for i in range(probes)
+    )
+    print(f"Added {args.urls} URLs in {elapsed:.1f}s ({args.urls / elapsed:,.0f}/s)")
+    print(f"Peak traced memory: {peak / 1e6:.1f} MB")
+    print(f"Stats: {seen.stats()}")
+    print(f"Probe false-positive rate: {false_positives / probes:.6f} (budget {args.fp_rate})")
+
+
+if __name__ == "__main__":
+    main()
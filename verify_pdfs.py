@@ -0,0 +1,219 @@
+# verify_pdfs.py - Check every saved PDF and reconcile it with its index
+#
+#   python verify_pdfs.py                          # Merck, canine and feline
+#   python verify_pdfs.py --sites merck --workers 8
+#   python verify_pdfs.py --requeue                # send bad PDFs back for rendering
+#
+# Each PDF is read through a memory map in a process pool and checked for the
+# %PDF- header, the %%EOF trailer, its pages, size and SHA-256. The results
+# are reconciled with the site's index (pdf_index.json or processing_log.json):
+# entries whose file is missing, truncated or no longer matches the recorded
+# size and hash, and PDFs on disk that no entry points to (orphans). With
+# --requeue the bad entries are handed back for rendering: Merck entries are
+# dropped from pdf_index.json (so full.py renders them again) and re-queued in
+# the render queue when there is one; Cornell entries are marked as errors in
+# processing_log.json, which canine.py and feline.py retry.
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cornell_export import MIN_PDF_BYTES
+from print_profiles import count_pages
+from work_queue import DEFAULT_DB, WorkQueue, remove_from_index
+
+# PDF directory and index of each site
+SITES = {
+    "merck": (os.path.join("merck_data", "pdfs"), os.path.join("merck_data", "pdf_index.json")),
+    "canine": ("canine_health_pdfs", os.path.join("canine_health_pdfs", "processing_log.json")),
+    "feline": ("feline_health_pdfs", os.path.join("feline_health_pdfs", "processing_log.json")),
+}
+
+# The header may follow a little junk and the trailer may be followed by some
+# whitespace, so both are searched near the ends rather than at them
+MARKER_WINDOW = 1024
+
+
+def check_pdf(path):
+    """Size, SHA-256, pages and the problems found in one PDF file"""
+    result = {"path": path, "bytes": 0, "sha256": None, "pages": 0, "problems": []}
+    try:
+        size = os.path.getsize(path)
+        result["bytes"] = size
+        if size == 0:
+            result["problems"].append("empty")
+            return result
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            result["sha256"] = hashlib.sha256(data).hexdigest()
+            if data.find(b"%PDF-", 0, MARKER_WINDOW) < 0:
+                result["problems"].append("no %PDF- header")
+            if data.rfind(b"%%EOF", max(size - MARKER_WINDOW, 0)) < 0:
+                result["problems"].append("no %%EOF trailer (truncated)")
+            result["pages"] = count_pages(data)
+    except OSError as e:
+        result["problems"].append(f"unreadable: {e}")
+        return result
+
+    if size < MIN_PDF_BYTES:
+        result["problems"].append(f"only {size} bytes")
+    if not result["pages"]:
+        result["problems"].append("no pages")
+    return result
+
+
+def check_pdfs(paths, workers=None):
+    """check_pdf() for every path in a process pool, keyed by path"""
+    paths = list(paths)
+    if not paths:
+        return {}
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(check_pdf, paths, chunksize=chunksize)
+        return {result["path"]: result for result in results}
+
+
+def load_index(index_path):
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def pdfs_on_disk(pdf_dir):
+    paths = []
+    for root, _, files in os.walk(pdf_dir):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+    return paths
+
+
+def reconcile(entries, results, disk_paths):
+    """
+    Compare index entries with the checked files. Returns a report of
+    verified, missing, invalid and mismatched entries and orphan files; each
+    bad item is (entry, reason).
+    """
+    report = {"verified": 0, "missing": [], "invalid": [], "mismatch": [], "orphans": []}
+    referenced = set()
+    for entry in entries:
+        if not entry.get("pdf_path"):
+            continue
+        path = os.path.normpath(entry["pdf_path"])
+        referenced.add(path)
+        # Cornell logs also list skipped and failed pages
+        if entry.get("status", "success") != "success":
+            continue
+        result = results.get(path)
+        if result is None:
+            report["missing"].append((entry, "file not found"))
+        elif result["problems"]:
+            report["invalid"].append((entry, ", ".join(result["problems"])))
+        elif entry.get("bytes") is not None and entry["bytes"] != result["bytes"]:
+            report["mismatch"].append((entry, f"{result['bytes']} bytes, index says {entry['bytes']}"))
+        elif entry.get("sha256") and entry["sha256"] != result["sha256"]:
+            report["mismatch"].append((entry, "SHA-256 differs from the index"))
+        else:
+            report["verified"] += 1
+
+    report["orphans"] = sorted(path for path in disk_paths if path not in referenced)
+    return report
+
+
+def bad_entries(report):
+    """(entry, reason) for every entry that needs rendering again"""
+    return [item for key in ("missing", "invalid", "mismatch") for item in report[key]]
+
+
+def requeue_merck(index_path, bad, queue_db=DEFAULT_DB):
+    """Drop bad entries from pdf_index.json and queue them in the render queue if there is one"""
+    removed = remove_from_index(index_path, [entry["url"] for entry, _ in bad])
+    print(f"Removed {len(removed)} entries from {index_path}; full.py will render them again")
+    if os.path.exists(queue_db):
+        jobs = [{k: v for k, v in entry.items() if k != "pdf_path"} for entry in removed]
+        queued = WorkQueue(queue_db, index_path).requeue(jobs)
+        print(f"Re-queued {queued} jobs in {queue_db}")
+
+
+def requeue_cornell(log_path, bad):
+    """Mark bad entries as errors in processing_log.json so the next export retries them"""
+    reasons = {os.path.normpath(entry["pdf_path"]): reason for entry, reason in bad}
+    log = load_index(log_path)
+    for entry in log:
+        path = os.path.normpath(entry.get("pdf_path") or "")
+        if entry.get("status") == "success" and path in reasons:
+            entry["status"] = "error"
+            entry["error"] = f"Failed verification: {reasons[path]}"
+    tmp_path = log_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(log, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, log_path)
+    print(f"Marked {len(reasons)} entries for re-export in {log_path}")
+
+
+def print_report(site, report, limit=10):
+    print(
+        f"\n[{site}] verified {report['verified']}, missing {len(report['missing'])}, "
+        f"invalid {len(report['invalid'])}, mismatched {len(report['mismatch'])}, "
+        f"orphans {len(report['orphans'])}"
+    )
+    for key in ("missing", "invalid", "mismatch"):
+        for entry, reason in report[key][:limit]:
+            print(f"  {key}: {entry['pdf_path']} ({reason})")
+        if len(report[key]) > limit:
+            print(f"  ... {len(report[key]) - limit} more {key}")
+    for path in report["orphans"][:limit]:
+        print(f"  orphan: {path}")
+    if len(report["orphans"]) > limit:
+        print(f"  ... {len(report['orphans']) - limit} more orphans")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify saved PDFs against their indexes")
+    parser.add_argument("--sites", nargs="+", choices=list(SITES), default=list(SITES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Checking processes")
+    parser.add_argument(
+        "--requeue", action="store_true", help="Send missing and broken PDFs back for rendering"
+    )
+    parser.add_argument("--report", help="Also write the full report to this JSON file")
+    args = parser.parse_args()
+
+    full_report = {}
+    for site in args.sites:
+        pdf_dir, index_path = SITES[site]
+        entries = load_index(index_path)
+        disk_paths = [os.path.normpath(path) for path in pdfs_on_disk(pdf_dir)]
+        if not entries and not disk_paths:
+            print(f"\n[{site}] nothing to verify ({index_path} and {pdf_dir} not found)")
+            continue
+
+        results = check_pdfs(disk_paths, args.workers)
+        report = reconcile(entries, results, disk_paths)
+        print_report(site, report)
+        full_report[site] = {"verified": report["verified"]}
+        for key in ("missing", "invalid", "mismatch"):
+            full_report[site][key] = [
+                {"pdf_path": entry["pdf_path"], "url": entry["url"], "reason": reason}
+                for entry, reason in report[key]
+            ]
+        full_report[site]["orphans"] = report["orphans"]
+
+        bad = bad_entries(report)
+        if args.requeue and bad:
+            if site == "merck":
+                requeue_merck(index_path, bad)
+            else:
+                requeue_cornell(index_path, bad)
+
+    if args.report:
+        tmp_path = args.report + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(full_report, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, args.report)
+        print(f"\nReport saved to: {os.path.abspath(args.report)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+# work_queue.py - Lease-based render queue for spreading PDF rendering over machines
+#
+#   python work_queue.py enqueue --from-tree merck/merck_manual_final.json
+#   python work_queue.py serve --port 8766               # on the coordinator
+#   python work_queue.py work --queue http://coordinator:8766 --threads 3
+#   python work_queue.py status
+#
+# Jobs live in SQLite. A worker leases a job for --lease-seconds and keeps the
+# lease alive with heartbeats while it renders; a lease that runs out (crashed
+# or stuck worker) puts the job back in the queue. Finished PDFs are appended
+# to merck_data/pdf_index.json, the same ledger full.py resumes from, so the
+# two never render the same page twice. Workers on the coordinator can use
+# --db instead of --queue. PDFs are written under --output-dir on the worker,
+# which should be shared storage when workers run on several machines.
+
+import argparse
+import fcntl
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+DEFAULT_DB = os.path.join("merck_data", "render_queue.db")
+DEFAULT_INDEX = os.path.join("merck_data", "pdf_index.json")
+DEFAULT_PORT = 8766
+MERCK_BASE_URL = "https://www.merckvetmanual.com"
+
+
+def append_to_index(index_path, entry, replace=False, key=None):
+    """
+    Append one entry to a pdf_index.json ledger, unless its URL (or key(entry))
+    is already there; with replace=True such an entry is replaced instead.
+    The read-modify-write runs under a file lock, so queue workers, full.py
+    and crawl_engine.py never overwrite each other's entries.
+    """
+    key = key or (lambda item: item["url"])
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    with open(index_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = []
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        entry_key = key(entry)
+        position = next((i for i, item in enumerate(index) if key(item) == entry_key), None)
+        if position is None:
+            index.append(entry)
+        elif replace:
+            index[position] = entry
+        else:
+            return False
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+        return True
+
+
+def remove_from_index(index_path, urls):
+    """
+    Drop the entries with these URLs from a pdf_index.json ledger, under the
+    same lock as append_to_index(); returns the removed entries
+    """
+    urls = set(urls)
+    with open(index_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        removed = [entry for entry in index if entry["url"] in urls]
+        if removed:
+            tmp_path = index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    [entry for entry in index if entry["url"] not in urls],
+                    f,
+                    indent=2,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, index_path)
+        return removed
+
+
+class WorkQueue:
+    """
+    SQLite job table. Every state change runs in its own IMMEDIATE
+    transaction, so several processes can share one database file.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB, index_path=DEFAULT_INDEX, max_attempts=3):
+        self.db_path = db_path
+        self.index_path = index_path
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self.transaction() as db:
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT UNIQUE NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    error TEXT,
+                    updated REAL
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+
+    def connection(self):
+        # sqlite3 connections cannot be shared between threads
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self.local.db.execute("PRAGMA journal_mode=WAL")
+        return self.local.db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def enqueue(self, jobs):
+        """Add jobs (dicts with at least url); returns how many were new"""
+        done_urls = set()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                done_urls = {entry["url"] for entry in json.load(f)}
+
+        added = 0
+        now = time.time()
+        with self.transaction() as db:
+            for job in jobs:
+                if job["url"] in done_urls:
+                    continue
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO jobs (url, payload, updated) VALUES (?, ?, ?)",
+                    (job["url"], json.dumps(job, ensure_ascii=False), now),
+                )
+                added += cursor.rowcount
+        return added
+
+    def requeue(self, jobs):
+        """
+        Queue jobs again even if they were done or failed, e.g. when their
+        PDF turned out to be broken; leased jobs are left alone. Returns how
+        many were queued.
+        """
+        queued = 0
+        now = time.time()
+        with self.transaction() as db:
+            for job in jobs:
+                cursor = db.execute(
+                    "INSERT INTO jobs (url, payload, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT (url) DO UPDATE SET state = 'queued', attempts = 0, "
+                    "lease_owner = NULL, error = NULL, payload = excluded.payload, "
+                    "updated = excluded.updated WHERE state != 'leased'",
+                    (job["url"], json.dumps(job, ensure_ascii=False), now),
+                )
+                queued += cursor.rowcount
+        return queued
+
+    def requeue_expired(self, db, now):
+        """
+        Put jobs whose lease ran out back in the queue, or fail them once they
+        used up max_attempts; returns how many were re-queued
+        """
+        db.execute(
+            "UPDATE jobs SET state = 'failed', lease_owner = NULL, updated = ?, "
+            "error = 'Lease expired after ' || attempts || ' attempts' "
+            "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.max_attempts),
+        )
+        return db.execute(
+            "UPDATE jobs SET state = 'queued', lease_owner = NULL, updated = ? "
+            "WHERE state = 'leased' AND lease_expires < ?",
+            (now, now),
+        ).rowcount
+
+    def lease(self, owner, lease_seconds=120):
+        """Lease the oldest queued job to owner; returns (id, payload) or None"""
+        now = time.time()
+        with self.transaction() as db:
+            expired = self.requeue_expired(db, now)
+            if expired:
+                print(f"Re-queued {expired} jobs with expired leases")
+            row = db.execute(
+                "SELECT id, payload FROM jobs WHERE state = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (owner, now + lease_seconds, now, row[0]),
+            )
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, job_id, owner, lease_seconds=120):
+        """Extend a lease; False when it was lost (expired and re-leased)"""
+        now = time.time()
+        with self.transaction() as db:
+            return bool(
+                db.execute(
+                    "UPDATE jobs SET lease_expires = ?, updated = ? "
+                    "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                    (now + lease_seconds, now, job_id, owner),
+                ).rowcount
+            )
+
+    def complete(self, job_id, owner, entry):
+        """
+        Mark a leased job done and append its entry to the index ledger.
+        Returns False when the lease was lost, so nothing is recorded twice.
+        """
+        with self.transaction() as db:
+            updated = db.execute(
+                "UPDATE jobs SET state = 'done', lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (time.time(), job_id, owner),
+            ).rowcount
+            if not updated:
+                return False
+            append_to_index(self.index_path, entry)
+        return True
+
+    def fail(self, job_id, owner, error):
+        """Record a failed attempt; the job is re-queued until max_attempts"""
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT attempts FROM jobs "
+                "WHERE id = ? AND lease_owner = ? AND state = 'leased'",
+                (job_id, owner),
+            ).fetchone()
+            if row is None:
+                return False
+            state = "failed" if row[0] >= self.max_attempts else "queued"
+            db.execute(
+                "UPDATE jobs SET state = ?, lease_owner = NULL, error = ?, updated = ? "
+                "WHERE id = ?",
+                (state, str(error), time.time(), job_id),
+            )
+        return True
+
+    def status(self):
+        with self.transaction() as db:
+            self.requeue_expired(db, time.time())
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+            failures = db.execute(
+                "SELECT url, error FROM jobs WHERE state = 'failed' "
+                "ORDER BY updated DESC LIMIT 10"
+            ).fetchall()
+        return {"counts": counts, "recent_failures": [list(row) for row in failures]}
+
+
+class QueueRequestHandler(BaseHTTPRequestHandler):
+    work_queue = None
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/status":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, self.work_queue.status())
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        queue = self.work_queue
+        try:
+            if self.path == "/lease":
+                leased = queue.lease(body["owner"], body.get("lease_seconds", 120))
+                job = {"id": leased[0], "payload": leased[1]} if leased else None
+                self.send_json(200, {"job": job})
+            elif self.path == "/heartbeat":
+                ok = queue.heartbeat(body["id"], body["owner"], body.get("lease_seconds", 120))
+                self.send_json(200, {"ok": ok})
+            elif self.path == "/complete":
+                ok = queue.complete(body["id"], body["owner"], body["entry"])
+                self.send_json(200, {"ok": ok})
+            elif self.path == "/fail":
+                ok = queue.fail(body["id"], body["owner"], body["error"])
+                self.send_json(200, {"ok": ok})
+            else:
+                self.send_json(404, {"error": "Not found"})
+        except KeyError as e:
+            self.send_json(400, {"error": f"Missing field {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueueClient:
+    """The WorkQueue methods a worker needs, over HTTP to `work_queue.py serve`"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def post(self, path, payload):
+        response = requests.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def lease(self, owner, lease_seconds=120):
+        job = self.post("/lease", {"owner": owner, "lease_seconds": lease_seconds})["job"]
+        return (job["id"], job["payload"]) if job else None
+
+    def heartbeat(self, job_id, owner, lease_seconds=120):
+        return self.post(
+            "/heartbeat", {"id": job_id, "owner": owner, "lease_seconds": lease_seconds}
+        )["ok"]
+
+    def complete(self, job_id, owner, entry):
+        return self.post("/complete", {"id": job_id, "owner": owner, "entry": entry})["ok"]
+
+    def fail(self, job_id, owner, error):
+        return self.post("/fail", {"id": job_id, "owner": owner, "error": error})["ok"]
+
+    def status(self):
+        response = requests.get(f"{self.base_url}/status", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+def jobs_from_tree(tree_path):
+    """
+    Render jobs for every relevant page of a spider section tree
+    (merck_manual_final.json), shaped like full.py's index entries
+    """
+    from full import IGNORED_SECTIONS, is_relevant_title, strip_url_fragment
+
+    with open(tree_path, "r", encoding="utf-8") as f:
+        sections = json.load(f)
+
+    jobs = []
+    for section in sections:
+        if section["title"] in IGNORED_SECTIONS:
+            continue
+        jobs.append(
+            {
+                "title": section["title"],
+                "url": strip_url_fragment(section["url"]),
+                "type": "section",
+            }
+        )
+        for subsection in section.get("subsections", []):
+            if not is_relevant_title(subsection["title"]):
+                continue
+            sub_title = f"{section['title']} - {subsection['title']}"
+            jobs.append(
+                {
+                    "title": subsection["title"],
+                    "full_title": sub_title,
+                    "url": strip_url_fragment(subsection["url"]),
+                    "parent_section": section["title"],
+                    "type": "subsection",
+                }
+            )
+            for link in subsection.get("in_depth_links", []):
+                if not is_relevant_title(link["title"]):
+                    continue
+                jobs.append(
+                    {
+                        "title": link["title"],
+                        "full_title": f"{sub_title} - {link['title']}",
+                        "url": strip_url_fragment(link["url"]),
+                        "original_url": link["url"],
+                        "parent_section": section["title"],
+                        "parent_subsection": subsection["title"],
+                        "type": "in_depth",
+                    }
+                )
+    return jobs
+
+
+def index_entry(job, pdf_path):
+    """The pdf_index.json entry for a rendered job, in full.py's field order"""
+    entry = {}
+    for key in ("title", "full_title", "url", "original_url"):
+        if key in job:
+            entry[key] = job[key]
+    entry["pdf_path"] = pdf_path
+    for key in ("parent_section", "parent_subsection", "type"):
+        if key in job:
+            entry[key] = job[key]
+    return entry
+
+
+class Heartbeat:
+    """Keeps a lease alive from a background thread while a job renders"""
+
+    def __init__(self, queue, job_id, owner, lease_seconds):
+        self.queue = queue
+        self.job_id = job_id
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                if not self.queue.heartbeat(self.job_id, self.owner, self.lease_seconds):
+                    self.lost = True
+                    return
+            except Exception as e:
+                print(f"Heartbeat for job {self.job_id} failed: {e}")
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stopped.set()
+        self.thread.join()
+
+
+def work(queue, owner, renderer, throttle, output_dir, lease_seconds, idle_exit, profile=None):
+    """Lease, render and report jobs until the queue stays empty"""
+    from browser import DEFAULT_PRINT_OPTIONS
+    from full import clean_filename
+    from retry import render_with_retry
+
+    profile_options = profile.render_options(DEFAULT_PRINT_OPTIONS) if profile else {}
+
+    rendered = 0
+    while True:
+        try:
+            leased = queue.lease(owner, lease_seconds)
+        except Exception as e:
+            # The coordinator or database is unavailable; the worker waits
+            print(f"[{owner}] Could not lease a job: {e}")
+            time.sleep(5)
+            continue
+        if leased is None:
+            if idle_exit:
+                return rendered
+            time.sleep(5)
+            continue
+
+        job_id, job = leased
+        title = job.get("full_title") or job["title"]
+        safe_title = clean_filename(title)
+        pdf_path = os.path.join(output_dir, f"{safe_title}.pdf")
+        print(f"[{owner}] Rendering {title}")
+
+        with Heartbeat(queue, job_id, owner, lease_seconds) as heartbeat:
+            try:
+                result = render_with_retry(
+                    renderer,
+                    job.get("original_url") or job["url"],
+                    throttle,
+                    pdf_path=pdf_path,
+                    cookie_consent=True,
+                    settle=2,
+                    error_screenshot=f"error_screenshot_{safe_title}.png",
+                    **profile_options,
+                )
+                if profile:
+                    profile.record(result)
+            except Exception as e:
+                print(f"[{owner}] Failed {title}: {e}")
+                try:
+                    queue.fail(job_id, owner, str(e))
+                except Exception as report_error:
+                    print(f"[{owner}] Could not report the failure: {report_error}")
+                continue
+
+        try:
+            completed = not heartbeat.lost and queue.complete(
+                job_id, owner, index_entry(job, pdf_path)
+            )
+        except Exception as e:
+            # The lease runs out and the job is queued again
+            print(f"[{owner}] Could not report {title} as done: {e}")
+            continue
+        if not completed:
+            print(f"[{owner}] Lease on {title} was lost; another worker owns it now")
+            continue
+        rendered += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lease-based render queue")
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite queue database")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="pdf_index.json ledger")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Add render jobs")
+    source = enqueue.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--from-tree", help="Spider output such as merck/merck_manual_final.json"
+    )
+    source.add_argument("--from-json", help="JSON list of jobs with url and title")
+
+    serve = commands.add_parser("serve", help="Serve the queue to workers on other machines")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+
+    worker = commands.add_parser("work", help="Render leased jobs")
+    worker.add_argument("--queue", help="URL of `work_queue.py serve` (default: use --db)")
+    worker.add_argument("--threads", type=int, default=2)
+    worker.add_argument("--lease-seconds", type=int, default=120)
+    worker.add_argument("--output-dir", default=os.path.join("merck_data", "pdfs"))
+    worker.add_argument(
+        "--keep-running", action="store_true", help="Wait for new jobs instead of exiting"
+    )
+    worker.add_argument(
+        "--print-profile",
+        default="merck",
+        help="Page furniture to strip before printing (see print_profiles.py)",
+    )
+
+    status = commands.add_parser("status", help="Show job counts")
+    status.add_argument("--queue", help="URL of `work_queue.py serve` (default: use --db)")
+    args = parser.parse_args()
+
+    if args.command in ("work", "status") and args.queue:
+        queue = QueueClient(args.queue)
+    else:
+        queue = WorkQueue(args.db, args.index)
+
+    if args.command == "enqueue":
+        if args.from_tree:
+            jobs = jobs_from_tree(args.from_tree)
+        else:
+            with open(args.from_json, "r", encoding="utf-8") as f:
+                jobs = json.load(f)
+        added = queue.enqueue(jobs)
+        print(f"Queued {added} new jobs ({len(jobs) - added} already queued or rendered)")
+
+    elif args.command == "serve":
+        QueueRequestHandler.work_queue = queue
+        server = ThreadingHTTPServer((args.host, args.port), QueueRequestHandler)
+        print(f"Render queue {args.db} listening on http://{args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nShutting down...")
+        finally:
+            server.server_close()
+
+    elif args.command == "work":
+        from browser import chrome_options
+        from print_profiles import PrintProfile
+        from render_service import get_renderer
+        from throttle import host_throttle
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        renderer = get_renderer(chrome_options(), browsers=args.threads)
+        throttle = host_throttle(MERCK_BASE_URL, max_concurrency=args.threads)
+        profile = PrintProfile(args.print_profile)
+        host = socket.gethostname()
+        threads = [
+            threading.Thread(
+                target=work,
+                args=(
+                    queue,
+                    f"{host}-{uuid.uuid4().hex[:8]}",
+                    renderer,
+                    throttle,
+                    args.output_dir,
+                    args.lease_seconds,
+                    not args.keep_running,
+                    profile,
+                ),
+            )
+            for _ in range(args.threads)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            renderer.close()
+        print(f"Print profile {profile.summary()}")
+        print(json.dumps(queue.status(), indent=2))
+
+    else:
+        print(json.dumps(queue.status(), indent=2))
+
+
+if __name__ == "__main__":
+    main()